@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.conf import settings
 
 from geonode.base.models import (TopicCategory, SpatialRepresentationType,
-    Region, RestrictionCodeType, ContactRole, ResourceBase, Link, License, Thumbnail)
+    Region, RestrictionCodeType, ContactRole, ResourceBase, Link, License, Thumbnail, Job)
 
 class LicenseAdmin(admin.ModelAdmin):
     list_display = ('id', 'name')
@@ -78,6 +78,13 @@ class LinkAdmin(admin.ModelAdmin):
     list_filter = ('resource', 'extension', 'link_type', 'mime')
     search_fields = ('name', 'resource__title',)
     
+class JobAdmin(admin.ModelAdmin):
+    model = Job
+    list_display_links = ('id',)
+    list_display = ('id', 'resource', 'job_type', 'status', 'attempts', 'updated')
+    list_filter = ('job_type', 'status')
+    search_fields = ('resource__title',)
+
 class ThumbnailAdmin(admin.ModelAdmin):
     model = Thumbnail
     list_display = ('get_title', 'get_geonode_type', 'thumb_file', 'get_thumb_url',)
@@ -109,3 +116,4 @@ admin.site.register(ResourceBase, ResourceBaseAdmin)
 admin.site.register(Link, LinkAdmin)
 admin.site.register(Thumbnail, ThumbnailAdmin)
 admin.site.register(License, LicenseAdmin)
+admin.site.register(Job, JobAdmin)
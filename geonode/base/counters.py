@@ -0,0 +1,89 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+'''
+Write-behind counters for resource view and share counts.
+
+Counting a page view inserts a PendingCount row instead of rewriting the
+whole resource row and firing the model save signals. The pending rows
+are summed into the resources in bulk with F() updates by ``flush``, run
+by the ``flush_counters`` command and by the requests of a process once
+COUNTER_FLUSH_INTERVAL seconds have passed since its last flush. Pending
+counts are kept in the database, so they survive restarted processes.
+'''
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import transaction
+from django.db.models import F
+
+from geonode.base.models import PendingCount
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+FLUSH_INTERVAL = getattr(settings, 'COUNTER_FLUSH_INTERVAL', 60)
+
+_lock = threading.Lock()
+_last_flush = [time.time()]
+
+
+def increment(obj, field='popular_count', n=1):
+    '''count n more for the field of obj. the in memory instance is updated
+    right away, the database resource on the next flush'''
+    model = obj._meta.concrete_model
+    PendingCount.objects.create(object_ct=ContentType.objects.get_for_model(model),
+                                object_id=obj.pk, field=field, n=n)
+    setattr(obj, field, getattr(obj, field) + n)
+    with _lock:
+        due = time.time() - _last_flush[0] >= FLUSH_INTERVAL
+        if due:
+            _last_flush[0] = time.time()
+    if due:
+        try:
+            flush()
+        except Exception:
+            logger.exception('Could not flush the pending counts')
+
+
+@transaction.commit_on_success
+def flush():
+    '''write all pending increments, one UPDATE per model, field and
+    distinct increment. The pending rows are locked until they are deleted,
+    so that concurrent flushes do not count them twice.'''
+    pending = PendingCount.objects.select_for_update().values_list(
+        'id', 'object_ct', 'object_id', 'field', 'n')
+    # (content type, field) -> {pk: increment}
+    totals = {}
+    ids = []
+    for id, ct, pk, field, n in pending:
+        counts = totals.setdefault((ct, field), {})
+        counts[pk] = counts.get(pk, 0) + n
+        ids.append(id)
+    for (ct, field), counts in totals.items():
+        model = ContentType.objects.get_for_id(ct).model_class()
+        by_increment = {}
+        for pk, n in counts.items():
+            by_increment.setdefault(n, []).append(pk)
+        for n, pks in by_increment.items():
+            model.objects.filter(pk__in=pks).update(**{field: F(field) + n})
+    for i in range(0, len(ids), 500):
+        PendingCount.objects.filter(id__in=ids[i:i + 500]).delete()
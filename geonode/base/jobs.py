@@ -0,0 +1,219 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+'''
+Background jobs for resources.
+
+A job type is a function taking a resource id, registered with
+``register``. ``enqueue`` records a Job row for the resource, at most one
+per type, and hands its id to the broker configured in JOB_BROKER:
+
+* LocalBroker (default) runs jobs in JOB_WORKERS threads of the web process.
+* ImmediateBroker runs them right away in the calling thread. A failed
+  job is not retried, it is marked as failed and its error raised to the
+  caller.
+* DatabaseBroker only leaves them pending, for ``manage.py run_jobs``.
+
+Any object with a ``send(job_id, delay=0)`` method that eventually calls
+``run(job_id)`` can be used as a broker. Except with the immediate
+broker, a failed job is run again up to JOB_MAX_RETRIES more times,
+waiting JOB_RETRY_DELAY seconds more each time. Jobs left running for
+JOB_TIMEOUT seconds, by a worker that died, are made pending again by
+``reclaim`` (run_jobs calls it).
+
+The local broker loses the jobs it holds when its process ends. A job
+pending for longer than its last retry delay is sent again when enqueued
+again, and ``manage.py run_jobs`` must run periodically to pick up the
+others.
+'''
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils.importlib import import_module
+
+from geonode.base.models import Job
+
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+import logging
+import Queue
+import threading
+import traceback
+
+logger = logging.getLogger(__name__)
+
+WORKERS = getattr(settings, 'JOB_WORKERS', 1)
+MAX_RETRIES = getattr(settings, 'JOB_MAX_RETRIES', 3)
+RETRY_DELAY = getattr(settings, 'JOB_RETRY_DELAY', 60)
+TIMEOUT = getattr(settings, 'JOB_TIMEOUT', 3600)
+
+# job type -> function(resource_id)
+_job_types = {}
+_brokers = {}
+_local = threading.local()
+
+
+def register(job_type):
+    '''decorator registering the function as the handler of job_type'''
+    def decorator(func):
+        _job_types[job_type] = func
+        return func
+    return decorator
+
+
+class ImmediateBroker(object):
+    '''runs jobs in the calling thread, which gets their errors'''
+
+    def send(self, job_id, delay=0):
+        run(job_id)
+
+
+class LocalBroker(object):
+    '''runs jobs in a pool of daemon threads of this process'''
+
+    def __init__(self, workers=None):
+        self.queue = Queue.Queue()
+        self.size = workers or WORKERS
+        self.workers = []
+        self.lock = threading.Lock()
+
+    def send(self, job_id, delay=0):
+        if delay:
+            timer = threading.Timer(delay, self.send, (job_id,))
+            timer.daemon = True
+            timer.start()
+            return
+        with self.lock:
+            self.workers = [w for w in self.workers if w.is_alive()]
+            while len(self.workers) < self.size:
+                worker = threading.Thread(target=self.work, name='geonode-jobs-%d' % len(self.workers))
+                worker.daemon = True
+                worker.start()
+                self.workers.append(worker)
+        self.queue.put(job_id)
+
+    def work(self):
+        while True:
+            job_id = self.queue.get()
+            try:
+                run(job_id)
+            except Exception:
+                logger.exception('Could not run job %s', job_id)
+            finally:
+                connection.close()
+
+
+class DatabaseBroker(object):
+    '''leaves jobs pending in the database for the run_jobs command'''
+
+    def send(self, job_id, delay=0):
+        pass
+
+
+def get_broker():
+    if getattr(_local, 'immediate', False):
+        path = 'geonode.base.jobs.ImmediateBroker'
+    else:
+        path = getattr(settings, 'JOB_BROKER', 'geonode.base.jobs.LocalBroker')
+    broker = _brokers.get(path)
+    if broker is None:
+        module, attr = path.rsplit('.', 1)
+        broker = _brokers[path] = getattr(import_module(module), attr)()
+    return broker
+
+
+@contextmanager
+def immediate():
+    '''run the jobs enqueued by the current thread right away, for callers
+    that need the resource fully synchronized (uploads, updatelayers)'''
+    previous = getattr(_local, 'immediate', False)
+    _local.immediate = True
+    try:
+        yield
+    finally:
+        _local.immediate = previous
+
+
+def enqueue(job_type, resource):
+    '''schedule job_type for the resource unless it is already pending'''
+    job, created = Job.objects.get_or_create(resource_id=resource.pk, job_type=job_type)
+    if not created:
+        if job.status == 'pending' and not getattr(_local, 'immediate', False) \
+                and job.updated > _lost_before():
+            return job
+        if Job.objects.filter(pk=job.pk, status='running').update(
+                status='pending', attempts=0, error='', updated=datetime.now()):
+            # run() sends it again once the current run ends, so that
+            # the workers never run the same job twice at once
+            return job
+        Job.objects.filter(pk=job.pk).update(status='pending', attempts=0, error='', updated=datetime.now())
+    get_broker().send(job.pk)
+    return job
+
+
+def run(job_id):
+    '''run the job if it is pending, retrying it later if it fails'''
+    taken = Job.objects.filter(pk=job_id, status='pending').update(
+        status='running', attempts=F('attempts') + 1, updated=datetime.now())
+    if not taken:
+        return
+    job = Job.objects.get(pk=job_id)
+    try:
+        _job_types[job.job_type](job.resource_id)
+    except Exception:
+        error = traceback.format_exc()
+        if isinstance(get_broker(), ImmediateBroker):
+            # the caller waits for the job, let it handle the error
+            Job.objects.filter(pk=job_id, status='running').update(
+                status='failed', error=error, updated=datetime.now())
+            raise
+        logger.warn('Job %s failed (attempt %s)', job, job.attempts, exc_info=True)
+        retry = job.attempts <= MAX_RETRIES
+        updated = Job.objects.filter(pk=job_id, status='running').update(
+            status='pending' if retry else 'failed', error=error, updated=datetime.now())
+        if updated and retry:
+            get_broker().send(job_id, delay=RETRY_DELAY * job.attempts)
+            return
+    else:
+        updated = Job.objects.filter(pk=job_id, status='running').update(
+            status='done', error='', updated=datetime.now())
+    if not updated:
+        # enqueued again while it was running
+        get_broker().send(job_id)
+
+
+def _lost_before():
+    '''pending jobs not updated since are lost: even the last retry delay
+    has passed, their broker dropped them'''
+    return datetime.now() - timedelta(seconds=RETRY_DELAY * max(MAX_RETRIES, 1))
+
+
+def reclaim(timeout=None):
+    '''make the jobs running for more than timeout seconds (JOB_TIMEOUT by
+    default) pending again, their worker is gone. Returns their ids.'''
+    limit = datetime.now() - timedelta(seconds=timeout or TIMEOUT)
+    stale = list(Job.objects.filter(status='running', updated__lt=limit).values_list('id', flat=True))
+    Job.objects.filter(pk__in=stale, status='running').update(status='pending', updated=datetime.now())
+    return stale
+
+
+def status(resource, job_type):
+    '''the status of the job_type job of the resource, None if it never ran'''
+    statuses = Job.objects.filter(resource_id=resource.pk, job_type=job_type).values_list('status', flat=True)
+    return statuses[0] if statuses else None
@@ -0,0 +1,49 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Run the pending background jobs, optionally retrying the failed ones'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--failed', action='store_true', dest='failed', default=False,
+            help='Also retry the jobs that ran out of attempts'),
+    )
+
+    def handle(self, *args, **opts):
+        from geonode.base import jobs
+        from geonode.base.models import Job
+        if opts['failed']:
+            Job.objects.filter(status='failed').update(status='pending', attempts=0)
+        # left running by a worker that died
+        jobs.reclaim()
+        with jobs.immediate():
+            for job_id in Job.objects.filter(status='pending').values_list('id', flat=True):
+                try:
+                    jobs.run(job_id)
+                except Exception:
+                    # marked as failed, run it again with --failed
+                    logger.warn('Job %s failed', job_id, exc_info=True)
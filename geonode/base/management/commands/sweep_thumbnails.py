@@ -0,0 +1,36 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+class Command(BaseCommand):
+    help = 'Delete the thumbnails and thumbnail files no resource uses anymore'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--grace', type='int', dest='grace', default=3600,
+            help='Keep unused thumbnails and files younger than this many seconds (default 3600)'),
+    )
+
+    def handle(self, *args, **opts):
+        from geonode.base.models import Thumbnail
+        rows, files = Thumbnail.objects.sweep(grace=opts['grace'])
+        if int(opts.get('verbosity', 1)) > 0:
+            print '%d thumbnails and %d files deleted' % (rows, files)
@@ -1,16 +1,20 @@
 from datetime import datetime
+from urlparse import urlparse
 import os
 import hashlib
+import logging
+import time
+from cStringIO import StringIO
 
 from django.db import models
 from django.db.models import Q
 from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ValidationError, ObjectDoesNotExist
 from django.core.files.base import ContentFile
 from django.conf import settings
 from django.contrib.staticfiles.templatetags import staticfiles
-from django.core.cache import cache
 
 from geonode.base.enumerations import ALL_LANGUAGES, \
     HIERARCHY_LEVELS, UPDATE_FREQUENCIES, \
@@ -130,23 +134,163 @@ class RestrictionCodeType(models.Model):
         ordering = ("identifier",)
         verbose_name_plural = 'Metadata Restriction Code Types'
 
+logger = logging.getLogger(__name__)
+
+# sizes the thumbnails are derived in from their rendered image, by name
+THUMBNAIL_SIZES = getattr(settings, 'THUMBNAIL_SIZES', {'small': (80, 60), 'medium': (120, 90)})
+THUMBNAIL_FORMATS = ('png', 'webp')
+
+
+def _master_name(name):
+    """the name of the rendered image a derived thumbnail file comes from"""
+    root, ext = os.path.splitext(name)
+    if '-' not in os.path.basename(root):
+        return name
+    return root.rsplit('-', 1)[0] + '.png'
+
+
+class ThumbnailManager(models.Manager):
+
+    def file_name(self, digest):
+        """name of the file of the thumbnails rendered from specs of that digest"""
+        return self.model._meta.get_field('thumb_file').generate_filename(None, digest + '.png')
+
+    def _age(self, storage, name):
+        """seconds since the file was written, None if unknown"""
+        try:
+            return time.time() - time.mktime(storage.modified_time(name).timetuple())
+        except (NotImplementedError, OSError):
+            return None
+
+    def sweep(self, files=True, grace=3600):
+        """
+        delete the thumbnails no resource points to anymore, then the files
+        no thumbnail uses. Both are kept while younger than grace seconds,
+        they may belong to a thumbnail being saved; the age of a thumbnail is
+        the one of its file. Returns the numbers of rows and files deleted.
+        """
+        field = self.model._meta.get_field('thumb_file')
+        storage, directory = field.storage, field.get_directory_name()
+
+        orphans = 0
+        for thumbnail in self.filter(resourcebase__isnull=True):
+            if thumbnail.thumb_file:
+                age = self._age(storage, thumbnail.thumb_file.name)
+                if age is not None and age < grace:
+                    continue
+            thumbnail.delete()
+            orphans += 1
+        if not files:
+            return orphans, 0
+
+        used = set(self.values_list('thumb_file', flat=True))
+        deleted = 0
+        try:
+            files = storage.listdir(directory)[1]
+        except OSError:
+            files = []
+        for f in files:
+            name = os.path.join(directory, f)
+            if _master_name(name) in used:
+                continue
+            age = self._age(storage, name)
+            if age is not None and age < grace:
+                continue
+            storage.delete(name)
+            deleted += 1
+        return orphans, deleted
+
+
 class Thumbnail(models.Model):
 
     thumb_file = models.FileField(upload_to='thumbs')
     thumb_spec = models.TextField(null=True, blank=True)
     version = models.PositiveSmallIntegerField(null=True, default=0)
 
-    def save_thumb(self, image, id):
-        """image must be png data in a string for now"""
+    objects = ThumbnailManager()
+
+    def save_thumb(self, image, id, digest=None):
+        """
+        image must be png data in a string for now. With the digest of the
+        render spec the file is named after it and shared with the other
+        thumbnails of the same spec; image may then be None if it exists.
+        """
         self._delete_thumb()
-        md5 = hashlib.md5()
-        md5.update(id + str(self.version))
         self.version = self.version + 1
-        self.thumb_file.save(md5.hexdigest() + ".png", ContentFile(image))
+        if digest is None:
+            md5 = hashlib.md5()
+            md5.update(id + str(self.version - 1))
+            self.thumb_file.save(md5.hexdigest() + ".png", ContentFile(image))
+        elif image is None:
+            self.thumb_file.name = Thumbnail.objects.file_name(digest)
+            self._touch()
+            self.save()
+        else:
+            self.thumb_file.save(digest + ".png", ContentFile(image))
+
+    def _touch(self):
+        # a shared file may be old, refresh it so that the sweep gives this
+        # thumbnail its grace period until a resource points to it
+        try:
+            os.utime(self.thumb_file.path, None)
+        except (NotImplementedError, OSError):
+            pass
+
+    def get_url(self, size=None, format='png'):
+        """
+        url of the image in one of THUMBNAIL_SIZES (None for the rendered
+        size) and THUMBNAIL_FORMATS, derived from the rendered image the
+        first time it is asked for. Falls back to the rendered image.
+        """
+        if size is None and format == 'png':
+            return self.thumb_file.url
+        try:
+            return self.thumb_file.storage.url(self._derive(size, format))
+        except Exception:
+            logger.warn('Could not derive the %s %s thumbnail of %s', size, format,
+                        self.thumb_file.name, exc_info=True)
+            return self.thumb_file.url
+
+    def _derived_name(self, size, format):
+        return '%s-%s.%s' % (os.path.splitext(self.thumb_file.name)[0], size or 'full', format)
+
+    def _derive(self, size, format):
+        if format not in THUMBNAIL_FORMATS:
+            raise ValueError('Unknown thumbnail format %s' % format)
+        dimensions = THUMBNAIL_SIZES[size] if size is not None else None
+        storage = self.thumb_file.storage
+        name = self._derived_name(size, format)
+        if storage.exists(name):
+            return name
+
+        from PIL import Image, ImageOps
+        master = storage.open(self.thumb_file.name)
+        try:
+            img = Image.open(StringIO(master.read()))
+        finally:
+            master.close()
+        if img.mode not in ('RGB', 'RGBA'):
+            img = img.convert('RGBA')
+        if dimensions is not None:
+            img = ImageOps.fit(img, dimensions, Image.ANTIALIAS)
+        derived = StringIO()
+        img.save(derived, format=format.upper())
+        return storage.save(name, ContentFile(derived.getvalue()))
 
     def _delete_thumb(self):
+        if not self.thumb_file:
+            return
+        if Thumbnail.objects.filter(thumb_file=self.thumb_file.name).exclude(pk=self.pk).exists():
+            # shared with another thumbnail of the same spec
+            return
+        storage = self.thumb_file.storage
+        for size in [None] + THUMBNAIL_SIZES.keys():
+            for format in THUMBNAIL_FORMATS:
+                name = self._derived_name(size, format)
+                if storage.exists(name):
+                    storage.delete(name)
         try:
-            self.thumb_file.delete()
+            self.thumb_file.delete(save=False)
         except OSError:
             pass
 
@@ -169,31 +313,57 @@ class ThumbnailMixin(object):
         render = getattr(self, '_render_thumbnail', None)
         if render is None:
             raise Exception('Must have _render_thumbnail(spec) function')
-        image = render(spec)
 
-        if not image:
-            return
-
-        #Clean any orphan Thumbnail before
-        Thumbnail.objects.filter(resourcebase__id=None).delete()
-        
-        self.thumbnail, created = Thumbnail.objects.get_or_create(resourcebase__id=self.id)
-        path = self._thumbnail_path()
-        self.thumbnail.thumb_spec = spec
-        self.thumbnail.save_thumb(image, path)
-        # have to save the thumb ref if new but also trigger XML regeneration
+        previous = self.thumbnail
+        digest = self._thumbnail_digest(spec)
+        image = None
+        if digest is not None:
+            name = Thumbnail.objects.file_name(digest)
+            storage = Thumbnail._meta.get_field('thumb_file').storage
+            if storage.exists(name):
+                if previous is not None and previous.thumb_file.name == name:
+                    # rendered from the same spec already
+                    return
+            else:
+                image = render(spec)
+                if not image:
+                    return
+        else:
+            image = render(spec)
+            if not image:
+                return
+
+        # write the new thumbnail aside and swap it in once complete, so
+        # that readers never see a missing or half written image
+        thumbnail = Thumbnail(thumb_spec=spec, version=previous.version if previous else 0)
+        thumbnail.save_thumb(image, self._thumbnail_path(), digest)
+        self.thumbnail = thumbnail
+        if self.pk is not None:
+            ResourceBase.objects.filter(pk=self.pk).update(thumbnail=thumbnail)
+        if previous is not None:
+            previous.delete()
+        # trigger XML regeneration
         if save:
             self.save()
 
     def _thumbnail_path(self):
         return '%s-%s' % (self._meta.object_name, self.pk)
 
+    def _thumbnail_digest(self, spec):
+        """
+        digest of everything the image rendered from spec depends on, None
+        to always render it. Thumbnails with the same digest share a file.
+        """
+        if not spec:
+            return None
+        return hashlib.sha1(spec.encode('utf-8') if isinstance(spec, unicode) else spec).hexdigest()
+
     def _get_default_thumbnail(self):
         return getattr(self, "_missing_thumbnail", staticfiles.static(settings.MISSING_THUMBNAIL))
 
-    def get_thumbnail_url(self):
+    def get_thumbnail_url(self, size=None, format='png'):
         thumb = self.thumbnail
-        return thumb == None and self._get_default_thumbnail() or thumb.thumb_file.url
+        return thumb == None and self._get_default_thumbnail() or thumb.get_url(size, format)
  
     def has_thumbnail(self):
         '''Determine if the thumbnail object exists and an image exists'''
@@ -480,6 +650,41 @@ class LinkManager(models.Manager):
     def original(self):
         return self.get_query_set().filter(link_type='original')
 
+    def reconcile(self, resource, links, hosts=None):
+        """Make the links of the resource match links, a list of dicts of
+           Link fields, with one select and bulk writes.
+
+           Links are matched by type and name. Unmatched links of the types
+           present in links are deleted, so are links to hosts not in hosts
+           when it is given. Matched links are updated only if they differ.
+        """
+        managed = set(fields['link_type'] for fields in links)
+        existing = {}
+        stale = []
+        for link in self.get_query_set().filter(resource=resource):
+            key = (link.link_type, link.name)
+            if hosts is not None and urlparse(link.url).hostname not in hosts:
+                stale.append(link.pk)
+            elif link.link_type in managed:
+                if key in existing:
+                    stale.append(link.pk)
+                else:
+                    existing[key] = link
+
+        new = []
+        for fields in links:
+            link = existing.pop((fields['link_type'], fields['name']), None)
+            if link is None:
+                new.append(Link(resource=resource, **fields))
+            elif any(getattr(link, f) != v for f, v in fields.items()):
+                self.get_query_set().filter(pk=link.pk).update(**fields)
+        stale.extend(link.pk for link in existing.values())
+
+        if stale:
+            self.get_query_set().filter(pk__in=stale).delete()
+        if new:
+            self.bulk_create(new)
+
 class Link(models.Model):
     """Auxiliary model for storing links for resources.
 
@@ -501,6 +706,44 @@ class Link(models.Model):
 
     objects = LinkManager()
 
+class Job(models.Model):
+    """Background job for a resource, see geonode.base.jobs.
+
+       There is at most one job of each type per resource, enqueueing it
+       again while it is pending is a no-op.
+    """
+    JOB_STATUS = (
+        ('pending', _('Pending')),
+        ('running', _('Running')),
+        ('done', _('Done')),
+        ('failed', _('Failed')),
+    )
+
+    resource = models.ForeignKey(ResourceBase)
+    job_type = models.CharField(max_length=64)
+    status = models.CharField(max_length=16, choices=JOB_STATUS, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = (('resource', 'job_type'),)
+
+    def __unicode__(self):
+        return u'%s %s: %s' % (self.job_type, self.resource_id, self.status)
+
+class PendingCount(models.Model):
+    """Increment of a counter of a resource, eg its popular_count, not
+       written to the resource yet, see geonode.base.counters.
+
+       Rows are only ever inserted by the requests, counters.flush sums
+       them into the resources and deletes them.
+    """
+    object_ct = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    field = models.CharField(max_length=32)
+    n = models.IntegerField(default=1)
+
 def resourcebase_post_save(instance, sender, **kwargs):
     """
     Since django signals are not propagated from child to parent classes we need to call this 
@@ -523,11 +766,6 @@ def resourcebase_post_save(instance, sender, **kwargs):
                                            defaults={"name": user.username}
                                            )
         resourcebase.metadata_author = ac
-    # update cache
-    cache_version = cache.get('cache_version')
-    if not cache_version:
-        cache_version = 0
-    cache.set('cache_version', cache_version + 1)
 
 def resourcebase_post_delete(instance, sender, **kwargs):
     """
@@ -25,4 +25,9 @@ def categories():
     for c in counts:
         topics = topics.annotate(**{ '%s_count' % c : Count('resourcebase__%s__category' % c)})
     return topics
-    
\ No newline at end of file
+    
+@register.filter
+def thumbnail_url(resource, size=None):
+    """url of the thumbnail of resource in one of the THUMBNAIL_SIZES"""
+    get_thumbnail_url = getattr(resource, 'get_thumbnail_url', None)
+    return get_thumbnail_url(size) if get_thumbnail_url else ''
@@ -27,6 +27,77 @@ class ThumbnailTests(TestCase):
         self._do_save_test('abc', 1)
         self._do_save_test('xyz', 2)
 
+    def test_swap(self):
+        from geonode.base.models import Thumbnail
+        self.rb._render_thumbnail = lambda *a, **kw: '%s' % a[0]
+
+        self.rb.save_thumbnail('abc')
+        first = self.rb.thumbnail
+        self.rb.save_thumbnail('xyz', save=False)
+        # the new thumbnail is in place even without saving the resource
+        self.assertNotEquals(first.id, self.rb.thumbnail.id)
+        self.assertEquals(ResourceBase.objects.get(pk=self.rb.pk).thumbnail_id, self.rb.thumbnail.id)
+        self.assertFalse(Thumbnail.objects.filter(pk=first.id).exists())
+
+    def test_same_spec(self):
+        from geonode.base.models import Thumbnail
+        rendered = []
+
+        def render(spec):
+            rendered.append(spec)
+            return spec
+        self.rb._render_thumbnail = render
+
+        self.rb.save_thumbnail('same spec')
+        thumb = self.rb.thumbnail
+        # an unchanged spec is not rendered again
+        self.rb.save_thumbnail('same spec')
+        self.assertTrue(self.rb.thumbnail is thumb)
+
+        # resources with the same spec share the file
+        other = ResourceBase.objects.create()
+        other._render_thumbnail = render
+        other.save_thumbnail('same spec')
+        self.assertNotEquals(thumb.id, other.thumbnail.id)
+        self.assertEquals(thumb.thumb_file.name, other.thumbnail.thumb_file.name)
+        self.assertTrue(len(rendered) <= 1)
+
+        other.thumbnail.delete()
+        self.assertTrue(thumb.thumb_file.storage.exists(thumb.thumb_file.name))
+
+        # the sweep removes the thumbnails nothing points to
+        orphan = Thumbnail.objects.create()
+        Thumbnail.objects.sweep(files=False)
+        self.assertFalse(Thumbnail.objects.filter(pk=orphan.pk).exists())
+        self.assertTrue(Thumbnail.objects.filter(pk=thumb.pk).exists())
+
+        # but not the ones just saved, a resource may be about to use them
+        fresh = Thumbnail()
+        fresh.save_thumb(None, None, self.rb._thumbnail_digest('same spec'))
+        Thumbnail.objects.sweep(files=False)
+        self.assertTrue(Thumbnail.objects.filter(pk=fresh.pk).exists())
+        Thumbnail.objects.sweep(files=False, grace=0)
+        self.assertFalse(Thumbnail.objects.filter(pk=fresh.pk).exists())
+        self.assertTrue(thumb.thumb_file.storage.exists(thumb.thumb_file.name))
+        other.delete()
+
+    def test_sizes(self):
+        from cStringIO import StringIO
+        from PIL import Image
+        from geonode.base.models import THUMBNAIL_SIZES
+        png = StringIO()
+        Image.new('RGB', (200, 150), 'red').save(png, 'PNG')
+        self.rb._render_thumbnail = lambda spec: png.getvalue()
+
+        self.rb.save_thumbnail('sizes spec')
+        thumb = self.rb.thumbnail
+        self.assertTrue(self.rb.get_thumbnail_url('small').endswith('-small.png'))
+        derived = thumb.thumb_file.storage.open(thumb._derived_name('small', 'png'))
+        self.assertEquals(Image.open(derived).size, THUMBNAIL_SIZES['small'])
+        derived.close()
+        # unknown sizes fall back to the rendered image
+        self.assertEquals(self.rb.get_thumbnail_url('huge'), thumb.thumb_file.url)
+
     def _do_save_test(self, content, version):
         self.rb.save_thumbnail(content)
         thumb = self.rb.thumbnail
@@ -141,3 +212,194 @@ class UtilsTests(TestCase):
 
 
 
+
+
+    def test_get_wms(self):
+        import threading
+        import time
+        from geonode import utils
+        fetched = []
+
+        def fake_fetch(url):
+            fetched.append(url)
+            return 'wms %d' % len(fetched)
+
+        real = utils._fetch_wms, utils._wms, utils._wms_fetched
+        utils._fetch_wms, utils._wms = fake_fetch, None
+        try:
+            with self.settings(WMS_CAPABILITIES_TTL=300):
+                # fetched once, then kept for WMS_CAPABILITIES_TTL seconds
+                wms = utils.get_wms()
+                self.assertEquals(wms, utils.get_wms())
+                self.assertEquals(1, len(fetched))
+                self.assertTrue(fetched[0].startswith(utils.ogc_server_settings.internal_ows + '?'))
+
+                # once stale it is still returned while a new one is fetched
+                utils._wms_fetched = time.time() - 301
+                self.assertEquals(wms, utils.get_wms())
+                for thread in threading.enumerate():
+                    if thread.name == 'geonode-wms-refresh':
+                        thread.join()
+                self.assertEquals(2, len(fetched))
+                self.assertEquals('wms 2', utils.get_wms())
+                self.assertTrue(time.time() - utils._wms_fetched < 300)
+
+                # layer scoped documents come from the same internal server
+                self.assertEquals('wms 3', utils.get_wms(layer='geonode:roads'))
+                base = utils.ogc_server_settings.internal_ows[:-len('ows')]
+                self.assertTrue(fetched[2].startswith(base + 'geonode/roads/wms?'))
+                self.assertEquals('wms 2', utils.get_wms())
+        finally:
+            utils._fetch_wms, utils._wms, utils._wms_fetched = real
+
+
+class CounterTests(TestCase):
+
+    fixtures = ['initial_data.json', 'bobby']
+
+    def test_increments_are_flushed_in_bulk(self):
+        import time
+        from geonode.base import counters
+        from geonode.base.models import PendingCount
+        from geonode.maps.models import Map
+        from geonode.search.populate_search_test_data import create_models
+        create_models(type='map')
+        map_obj = Map.objects.all()[0]
+        start = map_obj.popular_count
+        # just flushed, the increments stay pending
+        counters._last_flush[0] = time.time()
+
+        counters.increment(map_obj, 'popular_count')
+        counters.increment(map_obj, 'popular_count')
+        # the instance reflects the count right away, the database once flushed
+        self.assertEquals(start + 2, map_obj.popular_count)
+        self.assertEquals(2, PendingCount.objects.count())
+        self.assertEquals(start, Map.objects.get(pk=map_obj.pk).popular_count)
+
+        counters.flush()
+        self.assertEquals(start + 2, Map.objects.get(pk=map_obj.pk).popular_count)
+        self.assertEquals(0, PendingCount.objects.count())
+        # nothing left to flush
+        counters.flush()
+        self.assertEquals(start + 2, Map.objects.get(pk=map_obj.pk).popular_count)
+
+
+class RetryingBroker(object):
+    """runs jobs right away, without waiting for the retry delays"""
+
+    def send(self, job_id, delay=0):
+        from geonode.base import jobs
+        jobs.run(job_id)
+
+
+@override_settings(JOB_BROKER='geonode.base.jobs.ImmediateBroker')
+class JobTests(TestCase):
+
+    def setUp(self):
+        from geonode.base import jobs
+        self.rb = ResourceBase.objects.create()
+        self.calls = []
+
+        @jobs.register('test_job')
+        def test_job(resource_id):
+            self.calls.append(resource_id)
+            if self.failing:
+                raise RuntimeError('GeoServer is down')
+
+    def test_run_and_retry(self):
+        from geonode.base import jobs
+        self.assertEquals(None, jobs.status(self.rb, 'test_job'))
+
+        self.failing = False
+        jobs.enqueue('test_job', self.rb)
+        self.assertEquals([self.rb.pk], self.calls)
+        self.assertEquals('done', jobs.status(self.rb, 'test_job'))
+
+        # the caller of an immediate job gets its error, without retries
+        self.failing = True
+        self.assertRaises(RuntimeError, jobs.enqueue, 'test_job', self.rb)
+        self.assertEquals(2, len(self.calls))
+        self.assertEquals('failed', jobs.status(self.rb, 'test_job'))
+
+        # other brokers retry failing jobs, then mark them as failed
+        del self.calls[:]
+        with override_settings(JOB_BROKER='geonode.base.tests.RetryingBroker'):
+            job = jobs.enqueue('test_job', self.rb)
+        # the first run plus the retries
+        self.assertEquals(1 + jobs.MAX_RETRIES, len(self.calls))
+        job = job.__class__.objects.get(pk=job.pk)
+        self.assertEquals('failed', job.status)
+        self.assertTrue('GeoServer is down' in job.error)
+
+    def test_pending_job_is_not_queued_twice(self):
+        from geonode.base import jobs
+        self.failing = False
+        with override_settings(JOB_BROKER='geonode.base.jobs.DatabaseBroker'):
+            jobs.enqueue('test_job', self.rb)
+            jobs.enqueue('test_job', self.rb)
+        self.assertEquals('pending', jobs.status(self.rb, 'test_job'))
+        self.assertEquals(1, self.rb.job_set.count())
+
+        jobs.run(self.rb.job_set.get().pk)
+        self.assertEquals([self.rb.pk], self.calls)
+        self.assertEquals('done', jobs.status(self.rb, 'test_job'))
+
+
+    def test_reclaim_lost_jobs(self):
+        from datetime import datetime, timedelta
+        from geonode.base import jobs
+        from geonode.base.models import Job
+        job = Job.objects.create(resource=self.rb, job_type='test_job', status='running')
+        # still running
+        self.assertEquals([], jobs.reclaim(60))
+        Job.objects.filter(pk=job.pk).update(updated=datetime.now() - timedelta(seconds=120))
+        self.assertEquals([job.pk], jobs.reclaim(60))
+        self.assertEquals('pending', jobs.status(self.rb, 'test_job'))
+
+    def test_lost_pending_job_is_sent_again(self):
+        from datetime import datetime, timedelta
+        from geonode.base import jobs
+        from geonode.base.models import Job
+        self.failing = False
+        job = Job.objects.create(resource=self.rb, job_type='test_job', status='pending')
+        # pending in a broker, maybe waiting for a retry
+        jobs.enqueue('test_job', self.rb)
+        self.assertEquals([], self.calls)
+        # its broker is gone
+        lost = datetime.now() - timedelta(seconds=jobs.RETRY_DELAY * jobs.MAX_RETRIES + 60)
+        Job.objects.filter(pk=job.pk).update(updated=lost)
+        jobs.enqueue('test_job', self.rb)
+        self.assertEquals([self.rb.pk], self.calls)
+        self.assertEquals('done', jobs.status(self.rb, 'test_job'))
+
+
+class LinkReconcileTests(TestCase):
+
+    def setUp(self):
+        self.rb = ResourceBase.objects.create()
+
+    def _link(self, name, url, link_type='data'):
+        return dict(link_type=link_type, extension='zip', name=name, mime='application/zip', url=url)
+
+    def test_reconcile(self):
+        from geonode.base.models import Link
+        hosts = ['localhost']
+        Link.objects.create(resource=self.rb, link_type='metadata', extension='xml',
+                            name='ISO', mime='text/xml', url='http://localhost/csw?id=1')
+        Link.objects.create(resource=self.rb, link_type='data', extension='zip',
+                            name='Old', mime='application/zip', url='http://oldhost/wfs?old')
+        Link.objects.reconcile(self.rb, [self._link('Shapefile', 'http://localhost/wfs?a'),
+                                         self._link('CSV', 'http://localhost/wfs?b')], hosts)
+        links = dict(self.rb.link_set.values_list('name', 'url'))
+        # links of other types are kept, the one of the old host is removed
+        self.assertEquals({'ISO': 'http://localhost/csw?id=1',
+                           'Shapefile': 'http://localhost/wfs?a',
+                           'CSV': 'http://localhost/wfs?b'}, links)
+
+        shapefile = self.rb.link_set.get(name='Shapefile')
+        Link.objects.reconcile(self.rb, [self._link('Shapefile', 'http://localhost/wfs?c')], hosts)
+        links = dict(self.rb.link_set.values_list('name', 'url'))
+        # changed links are updated in place and missing ones dropped
+        self.assertEquals({'ISO': 'http://localhost/csw?id=1',
+                           'Shapefile': 'http://localhost/wfs?c'}, links)
+        self.assertEquals(shapefile.pk, self.rb.link_set.get(name='Shapefile').pk)
@@ -0,0 +1,63 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+'''
+Thumbnail rendering off the request.
+
+``register`` adds a '<model>_thumbnail' background job (see
+geonode.base.jobs) rendering the thumbnail of one resource of the model
+with its ``update_thumbnail`` method. ``enqueue`` schedules it, at most
+once per resource, so that saving a resource never waits for GeoServer
+or the document converters. The new Thumbnail replaces the previous one
+only once it is fully written (see ThumbnailMixin.save_thumbnail).
+'''
+
+from geonode.base import jobs
+
+
+def job_type(model):
+    while model._meta.proxy:
+        model = model._meta.proxy_for_model
+    return '%s_thumbnail' % model._meta.module_name
+
+
+def register(model):
+    '''add the thumbnail job of model, which must have update_thumbnail(save)'''
+    def render(resource_id):
+        resources = list(model.objects.filter(pk=resource_id))
+        if not resources:
+            # deleted since
+            return
+        resource = resources[0]
+        previous = resource.thumbnail_id
+        resource.update_thumbnail(save=False)
+        if resource.thumbnail_id != previous:
+            # for the post_save handlers, eg the catalogue record
+            resource.save(update_fields=['thumbnail'])
+    jobs.register(job_type(model))(render)
+    return model
+
+
+def enqueue(resource):
+    '''render the thumbnail of resource in the background'''
+    return jobs.enqueue(job_type(type(resource)), resource)
+
+
+def status(resource):
+    '''the status of the thumbnail job of the resource, None if it never ran'''
+    return jobs.status(resource, job_type(type(resource)))
@@ -38,6 +38,10 @@ def catalogue_pre_delete(instance, sender, **kwargs):
     catalogue.remove_record(instance.uuid)
 
 
+# fields catalogue_post_save generates
+CATALOGUE_FIELDS = ['metadata_xml', 'csw_anytext', 'csw_wkt_geometry']
+
+
 def catalogue_post_save(instance, sender, **kwargs):
     """Get information from catalogue
     """
@@ -85,7 +89,7 @@ def catalogue_post_save(instance, sender, **kwargs):
 
     instance.csw_wkt_geometry = instance.geographic_bounding_box.split(';')[-1]
 
-    instance.save()
+    instance.save(update_fields=CATALOGUE_FIELDS)
 
     signals.post_save.connect(catalogue_post_save, sender=Layer)
     signals.post_save.connect(catalogue_post_save, sender=Document)
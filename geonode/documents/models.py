@@ -14,6 +14,7 @@ from django.core.files.storage import FileSystemStorage
 
 from geonode.security.enumerations import AUTHENTICATED_USERS, ANONYMOUS_USERS
 from geonode.layers.models import Layer
+from geonode.base import thumbnails
 from geonode.base.models import ResourceBase, resourcebase_post_save
 from geonode.maps.signals import map_changed_signal
 from geonode.maps.models import Map
@@ -166,7 +167,7 @@ def pre_save_document(instance, sender, **kwargs):
 
 def create_thumbnail(sender, instance, created, **kwargs):
     if created:
-        instance.update_thumbnail(save=False)
+        thumbnails.enqueue(instance)
 
 
 def update_documents_extent(sender, **kwargs):
@@ -175,6 +176,8 @@ def update_documents_extent(sender, **kwargs):
     for document in Document.objects.filter(content_type=ctype, object_id=sender.id):
         document.save()
 
+thumbnails.register(Document)
+
 signals.pre_save.connect(pre_save_document, sender=Document)
 signals.post_save.connect(create_thumbnail, sender=Document)
 signals.post_save.connect(resourcebase_post_save, sender=Document)
@@ -24,6 +24,7 @@ from geonode.people.forms import ProfileForm
 from geonode.documents.models import Document
 from geonode.documents.forms import DocumentForm
 from geonode.documents.models import IMGTYPES
+from geonode.base import counters, thumbnails
 
 ALLOWED_DOC_TYPES = settings.ALLOWED_DOCUMENT_TYPES
 
@@ -80,8 +81,7 @@ def document_detail(request, docid):
     except:
         related = ''
 
-    document.popular_count += 1
-    document.save()
+    counters.increment(document, 'popular_count')
 
     return render_to_response("documents/document_detail.html", RequestContext(request, {
         'permissions_json': json.dumps(_perms_info(document, DOCUMENT_LEV_NAMES)),
@@ -277,7 +277,7 @@ def document_replace(request, docid, template='documents/document_replace.html')
         doc_file = request.FILES['file']
         document.doc_file = doc_file
         document.save()
-        document.update_thumbnail()
+        thumbnails.enqueue(document)
         return HttpResponseRedirect(reverse('document_detail', args=(document.id,)))
 
 @login_required
@@ -19,15 +19,21 @@
 #########################################################################
 
 import sys, os
+import copy
+import hashlib
 import logging
 import re
 import errno
 import uuid
 import datetime
-from itertools import cycle, izip
+import threading
+from itertools import cycle, imap, izip
+from multiprocessing.pool import ThreadPool
+from xml.etree.ElementTree import tostring
 
 from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.db.models.signals import pre_delete
 
 from geonode.utils import _user, _password, ogc_server_settings
@@ -38,6 +44,7 @@ from geoserver.workspace import Workspace
 
 from dialogos.models import Comment
 from agon_ratings.models import OverallRating
+from taggit.models import TaggedItem
 
 logger = logging.getLogger(__name__)
 
@@ -48,6 +55,41 @@ _marks = ["square", "circle", "cross", "x", "triangle"]
 _style_contexts = izip(cycle(_foregrounds), cycle(_backgrounds), cycle(_marks))
 _default_style_names = ["point", "line", "polygon", "raster"]
 
+_catalogs = threading.local()
+# REST responses cached by the catalogs of all threads, per service url.
+# gsconfig expires entries after a few seconds and clears them on writes.
+_catalog_caches = {}
+
+def get_catalog(url=None):
+    """
+    Returns the GeoServer catalog for the given REST url, the internal one
+    by default.
+
+    httplib2 connections are not thread safe, so catalogs are kept per
+    thread and reused by every call, keeping their connections alive. Their
+    response cache is shared across threads, so a layer save only fetches
+    each resource once.
+    """
+    if url is None:
+        url = ogc_server_settings.internal_rest
+    catalogs = getattr(_catalogs, 'by_url', None)
+    if catalogs is None:
+        catalogs = _catalogs.by_url = {}
+    cat = catalogs.get(url)
+    if cat is None:
+        cat = Catalog(url, _user, _password)
+        cat._cache = _catalog_caches.setdefault(url, {})
+        catalogs[url] = cat
+    return cat
+
+def invalidate_catalog_cache():
+    """
+    Drops the cached GeoServer REST responses, for changes made to GeoServer
+    without going through a catalog returned by get_catalog.
+    """
+    for cache in _catalog_caches.values():
+        cache.clear()
+
 def _add_sld_boilerplate(symbolizer):
     """
     Wrap an XML snippet representing a single symbolizer in the appropriate
@@ -250,22 +292,181 @@ def delete_from_postgis(resource_name):
     finally:
         conn.close()
 
-def gs_slurp(ignore_errors=True, verbosity=1, console=None, owner=None, workspace=None, store=None, filter=None, skip_unadvertised=False, remove_deleted=False):
+def datastore_table(resource):
+    """
+    Schema (None for the default one) and name of the table of the PostGIS
+    datastore behind a GeoServer resource, which may have been renamed.
+    """
+    resource.fetch()
+    table = resource.dom.findtext('nativeName') or resource.name
+    schema = resource.store.connection_parameters.get('schema') or None
+    return schema, table
+
+
+STATISTICS = ['Count', 'Min', 'Max', 'Average', 'Median', 'StandardDeviation', 'Sum']
+
+
+def _statistics_from_row(fields, row):
+    """split the row of aggregates of datastore_attribute_statistics by field"""
+    results = {}
+    for i, field in enumerate(fields):
+        values = row[i * len(STATISTICS):(i + 1) * len(STATISTICS)]
+        result = dict(zip(STATISTICS, [v if v is None else str(v) for v in values]))
+        result['Count'] = values[0]
+        for key, value in result.items():
+            if value is None:
+                result[key] = 'NA'
+        result['unique_values'] = 'NA'
+        results[field] = result
+    return results
+
+
+def datastore_attribute_statistics(table, fields, schema=None):
+    """
+    Statistics (count, min, max, average, median, standard deviation, sum
+    and unique values) of several numeric columns of a table of the PostGIS
+    datastore, in one pass over the table plus one for the unique values.
+    Returns a dict of field name to the same dict as
+    wps_execute_layer_attribute_statistics. The median needs PostgreSQL
+    9.4, it is 'NA' on older servers.
+    """
+    from django.db import connections, transaction
+    alias = ogc_server_settings.DATASTORE
+    connection = connections[alias]
+    quote = connection.ops.quote_name
+    if schema:
+        table = '%s.%s' % (quote(schema), quote(table))
+    else:
+        table = quote(table)
+    try:
+        cursor = connection.cursor()
+        if connection.pg_version >= 90400:
+            median = 'percentile_cont(0.5) WITHIN GROUP (ORDER BY %s)'
+        else:
+            median = 'NULL'
+        aggregates = ['count(%s)', 'min(%s)', 'max(%s)', 'avg(%s)', median,
+                      'stddev_pop(%s)', 'sum(%s)']
+        columns = [a.replace('%s', quote(f)) for f in fields for a in aggregates]
+        cursor.execute('SELECT %s FROM %s' % (', '.join(columns), table))
+        results = _statistics_from_row(fields, cursor.fetchone())
+
+        # TODO: find way of figuring out threshold better
+        small = [f for f in fields if results[f]['Count'] < 10000]
+        if small:
+            columns = ["array_to_string(array_agg(DISTINCT %s), ',')" % quote(f) for f in small]
+            cursor.execute('SELECT %s FROM %s' % (', '.join(columns), table))
+            for field, values in zip(small, cursor.fetchone()):
+                results[field]['unique_values'] = values or ''
+    except Exception:
+        # leave the connection usable for the next queries
+        transaction.rollback_unless_managed(using=alias)
+        raise
+    return results
+
+def gs_fingerprint(resource):
+    """Digest of the GeoServer configuration of a resource: its REST
+       representation, with the bounding boxes and attributes, and its
+       store. Made from the document gs_slurp already loaded, it costs no
+       request; style changes alone are not seen, use updatelayers --force.
+    """
+    if resource.dom is None:
+        resource.fetch()
+    digest = hashlib.sha1(tostring(resource.dom))
+    digest.update(('%s:%s' % (resource.store.workspace.name, resource.store.name)).encode('utf-8'))
+    return digest.hexdigest()
+
+def _slurp_resource(resource, owner, fingerprint=None, force=False):
+    """Creates or updates the GeoNode layer of a GeoServer resource, unless
+       its fingerprint did not change since the last run. Returns the
+       status of the layer: created, updated or unchanged.
+    """
+    # avoid circular import problem
+    from geonode.base import jobs
+    from geonode.layers.models import Layer, LayerFingerprint, set_attributes
+
+    if fingerprint is not None and not force and fingerprint == gs_fingerprint(resource):
+        return 'unchanged'
+
+    store = resource.store
+    workspace = store.workspace
+    layer, created = Layer.objects.get_or_create(name=resource.name, defaults = {
+        "workspace": workspace.name,
+        "store": store.name,
+        "storeType": store.resource_type,
+        "typename": "%s:%s" % (workspace.name.encode('utf-8'), resource.name.encode('utf-8')),
+        "title": resource.title or 'No title provided',
+        "abstract": resource.abstract or 'No abstract provided',
+        "owner": owner,
+        "uuid": str(uuid.uuid4())
+    })
+    with jobs.immediate():
+        layer.save()
+    # recalculate the layer statistics
+    set_attributes(layer, overwrite=True)
+    if created:
+        layer.set_default_permissions()
+
+    # taken after the save, which sends the GeoNode metadata to GeoServer
+    resource.fetch()
+    digest = gs_fingerprint(resource)
+    if not LayerFingerprint.objects.filter(layer=layer).update(digest=digest):
+        LayerFingerprint.objects.create(layer=layer, digest=digest)
+    return 'created' if created else 'updated'
+
+def _thread_resource(resource):
+    """A copy of the resource bound to the catalog of the current thread,
+       keeping the document already loaded. gsconfig resources fetch through
+       the catalog they were listed from, whose connection and response
+       cache the worker threads must not share.
+    """
+    bound = copy.copy(resource)
+    bound.catalog = get_catalog()
+    return bound
+
+def _slurp_worker(task):
+    """Runs _slurp_resource for gs_slurp, returns the resource, the status
+       of the layer and the exception info if it failed
+    """
+    try:
+        status = _slurp_resource(_thread_resource(task[0]), *task[1:])
+    except Exception:
+        return task[0], None, sys.exc_info()
+    finally:
+        if threading.current_thread().name != 'MainThread':
+            # the connection of a pool thread is not closed by Django
+            connection.close()
+    return task[0], status, None
+
+def _deleted_layers(layers, resources):
+    """The layers that match none of the GeoServer resources on name,
+       workspace and store
+    """
+    in_geoserver = set()
+    for resource in resources:
+        in_geoserver.add((resource.name, resource.store.workspace.name, resource.store.name))
+    deleted_layers = []
+    for layer in layers:
+        logger.debug("GeoNode Layer info: name: %s, workspace: %s, store: %s", layer.name, layer.workspace, layer.store)
+        if (layer.name, layer.workspace, layer.store) not in in_geoserver:
+            logger.debug("----- Layer %s not matched, marked for deletion ---------------", layer.name)
+            deleted_layers.append(layer)
+    return deleted_layers
+
+def gs_slurp(ignore_errors=True, verbosity=1, console=None, owner=None, workspace=None, store=None, filter=None, skip_unadvertised=False, remove_deleted=False, workers=1, force=False):
     """Configure the layers available in GeoServer in GeoNode.
 
        It returns a list of dictionaries with the name of the layer,
        the result of the operation and the errors and traceback if it failed.
+       The resources are processed by a pool of workers threads, skipping the
+       layers whose GeoServer configuration did not change unless force.
     """
 
-    # avoid circular import problem
-    from geonode.layers.models import set_attributes
-
     if console is None:
         console = open(os.devnull, 'w')
 
     if verbosity > 1:
         print >> console, "Inspecting the available layers in GeoServer ..."
-    cat = Catalog(ogc_server_settings.internal_rest, _user, _password)
+    cat = get_catalog()
     if workspace is not None:
         workspace = cat.get_workspace(workspace)
         if workspace is None:
@@ -304,50 +505,40 @@ def gs_slurp(ignore_errors=True, verbosity=1, console=None, owner=None, workspac
             'failed':0,
             'updated':0,
             'created':0,
+            'unchanged':0,
             'deleted':0,
         },
         'layers': [],
         'deleted_layers': []
     }
     start = datetime.datetime.now()
-    for i, resource in enumerate(resources):
+    # Avoid circular import problem
+    from geonode.layers.models import LayerFingerprint
+    fingerprints = dict(LayerFingerprint.objects.values_list('layer__name', 'digest'))
+    tasks = [(resource, owner, fingerprints.get(resource.name), force) for resource in resources]
+    if workers > 1:
+        # each worker thread gets its own database connection and, through
+        # get_catalog, its own GeoServer client
+        pool = ThreadPool(workers)
+        results = pool.imap(_slurp_worker, tasks)
+    else:
+        pool = None
+        results = imap(_slurp_worker, tasks)
+    for i, (resource, status, exc_info) in enumerate(results):
         name = resource.name
-        store = resource.store
-        workspace = store.workspace
-        try:
-            # Avoid circular import problem
-            from geonode.layers.models import Layer
-            layer, created = Layer.objects.get_or_create(name=name, defaults = {
-                "workspace": workspace.name,
-                "store": store.name,
-                "storeType": store.resource_type,
-                "typename": "%s:%s" % (workspace.name.encode('utf-8'), resource.name.encode('utf-8')),
-                "title": resource.title or 'No title provided',
-                "abstract": resource.abstract or 'No abstract provided',
-                "owner": owner,
-                "uuid": str(uuid.uuid4())
-            })
-            layer.save()
-            # recalculate the layer statistics
-            set_attributes(layer, overwrite=True)
-
-        except Exception, e:
+        if exc_info is not None:
             if ignore_errors:
                 status = 'failed'
-                exception_type, error, traceback = sys.exc_info()
+                exception_type, error, traceback = exc_info
             else:
+                if pool is not None:
+                    pool.terminate()
                 if verbosity > 0:
                     msg = "Stopping process because --ignore-errors was not set and an error was found."
                     print >> sys.stderr, msg
-                raise Exception('Failed to process %s' % resource.name.encode('utf-8'), e), None, sys.exc_info()[2]
+                raise Exception('Failed to process %s' % resource.name.encode('utf-8'), exc_info[1]), None, exc_info[2]
         else:
-            if created:
-                layer.set_default_permissions()
-                status = 'created'
-                output['stats']['created']+=1
-            else:
-                status = 'updated'
-                output['stats']['updated']+=1
+            output['stats'][status]+=1
 
         msg = "[%s] Layer %s (%d/%d)" % (status, name, i+1, number)
         info = {'name': name, 'status': status}
@@ -359,6 +550,9 @@ def gs_slurp(ignore_errors=True, verbosity=1, console=None, owner=None, workspac
         output['layers'].append(info)
         if verbosity > 0:
             print >> console, msg
+    if pool is not None:
+        pool.close()
+        pool.join()
     
     if remove_deleted:
         from geonode.layers.models import Layer
@@ -375,54 +569,45 @@ def gs_slurp(ignore_errors=True, verbosity=1, console=None, owner=None, workspac
         # compare the list of GeoNode layers obtained via query/filter with valid resources found in GeoServer 
         # filtered per options passed to updatelayers: --workspace, --store, --skip-unadvertised
         # add any layers not found in GeoServer to deleted_layers (must match workspace and store as well):
-        deleted_layers = []
-        for layer in q:
-            logger.debug("GeoNode Layer info: name: %s, workspace: %s, store: %s", layer.name, layer.workspace, layer.store)
-            layer_found_in_geoserver = False
-            for resource in resources_for_delete_compare:
-                #if layer.name matches a GeoServer resource, check also that workspace and store match, mark valid:
-                if layer.name == resource.name:
-                    if layer.workspace == resource.workspace.name and layer.store == resource.store.name:
-                        logger.debug("Matches GeoServer layer: name: %s, workspace: %s, store: %s", resource.name,resource.workspace.name, resource.store.name)
-                        layer_found_in_geoserver = True
-            if not layer_found_in_geoserver: 
-                logger.debug("----- Layer %s not matched, marked for deletion ---------------", layer.name)
-                deleted_layers.append(layer)
+        deleted_layers = _deleted_layers(q, resources_for_delete_compare)
         
         number_deleted = len(deleted_layers)
         if verbosity > 1:
             msg = "\nFound %d layers to delete, starting processing" % number_deleted if number_deleted > 0 else "\nFound %d layers to delete" % number_deleted
             print >> console, msg
-        
-        for i, layer in enumerate(deleted_layers):
-            logger.debug("GeoNode Layer to delete: name: %s, workspace: %s, store: %s", layer.name, layer.workspace, layer.store)
-            try:
-                from geonode.layers.models import geoserver_pre_delete
-                #delete ratings, comments, and taggit tags:
-                ct = ContentType.objects.get_for_model(layer)
-                OverallRating.objects.filter(content_type = ct, object_id = layer.id).delete()
-                Comment.objects.filter(content_type = ct, object_id = layer.id).delete()
-                layer.keywords.clear()
-                
-                pre_delete.disconnect(geoserver_pre_delete, sender=Layer)
-                layer.delete()
-                output['stats']['deleted']+=1
-                status = "delete_succeeded"
-            except Exception, e:
-                status = "delete_failed"
-            finally:
-                pre_delete.connect(geoserver_pre_delete, sender=Layer)
-            
-            msg = "[%s] Layer %s (%d/%d)" % (status, layer.name, i+1, number_deleted)
-            info = {'name': layer.name, 'status': status}
-            if status == "delete_failed":
-                exception_type, error, traceback = sys.exc_info()
-                info['traceback'] = traceback
-                info['exception_type'] = exception_type
-                info['error'] = error
-            output['deleted_layers'].append(info)
-            if verbosity > 0:
-                print >> console, msg
+
+        if deleted_layers:
+            #delete ratings, comments, and taggit tags of all the layers at once:
+            ct = ContentType.objects.get_for_model(Layer)
+            ids = [layer.id for layer in deleted_layers]
+            OverallRating.objects.filter(content_type = ct, object_id__in = ids).delete()
+            Comment.objects.filter(content_type = ct, object_id__in = ids).delete()
+            TaggedItem.objects.filter(content_type = ct, object_id__in = ids).delete()
+
+        from geonode.layers.models import geoserver_pre_delete
+        pre_delete.disconnect(geoserver_pre_delete, sender=Layer)
+        try:
+            for i, layer in enumerate(deleted_layers):
+                logger.debug("GeoNode Layer to delete: name: %s, workspace: %s, store: %s", layer.name, layer.workspace, layer.store)
+                try:
+                    layer.delete()
+                    output['stats']['deleted']+=1
+                    status = "delete_succeeded"
+                except Exception, e:
+                    status = "delete_failed"
+
+                msg = "[%s] Layer %s (%d/%d)" % (status, layer.name, i+1, number_deleted)
+                info = {'name': layer.name, 'status': status}
+                if status == "delete_failed":
+                    exception_type, error, traceback = sys.exc_info()
+                    info['traceback'] = traceback
+                    info['exception_type'] = exception_type
+                    info['error'] = error
+                output['deleted_layers'].append(info)
+                if verbosity > 0:
+                    print >> console, msg
+        finally:
+            pre_delete.connect(geoserver_pre_delete, sender=Layer)
 
     finish = datetime.datetime.now()
     td = finish - start
@@ -430,7 +615,7 @@ def gs_slurp(ignore_errors=True, verbosity=1, console=None, owner=None, workspac
     return output
 
 def get_stores(store_type = None):
-    cat = Catalog(ogc_server_settings.internal_rest, _user, _password)
+    cat = get_catalog()
     stores = cat.get_stores()
     store_list = []
     for store in stores:
@@ -174,42 +174,100 @@ class _Client(object):
         fields is a sequence of (name, value) elements for regular form fields.
         files is a sequence of name or (name,filename) or (name, filename, value) 
         elements for data to be uploaded as files
-        
+
+        files given by name are streamed from disk while the request is sent
         """
-        BOUNDARY = '----------ThIs_Is_tHe_bouNdaRY_$'
-        CRLF = '\r\n'
-        L = []
         _logger.info("post_multipart %s %s %s",url,files,fields)
+        body = _MultipartBody(files, fields)
+        return self._request(
+            url, 'POST', body, {
+                'Content-Type' : 'multipart/form-data; boundary=%s' % body.BOUNDARY,
+                'Content-Length' : str(len(body)),
+            }
+        )
+
+
+class _MultipartBody(object):
+    """multipart/form-data request body, a file-like object reading the
+    files from disk as it is sent so that they are never all in memory"""
+
+    BOUNDARY = '----------ThIs_Is_tHe_bouNdaRY_$'
+    CRLF = '\r\n'
+    CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, files, fields=[]):
+        # strings sent as they are and paths of files sent in chunks
+        self.parts = []
         for (key, value) in fields:
-            L.append('--' + BOUNDARY)
-            L.append('Content-Disposition: form-data; name="%s"' % str(key))
-            L.append('')
-            L.append(str(value))
+            self.parts.append(self.CRLF.join([
+                '--' + self.BOUNDARY,
+                'Content-Disposition: form-data; name="%s"' % str(key),
+                '',
+                str(value),
+                '']))
         for fpair in files:
             if isinstance(fpair,basestring):
                 fpair = (fpair,fpair)
             key = fpair[0]
             if len(fpair) == 2:
                 filename = os.path.basename(fpair[1])
-                fp = open(fpair[1])
-                value = fp.read()
-                fp.close()
+                value = _FilePart(fpair[1])
             else:
                 filename, value = fpair[1:]
-            L.append('--' + BOUNDARY)
-            L.append('Content-Disposition: form-data; name="%s"; filename="%s"' % (str(key), str(filename)))
-            L.append('Content-Type: %s' % _get_content_type(filename))
-            L.append('')
-            L.append(value)
-        L.append('--' + BOUNDARY + '--')
-        L.append('')
-        return self._request(
-            url, 'POST', CRLF.join(L), {
-                'Content-Type' : 'multipart/form-data; boundary=%s' % BOUNDARY
-            }
-        )
-        
-        
+            self.parts.append(self.CRLF.join([
+                '--' + self.BOUNDARY,
+                'Content-Disposition: form-data; name="%s"; filename="%s"' % (str(key), str(filename)),
+                'Content-Type: %s' % _get_content_type(filename),
+                '',
+                '']))
+            self.parts.append(value)
+            self.parts.append(self.CRLF)
+        self.parts.append('--' + self.BOUNDARY + '--' + self.CRLF)
+        self.length = sum([len(part) for part in self.parts])
+        self.chunks = self._chunks()
+        self.buffer = ''
+
+    def __len__(self):
+        return self.length
+
+    def __repr__(self):
+        return '<multipart body of %d bytes>' % self.length
+
+    def _chunks(self):
+        for part in self.parts:
+            if isinstance(part, _FilePart):
+                with open(part.path, 'rb') as fp:
+                    while True:
+                        chunk = fp.read(self.CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        yield chunk
+            else:
+                yield part
+
+    def read(self, size=-1):
+        while size < 0 or len(self.buffer) < size:
+            try:
+                self.buffer += next(self.chunks)
+            except StopIteration:
+                break
+        if size < 0:
+            data, self.buffer = self.buffer, ''
+        else:
+            data, self.buffer = self.buffer[:size], self.buffer[size:]
+        return data
+
+
+class _FilePart(object):
+    """a file of a multipart body, read when the body is sent"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __len__(self):
+        return os.path.getsize(self.path)
+
+
 def _get_content_type(filename):
     return mimetypes.guess_type(filename)[0] or 'application/octet-stream'
 
@@ -23,6 +23,7 @@ import tempfile
 import taggit
 
 from django import forms
+from django.core.files.move import file_move_safe
 from django.utils import simplejson as json
 from django.utils.translation import ugettext_lazy as _
 
@@ -109,8 +110,13 @@ class LayerUploadForm(forms.Form):
         tempdir = tempfile.mkdtemp()
         for field in self.spatial_files:
             f = self.cleaned_data[field]
-            if f is not None:
-                path = os.path.join(tempdir, f.name)
+            if f is None:
+                continue
+            path = os.path.join(tempdir, f.name)
+            if hasattr(f, 'temporary_file_path'):
+                # large and chunked uploads are already on disk
+                file_move_safe(f.temporary_file_path(), path)
+            else:
                 with open(path, 'w') as writable:
                     for c in f.chunks():
                         writable.write(c)
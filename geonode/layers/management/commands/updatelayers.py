@@ -51,7 +51,14 @@ class Command(BaseCommand):
         make_option('-s', '--store', dest="store", default=None,
             help="Only update data the layers for the given geoserver store name"),
         make_option('-w', '--workspace', dest="workspace", default=None,
-            help="Only update data on specified workspace")
+            help="Only update data on specified workspace"),
+        make_option('-j', '--jobs', dest="workers", type="int", default=1,
+            help="Number of layers to process in parallel"),
+        make_option('--force',
+            action='store_true',
+            dest='force',
+            default=False,
+            help='Update the layers even if they did not change in GeoServer.')
         )
 
     def handle(self, **options):
@@ -64,6 +71,8 @@ class Command(BaseCommand):
         workspace = options.get('workspace')
         filter = options.get('filter')
         store = options.get('store')
+        workers = options.get('workers')
+        force = options.get('force')
 
         if verbosity > 0:
             console = sys.stdout
@@ -71,7 +80,8 @@ class Command(BaseCommand):
             console = None
 
         output = gs_slurp(ignore_errors, verbosity=verbosity,
-                owner=owner, console=console, workspace=workspace, store=store, filter=filter, skip_unadvertised=skip_unadvertised, remove_deleted=remove_deleted)
+                owner=owner, console=console, workspace=workspace, store=store, filter=filter, skip_unadvertised=skip_unadvertised, remove_deleted=remove_deleted,
+                workers=workers, force=force)
 
         if verbosity > 1:
             print "\nDetailed report of failures:"
@@ -95,6 +105,7 @@ class Command(BaseCommand):
                                               len(output['layers']), round(output['stats']['duration_sec'],2))
             print "%d Created layers" % output['stats']['created']
             print "%d Updated layers" % output['stats']['updated']
+            print "%d Unchanged layers" % output['stats']['unchanged']
             print "%d Failed layers" % output['stats']['failed']
             try:
                 duration_layer = round(output['stats']['duration_sec'] * 1.0 / len(output['layers']),2)
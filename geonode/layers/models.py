@@ -35,20 +35,21 @@ from django.utils.translation import ugettext, ugettext_lazy as _
 from django.core.urlresolvers import reverse
 
 from geonode import GeoNodeException
+from geonode.base import jobs, thumbnails
 from geonode.base.models import ResourceBase, ResourceBaseManager, Link, \
     resourcebase_post_save, resourcebase_post_delete
 from geonode.utils import _user, _password, get_wms
 from geonode.utils import http_client
-from geonode.geoserver.helpers import cascading_delete
+from geonode.geoserver.helpers import cascading_delete, get_catalog, \
+    datastore_table, datastore_attribute_statistics
 from geonode.people.models import Profile
 from geonode.security.enumerations import AUTHENTICATED_USERS, ANONYMOUS_USERS
-from geonode.layers.ows import wcs_links, wfs_links, wms_links, \
+from geonode.layers.ows import describe_coverage, wcs_links, wfs_links, wms_links, \
     wps_execute_layer_attribute_statistics
 from geonode.layers.enumerations import LAYER_ATTRIBUTE_NUMERIC_DATA_TYPES
 from geonode.utils import ogc_server_settings
 
-from geoserver.catalog import Catalog, FailedRequestError
-from owslib.wcs import WebCoverageService
+from geoserver.catalog import FailedRequestError
 from agon_ratings.models import OverallRating
 
 logger = logging.getLogger("geonode.layers.models")
@@ -68,10 +69,17 @@ class Style(models.Model):
 
 class LayerManager(ResourceBaseManager):
 
-    def __init__(self):
-        models.Manager.__init__(self)
-        url = ogc_server_settings.rest
-        self.gs_catalog = Catalog(url, _user, _password)
+    def _get_gs_catalog(self):
+        return getattr(self, '_gs_catalog', None) or get_catalog(ogc_server_settings.rest)
+
+    def _set_gs_catalog(self, catalog):
+        self._gs_catalog = catalog
+
+    def _del_gs_catalog(self):
+        self._gs_catalog = None
+
+    # catalog shared by the current thread, can be overridden (ie. in tests)
+    gs_catalog = property(_get_gs_catalog, _set_gs_catalog, _del_gs_catalog)
 
 def add_bbox_query(q, bbox):
     '''modify the queryset q to limit to the provided bbox
@@ -105,6 +113,12 @@ class Layer(ResourceBase):
     default_style = models.ForeignKey(Style, related_name='layer_default_style', null=True, blank=True)
     styles = models.ManyToManyField(Style, related_name='layer_styles')
 
+    @property
+    def sync_status(self):
+        """Status of the GeoServer synchronization of the layer, one of
+        pending, running, done, failed or None"""
+        return jobs.status(self, 'geoserver_sync')
+
     def update_thumbnail(self, save=True):
         try:
             self.save_thumbnail(self._thumbnail_url(width=200, height=150), save)
@@ -119,6 +133,14 @@ class Layer(ResourceBase):
         return content
 
 
+    def _thumbnail_digest(self, spec):
+        """ The image also depends on the extent and the default style """
+        style = self.default_style
+        parts = [spec, self.bbox_string]
+        if style is not None:
+            parts.extend([style.name, style.sld_body or ''])
+        return super(Layer, self)._thumbnail_digest(u'\n'.join(parts))
+
     def _thumbnail_url(self, width=20, height=None):
         """ Generate a URL representing thumbnail of the layer """
 
@@ -142,11 +164,10 @@ class Layer(ResourceBase):
         """Makes sure the state of the layer is consistent in GeoServer and Catalogue.
         """
 
-        # Check the layer is in the wms get capabilities record
-        # FIXME: Implement caching of capabilities record site wide
-
-        _local_wms = get_wms()
-        record = _local_wms.contents.get(self.typename)
+        # Check the layer is in the wms get capabilities record, the layer
+        # scoped one as the layer may have just been added
+        _local_wms = get_wms(layer=self.typename)
+        record = _local_wms.contents.get(self.typename) or _local_wms.contents.get(self.name)
         if record is None:
             msg = "WMS Record missing for layer [%s]" % self.typename.encode('utf-8')
             raise GeoNodeException(msg)
@@ -284,6 +305,16 @@ class Attribute(models.Model):
     def unique_values_as_list(self):
         return self.unique_values.split(',')
 
+
+class LayerFingerprint(models.Model):
+    """
+        Digest of the GeoServer configuration of a layer as of the last
+        updatelayers run, layers whose digest did not change are skipped.
+        See geonode.geoserver.helpers.gs_fingerprint.
+    """
+    layer = models.OneToOneField(Layer, related_name='fingerprint')
+    digest = models.CharField(max_length=40)
+
 def geoserver_pre_delete(instance, sender, **kwargs):
     """Removes the layer from GeoServer
     """
@@ -333,7 +364,26 @@ def post_delete_layer(instance, sender, **kwargs):
     if instance.default_style and Layer.objects.filter(default_style__id=instance.default_style.id).count() == 0:
         instance.default_style.delete()
 
-def geoserver_pre_save(instance, sender, **kwargs):
+# fields geoserver_sync gets from GeoServer. Not the thumbnail, which the
+# thumbnail job may have replaced since the sync loaded the layer.
+GEOSERVER_SYNC_FIELDS = ['bbox_x0', 'bbox_x1', 'bbox_y0', 'bbox_y1', 'default_style']
+# saving only these fields does not need a new synchronization: the saves
+# of geoserver_sync, of the thumbnail job and of the catalogue
+_NO_SYNC_FIELDS = set(GEOSERVER_SYNC_FIELDS + ['thumbnail', 'metadata_xml', 'csw_anytext', 'csw_wkt_geometry'])
+
+def geoserver_post_save(instance, sender, **kwargs):
+    """Queue the synchronization of the layer with GeoServer.
+
+       It runs in the background (see geoserver_sync) so saving a layer
+       does not wait for the dozen of GeoServer requests it involves.
+    """
+    update_fields = kwargs.get('update_fields')
+    if update_fields and set(update_fields) <= _NO_SYNC_FIELDS:
+        return
+    jobs.enqueue('geoserver_sync', instance)
+
+@jobs.register('geoserver_sync')
+def geoserver_sync(layer_id):
     """Send information to geoserver.
 
        The attributes sent include:
@@ -344,20 +394,13 @@ def geoserver_pre_save(instance, sender, **kwargs):
         * Keywords
         * Metadata Links,
         * Point of Contact name and url
+
+       Errors are raised so the job is retried, its status is available
+       as Layer.sync_status.
     """
-    url = ogc_server_settings.internal_rest
-    try:
-        gs_catalog = Catalog(url, _user, _password)
-        gs_resource = gs_catalog.get_resource(instance.name)
-    except (EnvironmentError, FailedRequestError) as e:
-        gs_resource = None
-        msg = ('Could not connect to geoserver at "%s"'
-               'to save information for layer "%s"' % (
-                ogc_server_settings.LOCATION, instance.name.encode('utf-8'))
-              )
-        logger.warn(msg, e)
-        # If geoserver is not online, there is no need to continue
-        return
+    instance = Layer.objects.get(pk=layer_id)
+    gs_catalog = get_catalog()
+    gs_resource = gs_catalog.get_resource(instance.name)
 
     # If there is no resource returned it could mean one of two things:
     # a) There is a synchronization problem in geoserver
@@ -365,12 +408,12 @@ def geoserver_pre_save(instance, sender, **kwargs):
     # background.
     # For both cases it is sensible to stop processing the layer
     if gs_resource is None:
-        logger.warn('Could not get geoserver resource for %s' % instance)
-        return
+        raise GeoNodeException('Could not get geoserver resource for %s' % instance)
 
     gs_resource.title = instance.title
     gs_resource.abstract = instance.abstract
     gs_resource.name= instance.name
+    gs_resource.keywords = instance.keyword_list()
 
     # Get metadata links
     metadata_links = []
@@ -415,44 +458,6 @@ def geoserver_pre_save(instance, sender, **kwargs):
     instance.bbox_y0 = bbox[2]
     instance.bbox_y1 = bbox[3]
 
-    instance.update_thumbnail(save=False)
-
-
-def geoserver_post_save(instance, sender, **kwargs):
-    """Save keywords to GeoServer
-
-       The way keywords are implemented requires the layer
-       to be saved to the database before accessing them.
-    """
-    url = ogc_server_settings.internal_rest
-
-    try:
-        gs_catalog = Catalog(url, _user, _password)
-        gs_resource = gs_catalog.get_resource(instance.name)
-    except (FailedRequestError, EnvironmentError) as e:
-        msg = ('Could not connect to geoserver at "%s"'
-               'to save information for layer "%s"' % (
-                ogc_server_settings.LOCATION, instance.name.encode('utf-8'))
-              )
-        logger.warn(msg, e)
-        # If geoserver is not online, there is no need to continue
-        return
-
-    # If there is no resource returned it could mean one of two things:
-    # a) There is a synchronization problem in geoserver
-    # b) The unit tests are running and another geoserver is running in the
-    # background.
-    # For both cases it is sensible to stop processing the layer
-    if gs_resource is None:
-        logger.warn('Could not get geoserver resource for %s' % instance)
-        return
-
-    gs_resource.keywords = instance.keyword_list()
-    #gs_resource should only be called if ogc_server_settings.BACKEND_WRITE_ENABLED == True
-    if getattr(ogc_server_settings,"BACKEND_WRITE_ENABLED", True):
-        gs_catalog.save(gs_resource)
-
-    bbox = gs_resource.latlon_bbox
     dx = float(bbox[1]) - float(bbox[0])
     dy = float(bbox[3]) - float(bbox[2])
 
@@ -462,115 +467,52 @@ def geoserver_post_save(instance, sender, **kwargs):
     width = int(height * dataAspect)
 
     # Set download links for WMS, WCS or WFS and KML
+    links = []
+
+    def add_link(link_type, extension, name, mime, url):
+        links.append(dict(link_type=link_type, extension=extension,
+                          name=unicode(name), mime=mime, url=url))
 
     #links = wms_links(ogc_server_settings.public_url + 'wms?',
-    links = wms_links(instance.ows_url + 'wms?',
+    for ext, name, mime, wms_url in wms_links(instance.ows_url + 'wms?',
                     instance.typename.encode('utf-8'), instance.bbox_string,
-                    instance.srid, height, width)
-
-    for ext, name, mime, wms_url in links:
-        Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                        name=ugettext(name),
-                        defaults=dict(
-                            extension=ext,
-                            url=wms_url,
-                            mime=mime,
-                            link_type='image',
-                           )
-                        )
+                    instance.srid, height, width):
+        add_link('image', ext, name, mime, wms_url)
 
     legend_url = instance.ows_url +'wms?request=GetLegendGraphic&format=image/png&WIDTH=20&HEIGHT=20&LAYER='+instance.typename+'&legend_options=fontAntiAliasing:true;fontSize:12;forceLabels:on'
+    add_link('image', 'png', ugettext('Legend'), 'image/png', legend_url)
 
-    Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                        url=legend_url,
-                        defaults=dict(
-                            extension='png',
-                            name=_('Legend'),
-                            url=legend_url,
-                            mime='image/png',
-                            link_type='image',
-                        )
-                    )
-                    
     if instance.storeType == "dataStore":
         #links = wfs_links(ogc_server_settings.public_url + 'wfs?', instance.typename.encode('utf-8'))
-        links = wfs_links(instance.ows_url + 'wfs?', instance.typename.encode('utf-8'))
-        for ext, name, mime, wfs_url in links:
+        for ext, name, mime, wfs_url in wfs_links(instance.ows_url + 'wfs?', instance.typename.encode('utf-8')):
             if mime=='SHAPE-ZIP':
                 name = 'Zipped Shapefile'
-            Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                            url=wfs_url,
-                            defaults=dict(
-                                extension=ext,
-                                name=name,
-                                mime=mime,
-                                url=wfs_url,
-                                link_type='data',
-                            )
-                        )
-
+            add_link('data', ext, name, mime, wfs_url)
 
     elif instance.storeType == 'coverageStore':
-        #FIXME(Ariel): This works for public layers, does it work for restricted too?
-        # would those end up with no geotiff links, like, forever?
-        permissions = {}
-        permissions['anonymous'] = instance.get_gen_level(ANONYMOUS_USERS)
-        permissions['authenticated'] = instance.get_gen_level(AUTHENTICATED_USERS)
-        instance.set_gen_level(ANONYMOUS_USERS,'layer_readonly')
-
         #Potentially 3 dimensions can be returned by the grid if there is a z
         #axis.  Since we only want width/height, slice to the second dimension
-        covWidth, covHeight = get_coverage_grid_extent(instance)[:2]
+        covWidth, covHeight = get_coverage_grid_extent(instance, refresh=True)[:2]
         #links = wcs_links(ogc_server_settings.public_url + 'wcs?', instance.typename.encode('utf-8'),
-        links = wcs_links(instance.ows_url + 'wcs?', instance.typename.encode('utf-8'),
+        for ext, name, mime, wcs_url in wcs_links(instance.ows_url + 'wcs?', instance.typename.encode('utf-8'),
                           bbox=gs_resource.native_bbox[:-1],
                           crs=gs_resource.native_bbox[-1],
-                          height=str(covHeight), width=str(covWidth))
-        for ext, name, mime, wcs_url in links:
-            Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                                url=wcs_url,
-                                defaults=dict(
-                                    extension=ext,
-                                    name=name,
-                                    mime=mime,
-                                    link_type='data',
-                                )
-                            )
-
-        instance.set_gen_level(ANONYMOUS_USERS,permissions['anonymous'])
-        instance.set_gen_level(AUTHENTICATED_USERS,permissions['authenticated'])
+                          height=str(covHeight), width=str(covWidth)):
+            add_link('data', ext, name, mime, wcs_url)
 
     #kml_reflector_link_download = ogc_server_settings.public_url + "wms/kml?" + urllib.urlencode({
     kml_reflector_link_download = instance.ows_url + "wms/kml?" + urllib.urlencode({
         'layers': instance.typename.encode('utf-8'),
         'mode': "download"
     })
-
-    Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                        url=kml_reflector_link_download,
-                        defaults=dict(
-                            extension='kml',
-                            name=_("KML"),
-                            mime='text/xml',
-                            link_type='data',
-                        )
-                    )
+    add_link('data', 'kml', ugettext('KML'), 'text/xml', kml_reflector_link_download)
 
     #kml_reflector_link_view = ogc_server_settings.public_url + "wms/kml?" + urllib.urlencode({
     kml_reflector_link_view = instance.ows_url + "wms/kml?" + urllib.urlencode({
         'layers': instance.typename.encode('utf-8'),
         'mode': "refresh"
     })
-
-    Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                        url=kml_reflector_link_view,
-                        defaults=dict(
-                            extension='kml',
-                            name="View in Google Earth",
-                            mime='text/xml',
-                            link_type='data',
-                        )
-                    )
+    add_link('data', 'kml', 'View in Google Earth', 'text/xml', kml_reflector_link_view)
 
     #tile_url = ('%sgwc/service/gmaps?' % ogc_server_settings.public_url +
     tile_url = ('%sgwc/service/gmaps?' % instance.ows_url +
@@ -578,75 +520,22 @@ def geoserver_post_save(instance, sender, **kwargs):
                 '&zoom={z}&x={x}&y={y}' +
                 '&format=image/png8'
                 )
-
-    Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                        url=tile_url,
-                        defaults=dict(
-                            extension='tiles',
-                            name=_("Tiles"),
-                            mime='image/png',
-                            link_type='image',
-                            )
-                        )
-
+    add_link('image', 'tiles', ugettext('Tiles'), 'image/png', tile_url)
 
     html_link_url = '%s%s' % (settings.SITEURL[:-1], instance.get_absolute_url())
-
-    Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                        url=html_link_url,
-                        defaults=dict(
-                            extension='html',
-                            name=instance.typename,
-                            mime='text/html',
-                            link_type='html',
-                            )
-                        )
+    add_link('html', 'html', instance.typename, 'text/html', html_link_url)
 
     # new stuff here
-    ogc_wms_url = ogc_server_settings.public_url + 'wms?'
-    Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                        url=ogc_wms_url,
-                        defaults=dict(
-                            extension='html',
-                            name=instance.name,
-                            url=ogc_wms_url,
-                            mime='text/html',
-                            link_type='OGC:WMS',
-                        )
-                    )
-                        
+    add_link('OGC:WMS', 'html', instance.name, 'text/html', ogc_server_settings.public_url + 'wms?')
     if instance.storeType == "dataStore":
-        ogc_wfs_url = ogc_server_settings.public_url + 'wfs?'
-        Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                            url=ogc_wfs_url,
-                            defaults=dict(
-                                extension='html',
-                                name=instance.name,
-                                url=ogc_wfs_url,
-                                mime='text/html',
-                                link_type='OGC:WFS',
-                            )
-                        )
-
+        add_link('OGC:WFS', 'html', instance.name, 'text/html', ogc_server_settings.public_url + 'wfs?')
     if instance.storeType == "coverageStore":
-        ogc_wcs_url = ogc_server_settings.public_url + 'wcs?'
-        Link.objects.get_or_create(resource= instance.resourcebase_ptr,
-                            url=ogc_wcs_url,
-                            defaults=dict(
-                                extension='html',
-                                name=instance.name,
-                                url=ogc_wcs_url,
-                                mime='text/html',
-                                link_type='OGC:WCS',
-                            )
-                        )
-    #remove links that belong to and old address
-
-    for link in instance.link_set.all():
-        if not urlparse(settings.SITEURL).hostname == urlparse(link.url).hostname and not \
-                    urlparse(instance.ows_url).hostname == urlparse(link.url).hostname:
-                    #urlparse(ogc_server_settings.public_url).hostname == urlparse(link.url).hostname:
-            link.delete()
+        add_link('OGC:WCS', 'html', instance.name, 'text/html', ogc_server_settings.public_url + 'wcs?')
+
+    # create, update and remove the links in bulk, including the ones that
+    # belong to an old address
+    hosts = [urlparse(settings.SITEURL).hostname, urlparse(instance.ows_url).hostname]
+    Link.objects.reconcile(instance.resourcebase_ptr, links, hosts=hosts)
 
     #Save layer attributes
     set_attributes(instance)
@@ -654,6 +543,11 @@ def geoserver_post_save(instance, sender, **kwargs):
     #Save layer styles
     set_styles(instance, gs_catalog)
 
+    instance.save(update_fields=GEOSERVER_SYNC_FIELDS)
+
+    # once GeoServer serves the layer
+    thumbnails.enqueue(instance)
+
 
 def set_styles(layer, gs_catalog):
     style_set = []
@@ -713,16 +607,39 @@ def get_attribute_statistics(layer_name, field):
         logger.exception('Error generating layer aggregate statistics')
 
 
-def get_coverage_grid_extent(instance):
+def get_attributes_statistics(layer, fields):
+    """
+    Generate statistics for several attributes of the layer, with a couple
+    of queries when it is stored in the PostGIS datastore, or WPS requests
+    for each field otherwise. Returns a dict of field name to statistics.
+    """
+
+    if not fields:
+        return {}
+    if ogc_server_settings.DATASTORE and layer.store == ogc_server_settings.DATASTORE:
+        logger.debug('Deriving aggregate statistics for %s from the datastore', layer.name)
+        try:
+            resource = get_catalog().get_resource(layer.name, workspace=layer.workspace)
+            schema, table = datastore_table(resource)
+            return datastore_attribute_statistics(table, fields, schema)
+        except Exception:
+            logger.exception('Error generating layer aggregate statistics from the datastore')
+
+    results = {}
+    for field in fields:
+        result = get_attribute_statistics(layer.name, field)
+        if result is not None:
+            results[field] = result
+    return results
+
+
+def get_coverage_grid_extent(instance, refresh=False):
     """
         Returns a list of integers with the size of the coverage
         extent in pixels
     """
 
-    wcs = WebCoverageService(instance.ows_url + 'wcs', '1.0.0')
-    grid = wcs.contents[instance.workspace + ':' + instance.name].grid
-    return [(int(h) - int(l) + 1) for
-            h, l in zip(grid.highlimits, grid.lowlimits)]
+    return describe_coverage(instance.typename.encode('utf-8'), refresh=refresh).grid_extent
 
 
 def set_attributes(layer, overwrite=False):
@@ -763,62 +680,73 @@ def set_attributes(layer, overwrite=False):
         except Exception:
             attribute_map = []
     elif layer.storeType == "coverageStore":
-        dc_url = ogc_server_settings.LOCATION + "wcs?" + urllib.urlencode({
-            "service": "wcs",
-            "version": "1.1.0",
-            "request": "DescribeCoverage",
-            "identifiers": layer.typename.encode('utf-8')
-        })
         try:
-            response, body = http.request(dc_url)
-            doc = etree.fromstring(body)
-            path = ".//{wcs}Axis/{wcs}AvailableKeys/{wcs}Key".format(wcs="{http://www.opengis.net/wcs/1.1.1}")
-            attribute_map = [[n.text,"raster"] for n in doc.findall(path)]
+            keys = describe_coverage(layer.typename.encode('utf-8')).keys
+            attribute_map = [[key, "raster"] for key in keys]
         except Exception:
             attribute_map = []
 
+    save_attributes(layer, attribute_map, overwrite)
+
+
+def save_attributes(layer, attribute_map, overwrite=False):
+    """
+    Store the [name, type] pairs of attribute_map as the attributes of the
+    layer, with the statistics of the new numeric ones
+    """
     attributes = layer.attribute_set.all()
     # Delete existing attributes if they no longer exist in an updated layer
+    fields = set(field for field, ftype in attribute_map)
+    stale = []
     for la in attributes:
-        lafound = False
-        for field, ftype in attribute_map:
-            if field == la.attribute:
-                lafound = True
-        if overwrite or not lafound:
+        if overwrite or la.attribute not in fields:
             logger.debug("Going to delete [%s] for [%s]", la.attribute, layer.name.encode('utf-8'))
-            la.delete()
+            stale.append(la.pk)
+    if stale:
+        Attribute.objects.filter(pk__in=stale).delete()
 
     # Add new layer attributes if they don't already exist
     if attribute_map is not None:
-        iter = len(Attribute.objects.filter(layer=layer)) + 1
+        existing = set(layer.attribute_set.values_list('attribute', 'attribute_type'))
+        iter = len(existing) + 1
+        new = []
         for field, ftype in attribute_map:
-            if field is not None:
-                la, created = Attribute.objects.get_or_create(layer=layer, attribute=field, attribute_type=ftype)
-                if created:
-                    if is_layer_attribute_aggregable(layer.storeType, field, ftype):
-                        logger.debug("Generating layer attribute statistics")
-                        result = get_attribute_statistics(layer.name, field)
-                        if result is not None:
-                            la.count = result['Count']
-                            la.min = result['Min']
-                            la.max = result['Max']
-                            la.average = result['Average']
-                            la.median = result['Median']
-                            la.stddev = result['StandardDeviation']
-                            la.sum = result['Sum']
-                            la.unique_values = result['unique_values']
-                            la.last_stats_updated = datetime.now()
-                    la.attribute_label = field.title()
-                    la.visible = ftype.find("gml:") != 0
-                    la.display_order = iter
-                    la.save()
-                    iter += 1
-                    logger.debug("Created [%s] attribute for [%s]", field, layer.name.encode('utf-8'))
+            if field is not None and (field, ftype) not in existing:
+                existing.add((field, ftype))
+                new.append((field, ftype))
+
+        # statistics of all the numeric attributes at once
+        logger.debug("Generating layer attribute statistics")
+        statistics = get_attributes_statistics(layer, [field for field, ftype in new
+                if is_layer_attribute_aggregable(layer.storeType, field, ftype)])
+
+        created = []
+        for field, ftype in new:
+            la = Attribute(layer=layer, attribute=field, attribute_type=ftype)
+            result = statistics.get(field)
+            if result is not None:
+                la.count = result['Count']
+                la.min = result['Min']
+                la.max = result['Max']
+                la.average = result['Average']
+                la.median = result['Median']
+                la.stddev = result['StandardDeviation']
+                la.sum = result['Sum']
+                la.unique_values = result['unique_values']
+                la.last_stats_updated = datetime.now()
+            la.attribute_label = field.title()
+            la.visible = ftype.find("gml:") != 0
+            la.display_order = iter
+            created.append(la)
+            iter += 1
+            logger.debug("Created [%s] attribute for [%s]", field, layer.name.encode('utf-8'))
+        Attribute.objects.bulk_create(created)
     else:
         logger.debug("No attributes found")
 
+thumbnails.register(Layer)
+
 signals.pre_save.connect(pre_save_layer, sender=Layer)
-signals.pre_save.connect(geoserver_pre_save, sender=Layer)
 signals.pre_delete.connect(geoserver_pre_delete, sender=Layer)
 signals.post_save.connect(geoserver_post_save, sender=Layer)
 signals.pre_delete.connect(pre_delete_layer, sender=Layer)
@@ -23,9 +23,11 @@ from lxml import etree
 from django.conf import settings
 from django.utils.translation import ugettext_lazy as _
 from django.template.loader import render_to_string
-from owslib.wcs import WebCoverageService
-from owslib.coverage.wcsBase import ServiceException
 from owslib.util import http_post
+from collections import OrderedDict
+import base64
+import httplib2
+import time
 import urllib
 from geonode import GeoNodeException
 from geonode.utils import ogc_server_settings
@@ -34,51 +36,129 @@ from re import sub
 logger = logging.getLogger(__name__)
 
 DEFAULT_EXCLUDE_FORMATS = ['PNG', 'JPEG', 'GIF', 'TIFF']
+
+# seconds a coverage description is reused before being fetched again
+COVERAGE_CACHE_TTL = 300
+# coverage descriptions kept at most
+COVERAGE_CACHE_SIZE = 256
+
+_WCS = '{http://www.opengis.net/wcs}'
+_WCS11 = '{http://www.opengis.net/wcs/1.1.1}'
+_GML = '{http://www.opengis.net/gml}'
+
+# (service url, identifier) -> CoverageDescription, oldest first
+_coverages = OrderedDict()
+
+
+def _service_url(wcs_url):
+    """the WCS endpoint to describe coverages from, None for the local
+    GeoServer whatever the address it is reached with"""
+    if wcs_url is None:
+        return None
+    for local in (ogc_server_settings.LOCATION, ogc_server_settings.public_url):
+        if wcs_url.startswith(local):
+            return None
+    return wcs_url
+
+
+def _wcs_request(params, wcs_url=None):
+    """GET a WCS request from the service at wcs_url, by default the local
+    GeoServer. The credentials are sent up front to the local GeoServer
+    only, it answers 'layer not found' instead of challenging"""
+    headers = {}
+    if wcs_url is None:
+        wcs_url = ogc_server_settings.LOCATION + 'wcs?'
+        auth = base64.b64encode('%s:%s' % ogc_server_settings.credentials)
+        headers['Authorization'] = 'Basic ' + auth
+    url = wcs_url + urllib.urlencode(params)
+    response, body = httplib2.Http().request(url, headers=headers)
+    return etree.fromstring(body)
+
+
+class CoverageDescription(object):
+    """Grid extent, formats and CRSs of a coverage, from its WCS 1.0.0
+    DescribeCoverage document, and its range keys (1.1.0) on demand"""
+
+    def __init__(self, identifier, wcs_url=None):
+        self.identifier = identifier
+        self.wcs_url = wcs_url
+        doc = _wcs_request({'service': 'WCS', 'version': '1.0.0',
+                            'request': 'DescribeCoverage', 'coverage': identifier}, wcs_url)
+        envelope = doc.find('.//%sGridEnvelope' % _GML)
+        if envelope is None:
+            raise GeoNodeException('Could not describe coverage "%s": %s' % (
+                identifier, etree.tostring(doc)))
+        self.low = [int(v) for v in envelope.find(_GML + 'low').text.split()]
+        self.high = [int(v) for v in envelope.find(_GML + 'high').text.split()]
+        self.formats = [f.text for f in doc.findall('.//%ssupportedFormats/%sformats' % (_WCS, _WCS))]
+        self.crs = [c.text for c in doc.findall('.//%ssupportedCRSs/%srequestResponseCRSs' % (_WCS, _WCS))]
+        self.fetched = time.time()
+        self._keys = None
+
+    @property
+    def grid_extent(self):
+        """size of the coverage in pixels for each grid dimension"""
+        return [h - l + 1 for h, l in zip(self.high, self.low)]
+
+    @property
+    def keys(self):
+        if self._keys is None:
+            doc = _wcs_request({'service': 'wcs', 'version': '1.1.0',
+                                'request': 'DescribeCoverage', 'identifiers': self.identifier},
+                               self.wcs_url)
+            path = './/{wcs}Axis/{wcs}AvailableKeys/{wcs}Key'.format(wcs=_WCS11)
+            self._keys = [n.text for n in doc.findall(path)]
+        return self._keys
+
+
+def describe_coverage(identifier, refresh=False, wcs_url=None):
+    """The CoverageDescription of a coverage of the WCS service at wcs_url,
+    by default the local GeoServer, shared by the link generation and the
+    attribute discovery"""
+    key = (_service_url(wcs_url), identifier)
+    description = _coverages.get(key)
+    if refresh or description is None or time.time() - description.fetched > COVERAGE_CACHE_TTL:
+        description = CoverageDescription(identifier, key[0])
+        _coverages.pop(key, None)
+        _coverages[key] = description
+        while len(_coverages) > COVERAGE_CACHE_SIZE:
+            _coverages.popitem(last=False)
+    return description
+
+
 def wcs_links(wcs_url, identifier, bbox=None, crs=None, height=None, width=None,
              exclude_formats=True,
              quiet=True, version='1.0.0'):
-    #FIXME(Ariel): This would only work for layers marked for public view,
-    # what about the ones with permissions enabled?
-
     try:
-        wcs = WebCoverageService(wcs_url, version=version)
-    except ServiceException, err:
-        err_msg = 'WCS server returned exception: %s' % err
+        description = describe_coverage(identifier, wcs_url=wcs_url)
+    except Exception, err:
+        msg = ('Could not create WCS links for layer "%s",'
+               ' it could not be described: %s' % (identifier, err))
         if not quiet:
-            logger.warn(err_msg)
-        raise GeoNodeException(err_msg)
-
-    msg = ('Could not create WCS links for layer "%s",'
-           ' it was not in the WCS catalog,'
-           ' the available layers were: "%s"' % (
-            identifier, wcs.contents.keys()))
+            raise RuntimeError(msg)
+        logger.warn(msg)
+        return []
 
     output = []
-    formats = []
-
-    if identifier not in wcs.contents:
-        if not quiet:
-            raise RuntimeError(msg)
-        else:
-            logger.warn(msg)
-    else:
-        coverage = wcs.contents[identifier]
-        formats = coverage.supportedFormats
-        for f in formats:
-            if exclude_formats and f in DEFAULT_EXCLUDE_FORMATS:
-                continue
-            #roundabout, hacky way to accomplish getting a getCoverage url.
-            #nonetheless, it's better than having to load an entire large
-            #coverage just to generate a URL
-            fakeUrl = wcs.getCoverage(identifier=coverage.id, format=f,
-                                      bbox=bbox, crs=crs, height=20,
-                                      width=20).geturl()
-            url = sub(r'(height=)20(\&width=)20', r'\g<1>{0}\g<2>{1}',
-                         fakeUrl).format(height, width)
-            # The outputs are: (ext, name, mime, url)
-            # FIXME(Ariel): Find a way to get proper ext, name and mime
-            # using format as a default for all is not good enough
-            output.append((f, f, f, url))
+    for f in description.formats:
+        if exclude_formats and f in DEFAULT_EXCLUDE_FORMATS:
+            continue
+        params = [('service', 'WCS'), ('version', version), ('request', 'GetCoverage'),
+                  ('coverage', identifier)]
+        if bbox is not None:
+            params.append(('bbox', ','.join([str(x) for x in bbox])))
+        if crs is not None:
+            params.append(('crs', crs))
+        params.append(('format', f))
+        if height is not None:
+            params.append(('height', height))
+        if width is not None:
+            params.append(('width', width))
+        url = wcs_url + urllib.urlencode(params)
+        # The outputs are: (ext, name, mime, url)
+        # FIXME(Ariel): Find a way to get proper ext, name and mime
+        # using format as a default for all is not good enough
+        output.append((f, f, f, url))
     return output
 
 def _wfs_link(wfs_url, identifier, mime, extra_params):
@@ -53,6 +53,33 @@ from .populate_layers_data import create_layer_data
 
 from geoserver.resource import FeatureType, Coverage
 
+class FakeObject(object):
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+class FakeResource(FakeObject):
+    """a gsconfig resource as gs_slurp loads it"""
+    def __init__(self, name, workspace='geonode', store='geonode_data'):
+        from xml.etree.ElementTree import fromstring
+        FakeObject.__init__(self, name=name, enabled='true', advertised='true',
+            store=FakeObject(name=store, workspace=FakeObject(name=workspace)),
+            dom=fromstring('<featureType><name>%s</name></featureType>' % name))
+        self.fetched = 0
+
+    def fetch(self):
+        self.fetched += 1
+
+
+class FakeCatalog(object):
+    """the part of the gsconfig Catalog used by gs_slurp"""
+    def __init__(self, resources):
+        self.resources = resources
+
+    def get_resources(self, workspace=None, store=None):
+        return list(self.resources)
+
+
 class LayersTest(TestCase):
     """Tests geonode.layers app/module
     """
@@ -915,3 +942,213 @@ class LayersTest(TestCase):
         response = c.get(reverse('layer_detail', args=(layer.typename,)))
         self.assertEquals(response.status_code, 200)
 
+
+    def test_shared_catalog(self):
+        import threading
+        from geonode.geoserver.helpers import get_catalog
+        from geonode.utils import ogc_server_settings
+
+        # one catalog per thread and url, reused by every caller
+        cat = get_catalog()
+        self.assertTrue(cat is get_catalog())
+        self.assertTrue(Layer.objects.gs_catalog is get_catalog(ogc_server_settings.rest))
+
+        other = []
+        t = threading.Thread(target=lambda: other.append(get_catalog()))
+        t.start()
+        t.join()
+        # other threads get their own connection but share the response cache
+        self.assertFalse(cat is other[0])
+        self.assertTrue(cat._cache is other[0]._cache)
+
+    def test_coverage_description(self):
+        from lxml import etree
+        import geonode.layers.ows as ows
+        from geonode.utils import ogc_server_settings
+
+        describe = '''<CoverageDescription xmlns="http://www.opengis.net/wcs" xmlns:gml="http://www.opengis.net/gml">
+          <CoverageOffering><domainSet><spatialDomain><gml:RectifiedGrid><gml:limits><gml:GridEnvelope>
+            <gml:low>0 0</gml:low><gml:high>99 49</gml:high>
+          </gml:GridEnvelope></gml:limits></gml:RectifiedGrid></spatialDomain></domainSet>
+          <supportedCRSs><requestResponseCRSs>EPSG:4326</requestResponseCRSs></supportedCRSs>
+          <supportedFormats><formats>GeoTIFF</formats><formats>PNG</formats></supportedFormats>
+          </CoverageOffering></CoverageDescription>'''
+        requests = []
+
+        def fake_request(params, wcs_url=None):
+            requests.append((wcs_url, params))
+            return etree.fromstring(describe)
+
+        real_request, ows._wcs_request = ows._wcs_request, fake_request
+        try:
+            description = ows.describe_coverage('geonode:dem')
+            self.assertEquals(description.grid_extent, [100, 50])
+            self.assertEquals(description.crs, ['EPSG:4326'])
+            # the description is fetched once for the links and the extent
+            links = ows.wcs_links(ogc_server_settings.LOCATION + 'wcs?', 'geonode:dem', crs='EPSG:4326')
+            self.assertEquals([l[0] for l in links], ['GeoTIFF'])
+            self.assertTrue('format=GeoTIFF' in links[0][3])
+            # no size was given
+            self.assertFalse('height' in links[0][3])
+            self.assertTrue(ows.describe_coverage('geonode:dem') is description)
+            self.assertEquals(len(requests), 1)
+            ows.describe_coverage('geonode:dem', refresh=True)
+            self.assertEquals(len(requests), 2)
+
+            # coverages of other services are described by them
+            ows.wcs_links('http://example.com/wcs?', 'geonode:dem')
+            self.assertEquals(requests[-1][0], 'http://example.com/wcs?')
+            self.assertFalse(ows.describe_coverage('geonode:dem', wcs_url='http://example.com/wcs?') is description)
+            self.assertEquals(len(requests), 3)
+
+            # the cache is bounded
+            size, ows.COVERAGE_CACHE_SIZE = ows.COVERAGE_CACHE_SIZE, 2
+            try:
+                ows.describe_coverage('geonode:other')
+                self.assertEquals(len(ows._coverages), 2)
+                self.assertFalse((None, 'geonode:dem') in ows._coverages)
+            finally:
+                ows.COVERAGE_CACHE_SIZE = size
+        finally:
+            ows._wcs_request = real_request
+            ows._coverages.clear()
+
+    def test_save_queues_sync(self):
+        from geonode.base import jobs, thumbnails
+        from geonode.base.models import Job
+        layer = Layer.objects.all()[0]
+        # left pending by the test settings
+        self.assertEquals('pending', jobs.status(layer, 'geoserver_sync'))
+        # the sync queues the thumbnail once GeoServer serves the layer
+        self.assertEquals(None, thumbnails.status(layer))
+        layer.save()
+        self.assertEquals(1, Job.objects.filter(resource_id=layer.pk, job_type='geoserver_sync').count())
+
+    def test_sync_not_queued_by_own_saves(self):
+        from django.test.utils import override_settings
+        from geonode.base.models import Job
+        from geonode.catalogue.models import CATALOGUE_FIELDS
+        from geonode.layers.models import GEOSERVER_SYNC_FIELDS
+        layer = Layer.objects.all()[0]
+        with override_settings(JOB_BROKER='geonode.base.jobs.DatabaseBroker'):
+            Job.objects.filter(job_type='geoserver_sync').delete()
+            # the saves of the sync itself, the thumbnail job and the catalogue
+            layer.save(update_fields=GEOSERVER_SYNC_FIELDS)
+            layer.save(update_fields=['thumbnail'])
+            layer.save(update_fields=CATALOGUE_FIELDS)
+            self.assertEquals(0, Job.objects.filter(job_type='geoserver_sync').count())
+            layer.save()
+            self.assertEquals(1, Job.objects.filter(job_type='geoserver_sync').count())
+
+    def test_statistics_from_row(self):
+        from decimal import Decimal
+        from geonode.geoserver.helpers import _statistics_from_row
+        row = (3, 1, 5, Decimal('3.0'), None, 1.5, 9,
+               0, None, None, None, None, None, None)
+        results = _statistics_from_row(['pop', 'area'], row)
+        self.assertEquals(results['pop']['Count'], 3)
+        self.assertEquals(results['pop']['Max'], '5')
+        self.assertEquals(results['pop']['Average'], '3.0')
+        # no median before PostgreSQL 9.4
+        self.assertEquals(results['pop']['Median'], 'NA')
+        self.assertEquals(results['area']['Count'], 0)
+        self.assertEquals(results['area']['Min'], 'NA')
+        self.assertEquals(results['area']['unique_values'], 'NA')
+
+    def test_save_attributes(self):
+        from geonode.layers import models
+        layer = Layer.objects.all()[0]
+        layer.storeType = 'dataStore'
+        layer.attribute_set.all().delete()
+        requested = []
+
+        def fake_statistics(layer, fields):
+            requested.append(fields)
+            return {'pop': {'Count': 3, 'Min': '1', 'Max': '5', 'Average': '3',
+                            'Median': 'NA', 'StandardDeviation': '1.5', 'Sum': '9',
+                            'unique_values': '1,3,5'}}
+
+        real_statistics, models.get_attributes_statistics = models.get_attributes_statistics, fake_statistics
+        try:
+            attribute_map = [['the_geom', 'gml:PointPropertyType'], ['pop', 'xsd:int'],
+                             ['id', 'xsd:int'], ['name', 'xsd:string']]
+            models.save_attributes(layer, attribute_map)
+            # the statistics of the numeric fields are asked at once
+            self.assertEquals(requested, [['pop']])
+            attributes = list(layer.attribute_set.order_by('display_order'))
+            self.assertEquals([a.attribute for a in attributes], ['the_geom', 'pop', 'id', 'name'])
+            self.assertEquals(attributes[1].max, '5')
+            self.assertEquals(attributes[1].unique_values, '1,3,5')
+            self.assertFalse(attributes[0].visible)
+
+            # only the new attributes are added, the missing ones are removed
+            models.save_attributes(layer, attribute_map[1:] + [['area', 'xsd:double']])
+            self.assertEquals(requested[-1], ['area'])
+            self.assertEquals(set(layer.attribute_set.values_list('attribute', flat=True)),
+                              set(['pop', 'id', 'name', 'area']))
+        finally:
+            models.get_attributes_statistics = real_statistics
+
+    def test_slurp_workers(self):
+        import threading
+        from geonode.geoserver import helpers
+        resources = [FakeResource('layer%d' % i) for i in range(5)]
+        catalogs = {}
+        slurped = []
+
+        def get_catalog():
+            # one per thread, as helpers.get_catalog
+            thread = threading.current_thread()
+            return catalogs.setdefault(thread, FakeCatalog(resources))
+
+        def fake_slurp(resource, owner, fingerprint=None, force=False):
+            slurped.append((resource.name, resource.catalog is get_catalog()))
+            return 'updated'
+
+        real = helpers.get_catalog, helpers._slurp_resource
+        helpers.get_catalog = get_catalog
+        helpers._slurp_resource = fake_slurp
+        try:
+            output = helpers.gs_slurp(workers=3)
+        finally:
+            helpers.get_catalog, helpers._slurp_resource = real
+        self.assertEquals(output['stats']['updated'], 5)
+        # each worker fetches through the catalog of its own thread
+        self.assertEquals(sorted(slurped), [(r.name, True) for r in resources])
+        # reported in the order of GeoServer
+        self.assertEquals([l['name'] for l in output['layers']], [r.name for r in resources])
+
+    def test_slurp_skips_unchanged_layers(self):
+        from geonode.geoserver import helpers
+        from geonode.layers.models import LayerFingerprint
+        layer = Layer.objects.all()[0]
+        resource = FakeResource(layer.name, layer.workspace, layer.store)
+        LayerFingerprint.objects.create(layer=layer, digest=helpers.gs_fingerprint(resource))
+
+        real = helpers.get_catalog
+        helpers.get_catalog = lambda: FakeCatalog([resource])
+        try:
+            output = helpers.gs_slurp()
+        finally:
+            helpers.get_catalog = real
+        self.assertEquals(output['stats']['unchanged'], 1)
+        self.assertEquals(output['layers'], [{'name': layer.name, 'status': 'unchanged'}])
+        # the fingerprint comes from the document already loaded
+        self.assertEquals(resource.fetched, 0)
+
+        # the same document in another store is a change
+        moved = FakeResource(layer.name, layer.workspace, 'other_store')
+        self.assertNotEquals(helpers.gs_fingerprint(moved), helpers.gs_fingerprint(resource))
+
+    def test_slurp_deleted_layers(self):
+        from geonode.geoserver.helpers import _deleted_layers
+        kept = FakeObject(name='kept', workspace='geonode', store='data')
+        moved = FakeObject(name='moved', workspace='geonode', store='data')
+        other_workspace = FakeObject(name='other', workspace='geonode', store='data')
+        gone = FakeObject(name='gone', workspace='geonode', store='data')
+        resources = [FakeResource('kept', 'geonode', 'data'),
+                     FakeResource('moved', 'geonode', 'new_data'),
+                     FakeResource('other', 'other', 'data')]
+        # the layer must match the name, the workspace and the store
+        self.assertEquals(_deleted_layers([kept, moved, other_workspace, gone], resources),
+                          [moved, other_workspace, gone])
@@ -39,6 +39,7 @@ from django.conf import settings
 from geonode import GeoNodeException
 from geonode.utils import check_geonode_is_up
 from geonode.people.utils import get_valid_user
+from geonode.base import jobs, thumbnails
 from geonode.layers.models import Layer, Style
 from geonode.people.models import Profile
 from geonode.geoserver.helpers import cascading_delete, get_sld_for, delete_from_postgis
@@ -481,9 +482,12 @@ def save(layer, base_file, user, overwrite=True, title=None,
                     owner=user)
 
     workspace = gs_resource.store.workspace.name
-    saved_layer, created = Layer.objects.get_or_create(name=gs_resource.name,
-                                                       workspace=workspace,
-                                                       defaults=defaults)
+    # Synchronize the layer with GeoServer right away, callers expect its
+    # bounding box, links and attributes to be there
+    with jobs.immediate():
+        saved_layer, created = Layer.objects.get_or_create(name=gs_resource.name,
+                                                           workspace=workspace,
+                                                           defaults=defaults)
 
     saved_layer.keywords.add(*keywords)
 
@@ -510,7 +514,8 @@ def save(layer, base_file, user, overwrite=True, title=None,
             else:
                 setattr(saved_layer, key, value)
 
-        saved_layer.save()
+        with jobs.immediate():
+            saved_layer.save()
 
     # Step 11. Set default permissions on the newly created layer
     # FIXME: Do this as part of the post_save hook
@@ -801,7 +806,7 @@ def style_update(request, url):
                 style.sld_title = elm_user_style_title.text
             style.save()
             for layer in style.layer_styles.all():
-                layer.update_thumbnail()
+                thumbnails.enqueue(layer)
     if request.method == 'DELETE': # delete style from GN
         style_name = os.path.basename(request.path)
         style = Style.objects.all().filter(name=style_name)[0]
@@ -39,19 +39,20 @@ from django.template.defaultfilters import slugify
 from django.shortcuts import get_object_or_404
 from django.forms.models import inlineformset_factory
 from django.utils.datastructures import MultiValueDictKeyError
-from django.db.models import signals
 
 from geoserver.catalog import FailedRequestError
 
 from geonode.utils import http_client, _get_basic_auth_info, json_response
 from geonode.layers.forms import LayerForm, LayerUploadForm, NewLayerUploadForm, LayerAttributeForm, LayerStyleUploadForm
-from geonode.layers.models import Layer, Attribute, set_styles, geoserver_post_save, geoserver_pre_save
+from geonode.layers.models import Layer, Attribute, set_styles
 from geonode.base.models import ContactRole
+from geonode.base import counters
 from geonode.utils import default_map_config
 from geonode.utils import GXPLayer
 from geonode.utils import GXPMap
 from geonode.layers.utils import save
 from geonode.layers.utils import layer_set_permissions
+from geonode.upload.models import ChunkedUpload
 from geonode.utils import resolve_object
 from geonode.people.forms import ProfileForm, PocForm
 from geonode.security.views import _perms_info_json
@@ -121,7 +122,8 @@ def layer_upload(request, template='upload/layer_upload.html'):
         return render_to_response(template,
                                   RequestContext(request, {}))
     elif request.method == 'POST':
-        form = NewLayerUploadForm(request.POST, request.FILES)
+        form = NewLayerUploadForm(request.POST,
+                ChunkedUpload.objects.uploaded_files(request.user, request.POST, request.FILES))
         tempdir = None
         errormsgs = []
         out = {'success': False}
@@ -191,12 +193,7 @@ def layer_detail(request, layername, template='layers/layer_detail.html'):
   
     layer.srid_url = "http://www.spatialreference.org/ref/" + layer.srid.replace(':','/').lower() + "/"
 
-    signals.pre_save.disconnect(geoserver_pre_save, sender=Layer)
-    signals.post_save.disconnect(geoserver_post_save, sender=Layer)
-    layer.popular_count += 1
-    layer.save()
-    signals.pre_save.connect(geoserver_pre_save, sender=Layer)
-    signals.post_save.connect(geoserver_post_save, sender=Layer)
+    counters.increment(layer, 'popular_count')
 
     # center/zoom don't matter; the viewer will center on the layer bounds
     map_obj = GXPMap(projection="EPSG:900913")
@@ -476,7 +473,8 @@ def layer_replace(request, layername, template='layers/layer_replace.html'):
                                                            'is_featuretype': is_featuretype}))
     elif request.method == 'POST':
 
-        form = LayerUploadForm(request.POST, request.FILES)
+        form = LayerUploadForm(request.POST,
+                ChunkedUpload.objects.uploaded_files(request.user, request.POST, request.FILES))
         tempdir = None
         out = {}
 
@@ -33,22 +33,23 @@ from django.utils import simplejson as json
 from django.contrib.auth.models import User, AnonymousUser
 from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import ugettext_lazy as _
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.template.defaultfilters import slugify
 
 from geonode.layers.models import Layer
+from geonode.base import thumbnails
 from geonode.base.models import ResourceBase, resourcebase_post_save, resourcebase_post_delete
 from geonode.maps.signals import map_changed_signal
 from geonode.security.enumerations import AUTHENTICATED_USERS, ANONYMOUS_USERS
+from geonode.security.auth import permitted_ids
 from geonode.utils import GXPMapBase
 from geonode.utils import GXPLayerBase
 from geonode.utils import layer_from_viewer_config
 from geonode.utils import default_map_config
 from geonode.utils import forward_mercator
 from geonode.utils import http_client, ogc_server_settings
+from geonode.geoserver.helpers import get_catalog
 
-from geoserver.catalog import Catalog
 from geoserver.layer import Layer as GsLayer
 from geoserver.layergroup import UnsavedLayerGroup as GsUnsavedLayerGroup
 from agon_ratings.models import OverallRating
@@ -113,14 +114,10 @@ class Map(ResourceBase, GXPMapBase):
         Get a JSON representation of this map suitable for sending to geoserver
         for creating a download of all layers
         """
-        map_layers = MapLayer.objects.filter(map=self.id)
-        layers = []
-        for map_layer in map_layers:
-            if map_layer.local:
-                layer =  Layer.objects.get(typename=map_layer.name)
-                layers.append(layer)
-            else:
-                pass
+        map_layers = MapLayer.objects.filter(map=self.id, local=True)
+        found = dict((l.typename, l) for l in
+                     Layer.objects.filter(typename__in=[ml.name for ml in map_layers]))
+        layers = [found[ml.name] for ml in map_layers if ml.name in found]
 
         if layer_filter:
             layers = [l for l in layers if layer_filter(l)]
@@ -350,13 +347,14 @@ class Map(ResourceBase, GXPMapBase):
         DEFAULT_MAP_CONFIG, DEFAULT_BASE_LAYERS = default_map_config()
 
         layer_objects = []
+        found = dict((l.typename, l) for l in Layer.objects.filter(typename__in=layers))
+        viewable = permitted_ids(user, 'maps.view_layer', found.values())
         for layer in layers:
-            try:
-                layer = Layer.objects.get(typename=layer)
-            except ObjectDoesNotExist:
+            layer = found.get(layer)
+            if layer is None:
                 continue # Raise exception?
 
-            if not user.has_perm('maps.view_layer', obj=layer):
+            if layer.id not in viewable:
                 # invisible layer, skip inclusion or raise Exception?
                 continue # Raise Exception
 
@@ -413,7 +411,7 @@ class Map(ResourceBase, GXPMapBase):
         """
         Returns layer group name from local OWS for this map instance.
         """
-        cat = Catalog(ogc_server_settings.rest, _user, _password)
+        cat = get_catalog(ogc_server_settings.rest)
         lg_name = '%s_%d' % (slugify(self.title), self.id)
         return cat.get_layergroup(lg_name)
  
@@ -444,7 +442,7 @@ class Map(ResourceBase, GXPMapBase):
         lg_name = '%s_%d' % (slugify(self.title), self.id)
 
         # Update existing or add new group layer
-        cat = Catalog(ogc_server_settings.rest, _user, _password)
+        cat = get_catalog(ogc_server_settings.rest)
         lg = self.layer_group
         if lg is None:
             lg = GsUnsavedLayerGroup(cat, lg_name, lg_layers, lg_styles, lg_bounds)
@@ -567,7 +565,7 @@ def pre_save_maplayer(instance, sender, **kwargs):
         return
 
     try:
-        c = Catalog(ogc_server_settings.internal_rest, _user, _password)
+        c = get_catalog()
         instance.local = isinstance(c.get_layer(instance.name),GsLayer)
     except EnvironmentError, e:
         if e.errno == errno.ECONNREFUSED:
@@ -580,11 +578,16 @@ def pre_delete_map(instance, sender, **kwrargs):
     ct = ContentType.objects.get_for_model(instance)
     OverallRating.objects.filter(content_type = ct, object_id = instance.id).delete()
 
-def pre_save_map(instance, sender, **kwargs):
-    instance.update_thumbnail(save=False)
+def post_save_map(instance, sender, **kwargs):
+    if kwargs.get('raw', False):
+        return
+    if instance.thumbnail_id is None:
+        thumbnails.enqueue(instance)
+
+thumbnails.register(Map)
 
 signals.pre_save.connect(pre_save_maplayer, sender=MapLayer)
 signals.pre_delete.connect(pre_delete_map, sender=Map)
-signals.pre_save.connect(pre_save_map, sender=Map)
+signals.post_save.connect(post_save_map, sender=Map)
 signals.post_save.connect(resourcebase_post_save, sender=Map)
 signals.post_delete.connect(resourcebase_post_delete, sender=Map)
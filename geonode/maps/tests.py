@@ -119,6 +119,12 @@ community."
 
     perm_spec = {"anonymous":"_none","authenticated":"_none","users":[["admin","map_readwrite"]]}
 
+    def test_save_queues_thumbnail(self):
+        from geonode.base import thumbnails
+        map_obj = Map.objects.all()[0]
+        # left pending by the test settings
+        self.assertEquals('pending', thumbnails.status(map_obj))
+
     def test_map_json(self):
         c = Client()
         # Test that saving a map when not logged in gives 401
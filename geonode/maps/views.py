@@ -23,7 +23,6 @@ import logging
 
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.exceptions import ObjectDoesNotExist
 from django.core.exceptions import PermissionDenied
 from django.core.urlresolvers import reverse
 from django.http import HttpResponse, HttpResponseRedirect, HttpResponseNotAllowed, HttpResponseServerError
@@ -46,9 +45,11 @@ from geonode.utils import resolve_object
 from geonode.maps.forms import MapForm
 from geonode.security.enumerations import AUTHENTICATED_USERS, ANONYMOUS_USERS
 from geonode.security.views import _perms_info
+from geonode.security.auth import permitted_ids
 from geonode.documents.models import get_related_documents
 from geonode.utils import ogc_server_settings
 from geonode.base.models import ContactRole
+from geonode.base import counters
 from geonode.people.forms import ProfileForm, PocForm
 
 logger = logging.getLogger("geonode.maps.views")
@@ -112,8 +113,7 @@ def map_detail(request, mapid, template='maps/map_detail.html'):
     '''
     map_obj = _resolve_map(request, mapid, 'maps.view_map', _PERMISSION_MSG_VIEW)
 
-    map_obj.popular_count += 1
-    map_obj.save()
+    counters.increment(map_obj, 'popular_count')
 
     config = map_obj.viewer_json()
     config = json.dumps(config)
@@ -343,14 +343,16 @@ def new_map_config(request):
             bbox = None
             map_obj = Map(projection="EPSG:900913")
             layers = []
-            for layer_name in params.getlist('layer'):
-                try:
-                    layer = Layer.objects.get(typename=layer_name)
-                except ObjectDoesNotExist:
+            layer_names = params.getlist('layer')
+            found = dict((l.typename, l) for l in Layer.objects.filter(typename__in=layer_names))
+            viewable = permitted_ids(request.user, 'layers.view_layer', found.values())
+            for layer_name in layer_names:
+                layer = found.get(layer_name)
+                if layer is None:
                     # bad layer, skip
                     continue
 
-                if not request.user.has_perm('layers.view_layer', obj=layer):
+                if layer.id not in viewable:
                     # invisible layer, skip inclusion
                     continue
 
@@ -412,12 +414,17 @@ def map_download(request, mapid, template='maps/map_download.html'):
     """
     mapObject = _resolve_map(request, mapid, 'maps.view_map')
 
+    map_layers = [lyr for lyr in mapObject.layer_set.all() if lyr.group != "background"]
+    ownable_layers = dict((l.typename, l) for l in
+                          Layer.objects.filter(typename__in=[lyr.name for lyr in map_layers if lyr.local]))
+    viewable = permitted_ids(request.user, 'layers.view_layer', ownable_layers.values())
+
     map_status = dict()
     if request.method == 'POST':
         url = "%srest/process/batchDownload/launch/" % ogc_server_settings.LOCATION
 
         def perm_filter(layer):
-            return request.user.has_perm('layers.view_layer', obj=layer)
+            return layer.id in viewable
 
         mapJson = mapObject.json(perm_filter)
 
@@ -443,18 +450,15 @@ def map_download(request, mapid, template='maps/map_download.html'):
     remote_layers = []
     downloadable_layers = []
 
-    for lyr in mapObject.layer_set.all():
-        if lyr.group != "background":
-            if not lyr.local:
-                remote_layers.append(lyr)
-            else:
-                ownable_layer = Layer.objects.get(typename=lyr.name)
-                if not request.user.has_perm('layers.view_layer', obj=ownable_layer):
-                    locked_layers.append(lyr)
-                else:
-                    # we need to add the layer only once
-                    if len([l for l in downloadable_layers if l.name == lyr.name]) == 0:
-                        downloadable_layers.append(lyr)
+    for lyr in map_layers:
+        if not lyr.local:
+            remote_layers.append(lyr)
+        elif lyr.name not in ownable_layers or ownable_layers[lyr.name].id not in viewable:
+            locked_layers.append(lyr)
+        else:
+            # we need to add the layer only once
+            if len([l for l in downloadable_layers if l.name == lyr.name]) == 0:
+                downloadable_layers.append(lyr)
 
     return render_to_response(template, RequestContext(request, {
          "map_status" : map_status,
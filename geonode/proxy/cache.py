@@ -0,0 +1,90 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+'''
+Opt-in cache for the OGC documents fetched through the proxy.
+
+PROXY_CACHE maps OGC request types to the number of seconds their responses
+stay fresh, e.g. {'GetCapabilities': 300, 'DescribeFeatureType': 600}.
+Entries are keyed on the normalized url and the user the request is made
+for, and are revalidated with their ETag or Last-Modified once stale.
+Entries for the local GeoServer are dropped when layers are saved or
+removed.
+'''
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import signals
+
+from geonode.layers.models import Layer
+from geonode.utils import ogc_server_settings, get_cache_versions, bump_cache_version
+
+from urllib import urlencode
+from urlparse import parse_qsl
+import hashlib
+
+_VERSION_KEY = 'proxy_cache_version'
+
+
+def get_ttl(url):
+    '''seconds the response to the GET request for url (from urlsplit)
+    stays fresh, None if it should not be cached'''
+    ttls = getattr(settings, 'PROXY_CACHE', {})
+    if not ttls:
+        return None
+    for k, v in parse_qsl(url.query):
+        if k.lower() == 'request':
+            for request_type, ttl in ttls.items():
+                if request_type.lower() == v.lower():
+                    return ttl
+    return None
+
+
+def cache_key(url, user_id=None):
+    '''key of the cached response to url for the given user, OGC parameter
+    names are case insensitive and unordered'''
+    params = sorted((k.lower(), v) for k, v in parse_qsl(url.query, keep_blank_values=True))
+    normalized = '%s://%s%s?%s' % (url.scheme.lower(), url.netloc.lower(), url.path,
+                                   urlencode(params))
+    version = ''
+    if url.hostname == ogc_server_settings.hostname:
+        version = get_cache_versions([_VERSION_KEY])[0]
+    return 'proxy_%s' % hashlib.md5('%s|%s|%s' % (normalized, user_id, version)).hexdigest()
+
+
+def load(key):
+    return cache.get(key)
+
+
+def store(key, entry, ttl):
+    # kept past their freshness so they can be revalidated
+    cache.set(key, entry, ttl * 10)
+
+
+def invalidate():
+    '''drop the cached documents of the local GeoServer'''
+    bump_cache_version(_VERSION_KEY)
+
+
+def _layers_changed(instance, sender, **kwargs):
+    if getattr(settings, 'PROXY_CACHE', {}):
+        invalidate()
+
+
+signals.post_save.connect(_layers_changed, sender=Layer)
+signals.post_delete.connect(_layers_changed, sender=Layer)
@@ -32,6 +32,29 @@ from django.test.utils import override_settings, str_prefix
 from geonode.proxy.views import validate_host
 from geonode.utils import ogc_server_settings
 
+class FakeConnection(object):
+    closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeResult(object):
+    """the part of an httplib response the proxy relays"""
+    status = 200
+    will_close = True
+
+    def __init__(self, body):
+        from StringIO import StringIO
+        self.body = StringIO(body)
+
+    def read(self, size=-1):
+        return self.body.read(size)
+
+    def getheader(self, name, default=None):
+        return {'Content-Type': 'text/plain'}.get(name, default)
+
+
 class ProxyTest(TestCase):
 
     def setUp(self):
@@ -59,6 +82,50 @@ class ProxyTest(TestCase):
         response = c.get('/proxy?url=http://www.google.com', follow=True)
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(DEBUG=True, PROXY_ALLOWED_HOSTS=())
+    def test_proxy_streams_response(self):
+        """The upstream body is relayed in chunks rather than buffered."""
+        from geonode.proxy import views
+        conn = FakeConnection()
+        requested = []
+
+        def upstream_request(url, method, body, headers):
+            requested.append((url.geturl(), method))
+            return ('http', 'example.com', None), conn, FakeResult('upstream body')
 
+        real = views._upstream_request, views.CHUNK_SIZE
+        views._upstream_request, views.CHUNK_SIZE = upstream_request, 4
+        try:
+            c = Client()
+            response = c.get('/proxy/?url=http://example.com/data')
+            self.assertEqual(response.status_code, 200)
+            self.assertTrue(response.streaming)
+            chunks = list(response.streaming_content)
+        finally:
+            views._upstream_request, views.CHUNK_SIZE = real
+        self.assertEqual([('http://example.com/data', 'GET')], requested)
+        self.assertEqual('upstream body', ''.join(chunks))
+        self.assertTrue(len(chunks) > 1)
+        # the upstream response asked to close its connection
+        self.assertTrue(conn.closed)
 
+    @override_settings(PROXY_CACHE={'GetCapabilities': 300})
+    def test_proxy_cache_keys(self):
+        """Cached documents are keyed on the normalized url and the user."""
+        from urlparse import urlsplit
+        from geonode.proxy import cache
+        url = urlsplit(ogc_server_settings.LOCATION + 'wms?service=WMS&request=GetCapabilities')
+        same = urlsplit(ogc_server_settings.LOCATION + 'wms?REQUEST=GetCapabilities&SERVICE=WMS')
+        self.assertEqual(300, cache.get_ttl(url))
+        self.assertEqual(None, cache.get_ttl(urlsplit(ogc_server_settings.LOCATION + 'wms?request=GetMap')))
+        self.assertEqual(cache.cache_key(url), cache.cache_key(same))
+        self.assertNotEqual(cache.cache_key(url), cache.cache_key(url, self.admin.pk))
 
+        # layer changes drop the documents of the local server
+        key = cache.cache_key(url)
+        cache.invalidate()
+        invalidated = cache.cache_key(url)
+        self.assertNotEqual(key, invalidated)
+        # nor do they come back once the version key expired
+        cache.cache.delete(cache._VERSION_KEY)
+        self.assertFalse(cache.cache_key(url) in (key, invalidated))
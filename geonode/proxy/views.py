@@ -18,14 +18,174 @@
 #
 #########################################################################
 
-from django.http import HttpResponse
-from httplib import HTTPConnection,HTTPSConnection
+from django.http import HttpResponse, StreamingHttpResponse
+from httplib import HTTPConnection,HTTPSConnection,HTTPException
 from urlparse import urlsplit
-import httplib2
+import base64
+import socket
+import threading
+import time
 from django.conf import settings
 from django.utils.http import is_safe_url
 from django.http.request import validate_host
 from geonode.utils import ogc_server_settings
+from geonode.proxy import cache as proxy_cache
+
+# size of the blocks relayed between the upstream server and the client
+CHUNK_SIZE = 64 * 1024
+
+# response headers passed on to the client
+FORWARDED_HEADERS = ('Content-Length', 'Content-Encoding', 'Content-Disposition',
+                     'Last-Modified', 'ETag', 'Cache-Control', 'Expires')
+
+# idle keep-alive connections to the upstream servers, by scheme, host and port
+_connections = {}
+_connections_lock = threading.Lock()
+
+
+def _get_connection(key, reuse=True):
+    if reuse:
+        with _connections_lock:
+            idle = _connections.get(key)
+            if idle:
+                return idle.pop(), True
+    scheme, host, port = key
+    if scheme == 'https':
+        return HTTPSConnection(host, port), False
+    return HTTPConnection(host, port), False
+
+
+def _release_connection(key, conn):
+    with _connections_lock:
+        _connections.setdefault(key, []).append(conn)
+
+
+def _request_body(request):
+    """The request body as a file to stream upstream when its length is
+       known, else as a string
+    """
+    if request.method not in ("POST", "PUT"):
+        return None, None
+    length = request.META.get("CONTENT_LENGTH")
+    if length:
+        return request, length
+    body = request.body
+    return body, str(len(body))
+
+
+def _upstream_request(url, method, body, headers):
+    """Sends the request on a pooled connection to the host of url, returns
+       the connection key, the connection and the response
+    """
+    key = (url.scheme, url.hostname, url.port)
+    locator = url.path
+    if url.query != "":
+        locator += '?' + url.query
+    if url.fragment != "":
+        locator += '#' + url.fragment
+
+    # a streamed body can only be sent once, so not over an idle connection
+    # the server may have closed in the meantime
+    conn, reused = _get_connection(key, reuse=not hasattr(body, 'read'))
+    try:
+        conn.request(method, locator, body, headers)
+        return key, conn, conn.getresponse()
+    except (HTTPException, socket.error):
+        conn.close()
+        if not reused:
+            raise
+    # the idle connection was closed by the server, try once more
+    conn, reused = _get_connection(key, reuse=False)
+    conn.request(method, locator, body, headers)
+    return key, conn, conn.getresponse()
+
+
+def _relay(key, conn, result):
+    """Relays the upstream response to the client in chunks, the connection
+       goes back to the pool once the body has been read entirely
+    """
+    def stream():
+        done = False
+        try:
+            while True:
+                chunk = result.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield chunk
+            done = True
+        finally:
+            if done and not result.will_close:
+                _release_connection(key, conn)
+            else:
+                conn.close()
+
+    response = StreamingHttpResponse(
+            stream(),
+            status=result.status,
+            content_type=result.getheader("Content-Type", "text/plain")
+            )
+    for header in FORWARDED_HEADERS:
+        value = result.getheader(header)
+        if value is not None:
+            response[header] = value
+    return response
+
+
+def _read(key, conn, result):
+    """Reads the whole upstream response, for documents small enough to be
+       cached, and releases the connection
+    """
+    body = result.read()
+    if result.will_close:
+        conn.close()
+    else:
+        _release_connection(key, conn)
+    return body
+
+
+def _cached_response(entry):
+    response = HttpResponse(entry['body'], status=200, content_type=entry['content_type'])
+    for header, value in entry['headers']:
+        response[header] = value
+    return response
+
+
+def _cached_proxy(url, headers, ttl, user_id):
+    """Serves the GET request for url from the proxy cache, fetching or
+       revalidating the document when it is missing or stale
+    """
+    key = proxy_cache.cache_key(url, user_id)
+    entry = proxy_cache.load(key)
+    now = time.time()
+    if entry is not None:
+        if entry['fresh_until'] > now:
+            return _cached_response(entry)
+        if entry['etag']:
+            headers["If-None-Match"] = entry['etag']
+        if entry['last_modified']:
+            headers["If-Modified-Since"] = entry['last_modified']
+
+    conn_key, conn, result = _upstream_request(url, "GET", None, headers)
+    if entry is not None and result.status == 304:
+        _read(conn_key, conn, result)
+        entry['fresh_until'] = now + ttl
+        proxy_cache.store(key, entry, ttl)
+        return _cached_response(entry)
+    if result.status != 200:
+        return _relay(conn_key, conn, result)
+
+    entry = {
+        'body': _read(conn_key, conn, result),
+        'content_type': result.getheader("Content-Type", "text/plain"),
+        'headers': [(h, result.getheader(h)) for h in FORWARDED_HEADERS
+                    if h != 'Content-Length' and result.getheader(h) is not None],
+        'etag': result.getheader("ETag"),
+        'last_modified': result.getheader("Last-Modified"),
+        'fresh_until': now + ttl,
+    }
+    proxy_cache.store(key, entry, ttl)
+    return _cached_response(entry)
+
 
 def proxy(request):
     PROXY_ALLOWED_HOSTS = (ogc_server_settings.hostname,) + getattr(settings, 'PROXY_ALLOWED_HOSTS', ())
@@ -40,12 +200,6 @@ def proxy(request):
     raw_url = request.GET['url']
     url = urlsplit(raw_url)
 
-    locator = url.path
-    if url.query != "":
-        locator += '?' + url.query
-    if url.fragment != "":
-        locator += '#' + url.fragment
-
     if not settings.DEBUG:
         if not validate_host(url.hostname, PROXY_ALLOWED_HOSTS):
             return HttpResponse(
@@ -62,19 +216,20 @@ def proxy(request):
     if request.method in ("POST", "PUT") and "CONTENT_TYPE" in request.META:
         headers["Content-Type"] = request.META["CONTENT_TYPE"]
 
-    if url.scheme =='https':
-        conn = HTTPSConnection(url.hostname, url.port)
-    else:
-        conn = HTTPConnection(url.hostname, url.port)
-    conn.request(request.method, locator, request.raw_post_data, headers)
-    result = conn.getresponse()
-    response = HttpResponse(
-            result.read(),
-            status=result.status,
-            content_type=result.getheader("Content-Type", "text/plain")
-            )
+    ttl = proxy_cache.get_ttl(url) if request.method == "GET" else None
+    if ttl:
+        # cached documents are kept uncompressed, whatever the client accepts
+        user_id = request.user.pk if "Cookie" in headers else None
+        return _cached_proxy(url, headers, ttl, user_id)
 
-    return response
+    if "HTTP_ACCEPT_ENCODING" in request.META:
+        headers["Accept-Encoding"] = request.META["HTTP_ACCEPT_ENCODING"]
+
+    body, length = _request_body(request)
+    if length is not None:
+        headers["Content-Length"] = length
+
+    return _relay(*_upstream_request(url, request.method, body, headers))
 
 def geoserver_rest_proxy(request, proxy_path, downstream_path):
     if not request.user.is_authenticated():
@@ -90,28 +245,32 @@ def geoserver_rest_proxy(request, proxy_path, downstream_path):
     path = strip_prefix(request.get_full_path(), proxy_path)
     url = "".join([ogc_server_settings.LOCATION, downstream_path, path])
 
-    http = httplib2.Http()
-    http.add_credentials(*(ogc_server_settings.credentials))
     headers = dict()
+    headers["Authorization"] = "Basic " + base64.b64encode(
+        "%s:%s" % tuple(ogc_server_settings.credentials))
 
     if request.method in ("POST", "PUT") and "CONTENT_TYPE" in request.META:
         headers["Content-Type"] = request.META["CONTENT_TYPE"]
 
-    response, content = http.request(
-        url, request.method,
-        body=request.raw_post_data or None,
-        headers=headers)
+    if downstream_path == 'rest/styles':
+        # styles are small and synced below, read them in memory
+        body = request.raw_post_data or None
+        if body is not None:
+            headers["Content-Length"] = str(len(body))
+    else:
+        body, length = _request_body(request)
+        if length is not None:
+            headers["Content-Length"] = length
+
+    key, conn, result = _upstream_request(urlsplit(url), request.method, body, headers)
         
     # we need to sync django here
     # we should remove this geonode dependency calling layers.views straight
     # from GXP, bypassing the proxy
-    if downstream_path == 'rest/styles' and len(request.raw_post_data)>0:
+    if downstream_path == 'rest/styles' and body:
         # for some reason sometime gxp sends a put with empty request
         # need to figure out with Bart
         from geonode.layers import utils
         utils.style_update(request, url)
 
-    return HttpResponse(
-        content=content,
-        status=response.status,
-        mimetype=response.get("content-type", "text/plain"))
+    return _relay(key, conn, result)
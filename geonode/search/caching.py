@@ -0,0 +1,163 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+'''
+Dependency tracked versions for the cached search results and facets.
+
+Every cache entry is stored under the combined version of the dependencies
+it was computed from. A dependency is a resource type ('map', 'layer',
+'document', 'user'), 'keywords', 'regions', or 'membership' for resources
+being added, removed or changing visibility. Saving a resource only bumps
+its type when a searchable field changed, so counters such as popular_count
+do not throw the cached searches away.
+'''
+
+from django.db.models import signals
+
+from taggit.models import TaggedItem
+
+from geonode.base.models import ResourceBase
+from geonode.layers.models import Layer
+from geonode.maps.models import Map
+from geonode.documents.models import Document
+from geonode.people.models import Profile
+from geonode.security.models import UserObjectRoleMapping, GenericObjectRoleMapping
+from geonode.utils import get_cache_versions, bump_cache_version
+
+RESOURCE_TYPES = {
+    Map: 'map',
+    Layer: 'layer',
+    Document: 'document',
+}
+
+# search query types and the dependencies of their results
+_QUERY_TYPE_DEPENDENCIES = {
+    'map': ('map',),
+    'layer': ('layer',),
+    'raster': ('layer',),
+    'vector': ('layer',),
+    'remote': ('layer',),
+    'document': ('document',),
+    'wfpdocument': ('document',),
+    'user': ('user',),
+}
+
+# fields that never affect search results
+IGNORED_FIELDS = ('popular_count', 'share_count', 'csw_anytext',
+                  'csw_wkt_geometry', 'metadata_xml')
+
+_VERSION_KEY = 'search_version_%s'
+
+
+def get_version(*dependencies):
+    '''the combined version of the given dependencies, to be passed as the
+    version of cache get and set calls'''
+    dependencies = sorted(set(dependencies))
+    keys = [_VERSION_KEY % d for d in dependencies]
+    return '.'.join([str(v) for v in get_cache_versions(keys)])
+
+
+def invalidate(*dependencies):
+    '''bump the version of the given dependencies'''
+    for d in set(dependencies):
+        bump_cache_version(_VERSION_KEY % d)
+
+
+def query_dependencies(types):
+    '''the dependencies of the results of a search on the given types'''
+    if not types or None in types or u'all' in types:
+        types = _QUERY_TYPE_DEPENDENCIES.keys()
+    deps = set()
+    for t in types:
+        deps.update(_QUERY_TYPE_DEPENDENCIES.get(t, ()))
+    return tuple(deps)
+
+
+def _resource_type(model):
+    for resource_model, name in RESOURCE_TYPES.items():
+        if model is not None and issubclass(model, resource_model):
+            return name
+    return None
+
+
+def _search_fields(model):
+    return [f for f in model._meta.fields if f.name not in IGNORED_FIELDS]
+
+
+def _snapshot(instance, sender, raw=False, **kwargs):
+    '''remember the searchable field values before the row is updated'''
+    if raw or instance.pk is None:
+        return
+    update_fields = kwargs.get('update_fields')
+    if update_fields and not set(update_fields).difference(IGNORED_FIELDS):
+        instance._search_snapshot = None
+        return
+    fields = [f.name for f in _search_fields(sender)]
+    current = list(sender.objects.filter(pk=instance.pk).values_list(*fields))
+    instance._search_snapshot = current[0] if current else ()
+
+
+def _resource_saved(instance, sender, created, raw=False, **kwargs):
+    name = _resource_type(sender)
+    if created or raw:
+        invalidate(name, 'membership')
+        return
+    snapshot = getattr(instance, '_search_snapshot', ())
+    if snapshot is None:
+        return
+    values = tuple([getattr(instance, f.attname) for f in _search_fields(sender)])
+    if tuple(snapshot) != values:
+        invalidate(name)
+
+
+def _resource_deleted(instance, sender, **kwargs):
+    invalidate(_resource_type(sender), 'membership')
+
+
+def _keywords_changed(instance, sender, **kwargs):
+    name = _resource_type(instance.content_type.model_class())
+    invalidate('keywords', *([name] if name else []))
+
+
+def _regions_changed(instance, sender, action, reverse, **kwargs):
+    if action.startswith('post_'):
+        name = None if reverse else _resource_type(type(instance))
+        invalidate('regions', *([name] if name else RESOURCE_TYPES.values()))
+
+
+def _permissions_changed(instance, sender, **kwargs):
+    name = _resource_type(instance.object_ct.model_class())
+    invalidate('membership', *([name] if name else []))
+
+
+def _profile_changed(instance, sender, **kwargs):
+    invalidate('user')
+
+
+for model in RESOURCE_TYPES:
+    signals.pre_save.connect(_snapshot, sender=model)
+    signals.post_save.connect(_resource_saved, sender=model)
+    signals.post_delete.connect(_resource_deleted, sender=model)
+signals.post_save.connect(_keywords_changed, sender=TaggedItem)
+signals.post_delete.connect(_keywords_changed, sender=TaggedItem)
+signals.m2m_changed.connect(_regions_changed, sender=ResourceBase.regions.through)
+for model in (UserObjectRoleMapping, GenericObjectRoleMapping):
+    signals.post_save.connect(_permissions_changed, sender=model)
+    signals.post_delete.connect(_permissions_changed, sender=model)
+signals.post_save.connect(_profile_changed, sender=Profile)
+signals.post_delete.connect(_profile_changed, sender=Profile)
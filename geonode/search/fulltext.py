@@ -0,0 +1,145 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+'''
+Optional PostgreSQL full text backend for the search api.
+
+Enable it with SIMPLE_SEARCH_SETTINGS['text_backend'] = 'fulltext'. A
+weighted tsvector column is kept on the ResourceBase table (title and layer
+name rank highest, then keywords, then abstract), matched through a GIN index
+and ranked with ts_rank. On other databases the icontains queries in
+geonode.search.search are used instead.
+'''
+
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, transaction
+from django.db.models import signals
+
+from taggit.models import Tag, TaggedItem
+
+from geonode.base.models import ResourceBase
+from geonode.layers.models import Layer
+from geonode.maps.models import Map
+from geonode.documents.models import Document
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+_search_config = getattr(settings,'SIMPLE_SEARCH_SETTINGS', {})
+
+# postgres text search configuration used to parse and stem the text
+TEXT_SEARCH_CONFIG = _search_config.get('text_search_config', 'english')
+
+VECTOR_COLUMN = 'search_vector'
+
+_indexed_models = (Layer, Map, Document)
+
+
+def enabled():
+    return (_search_config.get('text_backend') == 'fulltext'
+            and connection.vendor == 'postgresql')
+
+
+def _vector_sql():
+    rb = ResourceBase._meta.db_table
+    ct_ids = ','.join([str(ContentType.objects.get_for_model(m).id) for m in _indexed_models])
+    return """UPDATE "%(rb)s" SET "%(col)s" =
+    setweight(to_tsvector(%%(cfg)s::regconfig, coalesce("%(rb)s"."title", '')), 'A') ||
+    setweight(to_tsvector(%%(cfg)s::regconfig, coalesce(
+        (SELECT "name" FROM "%(layer)s" WHERE "%(layer)s"."resourcebase_ptr_id" = "%(rb)s"."id"), '')), 'A') ||
+    setweight(to_tsvector(%%(cfg)s::regconfig, coalesce(
+        (SELECT string_agg("%(tag)s"."name", ' ') FROM "%(tag)s"
+         JOIN "%(item)s" ON "%(item)s"."tag_id" = "%(tag)s"."id"
+         WHERE "%(item)s"."object_id" = "%(rb)s"."id"
+         AND "%(item)s"."content_type_id" IN (%(cts)s)), '')), 'B') ||
+    setweight(to_tsvector(%%(cfg)s::regconfig, coalesce("%(rb)s"."abstract", '')), 'C')""" % {
+        'rb': rb, 'col': VECTOR_COLUMN, 'layer': Layer._meta.db_table,
+        'tag': Tag._meta.db_table, 'item': TaggedItem._meta.db_table, 'cts': ct_ids}
+
+
+def update_vectors(ids=None):
+    '''recompute the search vector of the given resource ids, or all of them'''
+    sql = _vector_sql()
+    params = {'cfg': TEXT_SEARCH_CONFIG}
+    if ids is not None:
+        if not ids:
+            return
+        sql += ' WHERE "%s"."id" IN %%(ids)s' % ResourceBase._meta.db_table
+        params['ids'] = tuple(ids)
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    transaction.commit_unless_managed()
+
+
+def create_vector_column():
+    '''add the search vector column and its GIN index if they do not exist'''
+    rb = ResourceBase._meta.db_table
+    cursor = connection.cursor()
+    cursor.execute("SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+                   [rb, VECTOR_COLUMN])
+    if cursor.fetchone():
+        return False
+    cursor.execute('ALTER TABLE "%s" ADD COLUMN "%s" tsvector' % (rb, VECTOR_COLUMN))
+    cursor.execute('CREATE INDEX "%s_%s_gin" ON "%s" USING gin("%s")' % (rb, VECTOR_COLUMN, rb, VECTOR_COLUMN))
+    transaction.commit_unless_managed()
+    return True
+
+
+def _tsquery(query):
+    '''OR together the whole phrase and each of its words'''
+    terms = [query.query]
+    terms.extend([w for w in query.split_query if w not in terms])
+    sql = ' || '.join(['plainto_tsquery(%s::regconfig, %s)'] * len(terms))
+    params = []
+    for t in terms:
+        params.extend([TEXT_SEARCH_CONFIG, t])
+    return '(%s)' % sql, params
+
+
+def text_query(q, query):
+    '''restrict the ResourceBase derived query to rows matching the text'''
+    tsquery, params = _tsquery(query)
+    where = '"%s"."%s" @@ %s' % (ResourceBase._meta.db_table, VECTOR_COLUMN, tsquery)
+    return q.extra(where=[where], params=params)
+
+
+def add_relevance(q, query):
+    '''add the ts_rank of the text query as the relevance select'''
+    tsquery, params = _tsquery(query)
+    rank = 'ts_rank("%s"."%s", %s)' % (ResourceBase._meta.db_table, VECTOR_COLUMN, tsquery)
+    return q.extra(select={'relevance': rank}, select_params=params)
+
+
+def resource_saved(instance, sender, **kwargs):
+    if kwargs.get('raw'):
+        return
+    update_vectors([instance.pk])
+
+
+def keywords_changed(instance, sender, **kwargs):
+    if instance.content_type_id in [ContentType.objects.get_for_model(m).id for m in _indexed_models]:
+        update_vectors([instance.object_id])
+
+
+if enabled():
+    for model in _indexed_models:
+        signals.post_save.connect(resource_saved, sender=model)
+    signals.post_save.connect(keywords_changed, sender=TaggedItem)
+    signals.post_delete.connect(keywords_changed, sender=TaggedItem)
@@ -0,0 +1,34 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from django.db.models import signals
+import logging
+logger = logging.getLogger(__name__)
+
+import geonode.search.models
+from geonode.search import fulltext
+
+if fulltext.enabled():
+
+    def create_search_vector(app, created_models, verbosity, **kwargs):
+        if fulltext.create_vector_column():
+            fulltext.update_vectors()
+            logger.info("Created the full text search vector column")
+
+    signals.post_syncdb.connect(create_search_vector, sender=geonode.search.models)
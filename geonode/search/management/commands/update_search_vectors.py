@@ -0,0 +1,31 @@
+#########################################################################
+#
+# Copyright (C) 2012 OpenPlans
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+#
+#########################################################################
+
+from django.core.management.base import BaseCommand, CommandError
+
+class Command(BaseCommand):
+    help = 'Create and recompute the full text search vectors of all resources'
+
+    def handle(self, *args, **opts):
+        from geonode.search import fulltext
+        if not fulltext.enabled():
+            raise CommandError("The full text search backend is not enabled, set "
+                "SIMPLE_SEARCH_SETTINGS['text_backend'] = 'fulltext' on a PostgreSQL database")
+        fulltext.create_vector_column()
+        fulltext.update_vectors()
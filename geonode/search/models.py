@@ -56,3 +56,8 @@ def filter_by_extent(model, q, extent, user=None):
 
 using_geodjango = False
 
+
+# connects the full text vector maintenance signals when enabled
+from geonode.search import fulltext
+# connects the search cache invalidation signals
+from geonode.search import caching
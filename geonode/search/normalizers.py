@@ -18,7 +18,10 @@
 #########################################################################
 
 from django.core.cache import cache
+from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Q
+from django.db.models.query import prefetch_related_objects
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.urlresolvers import reverse
 from django.template import defaultfilters
@@ -26,6 +29,8 @@ from django.template import defaultfilters
 from geonode.layers.models import Layer
 from geonode.maps.models import Map
 from geonode.documents.models import Document
+from geonode.maps.models import MapLayer
+from geonode.base.models import ResourceBase
 from wfp.wfpdocs.models import WFPDocument
 
 from geonode.search import extension
@@ -33,6 +38,8 @@ from geonode.search import extension
 from agon_ratings.categories import RATING_CATEGORY_LOOKUP
 from agon_ratings.models import OverallRating
 
+from taggit.models import TaggedItem
+
 from avatar.util import get_default_avatar_url
 
 _default_avatar_url = get_default_avatar_url()
@@ -84,6 +91,100 @@ def _annotate(normalizers):
         n.rating = float(ratings.get(n.o.id, 0))
 
 
+def _keywords_for(model, ids):
+    '''keyword names of the given objects, keyed by object id'''
+    keywords = dict([ (i, []) for i in ids ])
+    if not ids: return keywords
+    ct = ContentType.objects.get_for_model(model)
+    items = TaggedItem.objects.filter(content_type=ct, object_id__in=ids).select_related('tag')
+    for item in items:
+        keywords[item.object_id].append(item.tag.name)
+    return keywords
+
+
+def _map_keywords_for(ids):
+    '''keyword names of the local layers of the given maps, keyed by map id'''
+    names = {}
+    for map_id, name in MapLayer.objects.filter(map__in=ids).values_list('map', 'name'):
+        names.setdefault(name, set()).add(map_id)
+    keywords = dict([ (i, set()) for i in ids ])
+    if not names: return keywords
+    layers = Layer.objects.filter(Q(typename__in=names.keys()) | Q(name__in=names.keys()))
+    layers = layers.values_list('id', 'typename', 'name')
+    layer_keywords = _keywords_for(Layer, [l[0] for l in layers])
+    for layer_id, typename, name in layers:
+        for map_id in names.get(typename, set()) | names.get(name, set()):
+            keywords[map_id].update(layer_keywords[layer_id])
+    return keywords
+
+
+def _counts_by_owner(model, user_ids):
+    counts = model.objects.filter(owner__in=user_ids).values('owner').annotate(n=Count('id'))
+    return dict([ (c['owner'], c['n']) for c in counts ])
+
+
+def _prefetch_resources(normalizers):
+    model = normalizers[0].o._meta.concrete_model
+    # reload any deferred objects at once instead of in as_dict
+    deferred = [ n for n in normalizers if n.o._deferred ]
+    if deferred:
+        fresh = model.objects.in_bulk([ n.o.pk for n in deferred ])
+        for n in deferred:
+            relevance = getattr(n.o, 'relevance', None)
+            n.o = fresh.get(n.o.pk, n.o)
+            if relevance is not None:
+                n.o.relevance = relevance
+
+    objs = [ n.o for n in normalizers ]
+    lookups = ['owner', 'category', 'thumbnail']
+    if model is Layer:
+        lookups.extend(['link_set', 'styles'])
+    if hasattr(model, 'spatial_temporal_index'):
+        # the extent of _bbox, indexed only with geodjango
+        lookups.append('spatial_temporal_index')
+    prefetch_related_objects(objs, lookups)
+
+    ids = [ o.id for o in objs ]
+    if model is Map:
+        keywords = _map_keywords_for(ids)
+    else:
+        keywords = _keywords_for(model, ids)
+    for n in normalizers:
+        n.keywords = list(keywords[n.o.id])
+
+
+def _prefetch_owners(normalizers):
+    contacts = [ n.o for n in normalizers ]
+    prefetch_related_objects(contacts, ['user'])
+    users = [ c.user for c in contacts if c.user ]
+    prefetch_related_objects(users, ['avatar_set'])
+    user_ids = [ u.id for u in users ]
+    layer_cnt = _counts_by_owner(Layer, user_ids)
+    map_cnt = _counts_by_owner(Map, user_ids)
+    doc_cnt = _counts_by_owner(Document, user_ids)
+    for n in normalizers:
+        user_id = n.o.user_id
+        n.counts = {
+            'layer_cnt': layer_cnt.get(user_id, 0),
+            'map_cnt': map_cnt.get(user_id, 0),
+            'doc_cnt': doc_cnt.get(user_id, 0),
+        }
+
+
+def prefetch(normalizers):
+    '''load what populate needs for a page of normalizers in a fixed number
+    of queries per model, instead of a few queries for each result'''
+    by_model = {}
+    for n in normalizers:
+        if n.dict is not None: continue
+        by_model.setdefault(n.o._meta.concrete_model, []).append(n)
+    for model, group in by_model.items():
+        if issubclass(model, ResourceBase):
+            _prefetch_resources(group)
+        else:
+            _prefetch_owners(group)
+
+
 def apply_normalizers(results):
     '''build the appropriate normalizers for the query set(s) and annotate'''
     normalized = []
@@ -110,10 +211,18 @@ class Normalizer:
     The fields we support sorting on are rank, title, last_modified.
     Instead of storing these (to keep pickle query size small), expose via methods.
     '''
+    # set by prefetch, otherwise populate queries them per object
+    keywords = None
+    counts = None
+
     def __init__(self,o,data = None):
         self.o = o
         self.data = data
         self.dict = None
+    def keyword_list(self):
+        if self.keywords is None:
+            return self.o.keyword_list()
+        return self.keywords
     def rank(self):
         return self.rating
     def title(self):
@@ -144,8 +253,10 @@ class MapNormalizer(Normalizer):
     def populate(self, doc, exclude):
         mapobj = self.o
         # resolve any local layers and their keywords
-        local_kw = [ l.keyword_list() for l in mapobj.local_layers if l.keywords]
-        keywords = local_kw and list(set( reduce(lambda a,b: a+b, local_kw))) or []
+        keywords = self.keywords
+        if keywords is None:
+            local_kw = [ l.keyword_list() for l in mapobj.local_layers if l.keywords]
+            keywords = local_kw and list(set( reduce(lambda a,b: a+b, local_kw))) or []
         doc['id'] = mapobj.id
         doc['title'] = mapobj.title
         doc['abstract'] = defaultfilters.linebreaks(mapobj.abstract)
@@ -181,7 +292,7 @@ class LayerNormalizer(Normalizer):
         doc['_display_type'] = extension.LAYER_DISPLAY
         if 'bbox' not in exclude:
             doc['bbox'] = _bbox(layer)
-        doc['keywords'] = layer.keyword_list()
+        doc['keywords'] = self.keyword_list()
         doc['title'] = layer.title
         doc['detail'] = layer.get_absolute_url()
         if 'download_links' not in exclude:
@@ -223,7 +334,7 @@ class DocumentNormalizer(Normalizer):
         doc['_type'] = 'document'
         doc['_display_type'] = extension.DOCUMENT_DISPLAY
 #        doc['thumb'] = map.get_thumbnail_url()
-        doc['keywords'] = document.keyword_list()
+        doc['keywords'] = self.keyword_list()
         if 'bbox' not in exclude:
             doc['bbox'] = _bbox(document)
         return doc
@@ -244,7 +355,7 @@ class WFPDocumentNormalizer(Normalizer):
         doc['_type'] = 'document'
         doc['_display_type'] = extension.DOCUMENT_DISPLAY
 #        doc['thumb'] = map.get_thumbnail_url()
-        doc['keywords'] = document.keyword_list()
+        doc['keywords'] = self.keyword_list()
         if 'bbox' not in exclude:
             doc['bbox'] = _bbox(document)
         return doc
@@ -280,9 +391,12 @@ class OwnerNormalizer(Normalizer):
         modified = self.last_modified()
         doc['last_modified'] = extension.date_fmt(modified) if modified else ''
         doc['detail'] = contact.get_absolute_url()
-        doc['layer_cnt'] = Layer.objects.filter(owner = user).count()
-        doc['map_cnt'] = Map.objects.filter(owner = user).count()
-        doc['doc_cnt'] = Document.objects.filter(owner = user).count()
+        if self.counts is not None:
+            doc.update(self.counts)
+        else:
+            doc['layer_cnt'] = self.layer_count()
+            doc['map_cnt'] = self.map_count()
+            doc['doc_cnt'] = self.document_count()
         doc['_type'] = 'owner'
         doc['_display_type'] = extension.USER_DISPLAY
         return doc
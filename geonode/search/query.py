@@ -149,11 +149,10 @@ class Query(object):
 
 
     def cache_key(self):
-        '''the cache key is based on filters, the user, the version, and the text query'''
-        from django.core.cache import cache
-        cache_version = cache.get('cache_version')
-        if not cache_version:
-            cache.set('cache_version', 1)
+        '''the cache key is based on filters, the user, the version of the
+        searched types, and the text query'''
+        from geonode.search import caching
+        cache_version = caching.get_version(*caching.query_dependencies(self.type))
         fhash = reduce(operator.xor, map(hash, self.params.items()))
         key = str(fhash ^ hash(self.user.username if self.user else 31) 
             ^ hash(cache_version) ^ hash(self.query))
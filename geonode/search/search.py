@@ -21,10 +21,9 @@ from django.contrib.auth.models import Permission
 from django.contrib.auth.models import User
 from django.contrib.contenttypes.models import ContentType
 from django.db import backend
-from django.db.models import Q
+from django.db.models import Q, Count
 
-from geonode.security.models import UserObjectRoleMapping, GenericObjectRoleMapping
-from geonode.security.enumerations import ANONYMOUS_USERS, AUTHENTICATED_USERS
+from geonode.security.models import ObjectPermissionIndex
 from geonode.maps.models import Map
 from geonode.documents.models import Document
 from geonode.layers.models import Layer
@@ -32,6 +31,7 @@ from geonode.people.models import Profile
 from geonode.base.models import TopicCategory, ResourceBase
 
 from geonode.search import extension
+from geonode.search import fulltext
 from geonode.search.models import filter_by_period
 from geonode.search.models import filter_by_extent
 from geonode.search.models import using_geodjango
@@ -60,18 +60,12 @@ def _filter_security(q, user, model, permission):
     ct = ContentType.objects.get_for_model(model)
     p = Permission.objects.get(content_type=ct, codename=permission)
 
-    # apply generic role filters
-    generic_roles = [ANONYMOUS_USERS]
-    if user and not user.is_anonymous():
-        generic_roles.append(AUTHENTICATED_USERS)
-    grm = GenericObjectRoleMapping.objects.filter(object_ct=ct, role__permissions__in=[p], subject__in=generic_roles).values('object_id')
-    security = Q(id__in=grm)
+    # objects granted to the user or its generic roles, read from the
+    # denormalized permission index
+    security = Q(id__in=ObjectPermissionIndex.objects.object_ids(user, p, ct))
 
-    # apply specific user filters
+    # if the user is the owner, make sure these are included
     if user and not user.is_anonymous():
-        urm = UserObjectRoleMapping.objects.filter(object_ct=ct, role__permissions__in=[p], user=user).values('object_id')
-        security = security | Q(id__in=urm)
-        # if the user is the owner, make sure these are included
         security = security | Q(owner=user)
 
     return q.filter(security)
@@ -123,6 +117,8 @@ def _build_map_layer_text_query(q, query, query_keywords=False):
 
     return a Q object
     '''
+    if fulltext.enabled():
+        return fulltext.text_query(q, query)
     # title or abstract contains entire phrase
     subquery = [Q(title__icontains=query.query),Q(abstract__icontains=query.query)]
     # tile or abstract contains pieces of entire phrase
@@ -138,6 +134,17 @@ def _build_map_layer_text_query(q, query, query_keywords=False):
     return q
 
 
+def _add_resource_relevance(q, query):
+    '''add the relevance of the text query to a ResourceBase derived query'''
+    if fulltext.enabled():
+        return fulltext.add_relevance(q.defer(None), query)
+    rules = _rank_rules(ResourceBase,
+        ['title',10, 5],
+        ['abstract',5, 2],
+    )
+    return _safely_add_relevance(q, query, rules)
+
+
 def _build_kw_only_query(keywords):
     return reduce(operator.or_, [Q(keywords__slug__contains=kw) for kw in keywords])
     
@@ -217,11 +224,7 @@ def _get_map_results(query):
 
     if query.query:
         q = _build_map_layer_text_query(q, query, query_keywords=True)
-        rules = _rank_rules(ResourceBase,
-            ['title',10, 5],
-            ['abstract',5, 2],
-        )
-        q = _safely_add_relevance(q, query, rules)
+        q = _add_resource_relevance(q, query)
 
     return q.distinct()
 
@@ -265,13 +268,11 @@ def _get_layer_results(query):
         q = q.defer(None).prefetch_related("owner","spatial_temporal_index")
 
     if query.query:
-        q = _build_map_layer_text_query(q, query, query_keywords=True) |\
-            q.filter(name__icontains=query.query) # map doesn't have name
-        rules = _rank_rules(ResourceBase,
-            ['title',10, 5],
-            ['abstract',5, 2],
-        )
-        q = _safely_add_relevance(q, query, rules)
+        text_q = _build_map_layer_text_query(q, query, query_keywords=True)
+        # map doesn't have name, the full text vector already includes it
+        if not fulltext.enabled():
+            text_q = text_q | q.filter(name__icontains=query.query)
+        q = _add_resource_relevance(text_q, query)
 
     return q.distinct()
 
@@ -328,14 +329,17 @@ def _get_document_results(query, is_wfpdocument=False):
 
     if query.query:
         q = _build_map_layer_text_query(q, query, query_keywords=True)
-        rules = _rank_rules(ResourceBase,
-            ['title',10, 5],
-            ['abstract',5, 2],
-        )
-        q = _safely_add_relevance(q, query, rules)
+        q = _add_resource_relevance(q, query)
 
     return q.distinct()
 
+def _facet_counts(q, field):
+    '''count the results of the query grouped by the given field using a
+    single aggregate query. returns a dict of field value -> count'''
+    # clear the ordering as it would otherwise be added to the GROUP BY
+    counts = q.order_by().values(field).annotate(facet_count=Count('id', distinct=True))
+    return dict((c[field], c['facet_count']) for c in counts)
+
 def combined_search_results(query):
 
     facets = dict([ (k,0) for k in ('map', 'layer', 'vector', 'raster', 
@@ -359,10 +363,11 @@ def combined_search_results(query):
                 q = q.exclude(storeType='coverageStore')
             if not u'remote' in bytype:
                 q = q.exclude(storeType='remoteStore')
-        facets['layer'] = q.count()
-        facets['raster'] = q.filter(storeType='coverageStore').count()
-        facets['vector'] = q.filter(storeType='dataStore').count()
-        facets['remote'] = q.filter(storeType='remoteStore').count()
+        store_counts = _facet_counts(q, 'storeType')
+        facets['layer'] = sum(store_counts.values())
+        facets['raster'] = store_counts.get('coverageStore', 0)
+        facets['vector'] = store_counts.get('dataStore', 0)
+        facets['remote'] = store_counts.get('remoteStore', 0)
         results['layers'] = q
 
     if None in bytype or u'document' in bytype:
@@ -382,3 +387,82 @@ def combined_search_results(query):
             results['users'] = q
             
     return results
+
+
+# result keys of combined_search_results, in the order they are normalized
+_RESULT_FACETS = (
+    ('maps', 'map'),
+    ('layers', 'layer'),
+    ('documents', 'document'),
+    ('wfpdocuments', 'wfpdocument'),
+    ('users', 'user'),
+)
+
+
+def _sort_select(model, sort):
+    '''the sql expression a model's results are sorted by, or None if the
+    sort field is not available in the database'''
+    rb = ResourceBase._meta.db_table
+    if model is Profile:
+        user = '(SELECT %%s FROM "%s" WHERE "%s"."id" = "%s"."user_id")' % (
+            User._meta.db_table, User._meta.db_table, Profile._meta.db_table)
+        if sort == 'title':
+            return user % ("lower(coalesce(nullif(trim(first_name || ' ' || last_name), ''), username))")
+        if sort == 'last_modified':
+            return user % 'date_joined'
+        return None
+    if sort == 'title':
+        return 'lower("%s"."title")' % rb
+    if sort == 'last_modified':
+        if model is Map:
+            return '"%s"."last_modified"' % Map._meta.db_table
+        return '"%s"."date"' % rb
+    return None
+
+
+def _sort_rows(q, query, ratings, n):
+    '''fetch the (sort value, id) pairs of the first n results of the query
+    as sorted by the search, without loading the objects themselves'''
+    if query.sort == 'rank':
+        # ratings are cached, so rank on all of the ids
+        return [(float(ratings.get(i, 0)), i) for i in q.values_list('id', flat=True)]
+    prefix = '' if query.order else '-'
+    if query.sort == 'relevance':
+        if 'relevance' not in q.query.extra_select:
+            return [(0, i) for i in q.values_list('id', flat=True)[:n]]
+        return list(q.order_by(prefix + 'relevance', 'id').values_list('relevance', 'id')[:n])
+    select = _sort_select(q.model, query.sort) if query.sort else None
+    if select is None:
+        return [(0, i) for i in q.values_list('id', flat=True)[:n]]
+    q = q.extra(select={'sort_value': select})
+    return list(q.order_by(prefix + 'sort_value', 'id').values_list('sort_value', 'id')[:n])
+
+
+def paginate_results(query, results, get_ratings):
+    '''sort the results of combined_search_results in the database and
+    select the requested page, so only the rows of the page need to be
+    loaded and normalized.
+
+    get_ratings(model) returns the cached rating of each object id, used for
+    the 'rank' sort.
+
+    returns a tuple of the page, a list of (model, id) in result order, and
+    the total number of results.
+    '''
+    n = query.start + query.limit
+    rows = []
+    total = 0
+    for key, facet in _RESULT_FACETS:
+        q = results.get(key)
+        if q is None:
+            continue
+        total += results['facets'][facet]
+        ratings = get_ratings(q.model) if query.sort == 'rank' else None
+        rows.extend([(value, q.model, i) for value, i in _sort_rows(q, query, ratings, n)])
+
+    # python sorts are stable, so ties keep the per-type result order as
+    # they did when sorting normalized results
+    if query.sort is not None:
+        rows.sort(key=lambda r: r[0], reverse=not query.order)
+    page = [(model, i) for value, model, i in rows[query.start:n]]
+    return page, total
@@ -358,3 +358,89 @@ class searchTest(TestCase):
             [('name', 10, 1), ('title', 10, 5), ('abstract', 5, 2)])])
         assert_rules([(User, [('username', 10, 5)]),
                       (Profile, [('organization', 5, 2)])])
+
+    def test_facet_counts(self):
+        query = query_from_request(MockRequest(q='', type='layer'), {})
+        results = search.combined_search_results(query)
+        facets = results['facets']
+        layers = results['layers']
+        self.assertEquals(layers.count(), facets['layer'])
+        self.assertEquals(layers.filter(storeType='coverageStore').count(), facets['raster'])
+        self.assertEquals(layers.filter(storeType='dataStore').count(), facets['vector'])
+        self.assertEquals(layers.filter(storeType='remoteStore').count(), facets['remote'])
+
+    def test_fulltext_query(self):
+        from geonode.search import fulltext
+        query = query_from_request(MockRequest(q='foo bar'), {})
+        sql, params = fulltext._tsquery(query)
+        # the whole phrase and each of its words are OR'ed together
+        self.assertEquals(3, sql.count('plainto_tsquery'))
+        self.assertEquals(2, sql.count('||'))
+        terms = params[1::2]
+        self.assertEquals(['foo bar', 'foo', 'bar'], terms)
+        # never enabled on the sqlite test database
+        self.assertFalse(fulltext.enabled())
+
+    def test_paginate_in_database(self):
+        # a page selected in the database matches the same slice of the
+        # fully normalized and sorted results
+        for sort in ('alphaaz', 'alphaza', 'newest', 'oldest'):
+            full = json.loads(self.request('common', sort=sort, limit='none').content)
+            paged = json.loads(self.request('common', sort=sort, start=10, limit=5).content)
+            self.assertEquals(full['total'], paged['total'])
+            self.assertEquals([r['title'] for r in full['results'][10:15]],
+                              [r['title'] for r in paged['results']])
+
+    def test_prefetch(self):
+        from geonode.search.normalizers import apply_normalizers, prefetch
+        query = query_from_request(MockRequest(q='common'), {})
+        def normalized(bulk):
+            items = apply_normalizers(search.combined_search_results(query))
+            for i, item in enumerate(items):
+                item.iid = i
+            if bulk:
+                prefetch(items)
+            return [ item.as_dict(()) for item in items ]
+        plain = normalized(False)
+        bulk = normalized(True)
+        self.assertEquals(len(plain), len(bulk))
+        for a, b in zip(plain, bulk):
+            if 'keywords' in a:
+                self.assertEquals(sorted(a.pop('keywords')), sorted(b.pop('keywords')))
+            self.assertEquals(a, b)
+
+        # the extents come with the page too
+        from geonode.base.models import ResourceBase
+        from geonode.search.normalizers import _bbox
+        items = apply_normalizers(search.combined_search_results(query))
+        prefetch(items)
+        with self.assertNumQueries(0):
+            for item in items:
+                if isinstance(item.o, ResourceBase):
+                    _bbox(item.o)
+
+    def test_cache_invalidation(self):
+        from geonode.search import caching
+        layer = Layer.objects.all()[0]
+        version = caching.get_version('layer')
+        tags_version = caching.get_version('keywords', 'membership')
+
+        # view counters are not searchable
+        layer.popular_count += 1
+        layer.save(update_fields=['popular_count'])
+        self.assertEquals(version, caching.get_version('layer'))
+
+        layer.title = layer.title + ' changed'
+        layer.save()
+        self.assertNotEquals(version, caching.get_version('layer'))
+        # a title change doesn't touch the keyword facets
+        self.assertEquals(tags_version, caching.get_version('keywords', 'membership'))
+
+        layer.keywords.add('cacheinvalidation')
+        self.assertNotEquals(tags_version, caching.get_version('keywords', 'membership'))
+
+        # an expired version key does not bring back an older version
+        from django.core.cache import cache
+        changed = caching.get_version('layer')
+        cache.delete(caching._VERSION_KEY % 'layer')
+        self.assertFalse(caching.get_version('layer') in (version, changed))
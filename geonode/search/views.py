@@ -31,8 +31,12 @@ from geonode.maps.models import Map
 from geonode.documents.models import Document
 from geonode.people.models import Profile 
 from geonode.search.search import combined_search_results
+from geonode.search.search import paginate_results
+from geonode.search import caching
 from geonode.search.util import resolve_extension
 from geonode.search.normalizers import apply_normalizers
+from geonode.search.normalizers import _get_ratings
+from geonode.search.normalizers import prefetch
 from geonode.search.query import query_from_request
 from geonode.search.query import BadQuery
 from geonode.base.models import TopicCategory
@@ -64,17 +68,13 @@ def search_page(request, template='search/search.html', **kw):
     initial_query = request.REQUEST.get('q','')
     results, facets, query = search_api(request, format='html', **kw)
     
-    # cache is per user and per version
-    # every time an object is added and removed (TODO) cache version is increased
+    # cache is per user and per version of the data each facet depends on
     cache_user_prefix = 'unlogged'
     if not request.user.is_anonymous():
         cache_user_prefix = request.user.username
-        
-    cache_version = cache.get('cache_version')
-    if not cache_version:
-        cache.set('cache_version', 1)
-    
+
     # get the wfp categories and their count (just for wfpdocuments!)
+    cache_version = caching.get_version('document', 'membership')
     categories = cache.get('%s_categories' % cache_user_prefix, version=cache_version)
     if not categories:
         categories = {}
@@ -89,6 +89,7 @@ def search_page(request, template='search/search.html', **kw):
         cache.set('%s_categories' % cache_user_prefix, categories, version=cache_version)
         
     # get the regions and their count
+    cache_version = caching.get_version('regions', 'membership')
     regions = cache.get('%s_regions' % cache_user_prefix, version=cache_version)
     if not regions:
         regions = {}
@@ -103,6 +104,7 @@ def search_page(request, template='search/search.html', **kw):
         cache.set('%s_regions' % cache_user_prefix, regions, version=cache_version)
     
     # get the keywords and their count
+    cache_version = caching.get_version('keywords', 'membership')
     tags = cache.get('%s_tags' % cache_user_prefix, version=cache_version)
     if not tags:
         tags = {}
@@ -185,12 +187,16 @@ def search_api(request, format='json', **kwargs):
     ts = time()
     try:
         query = query_from_request(request, kwargs)
-        items, facets = _search(query)
+        total = None
+        if format != 'html' and _can_paginate(query):
+            items, facets, total = _search_page(query)
+        else:
+            items, facets = _search(query)
         ts1 = time() - ts
         if debug:
             ts = time()
         if format != 'html':
-            results = _search_json(query, items, facets, ts1)
+            results = _search_json(query, items, facets, ts1, total)
         if debug:
             ts2 = time() - ts
             logger.debug('generated combined search results in %s, %s',ts1,ts2)
@@ -209,11 +215,12 @@ def search_api(request, format='json', **kwargs):
             'errors' : [str(ex)]
         }), status=400)
 
-def _search_json(query, items, facets, time):
-    total = len(items)
-
-    if query.limit is not None and query.limit > 0:
-        items = items[query.start:query.start + query.limit]
+def _search_json(query, items, facets, time, total=None):
+    # items are already the requested page if the total is given
+    if total is None:
+        total = len(items)
+        if query.limit is not None and query.limit > 0:
+            items = items[query.start:query.start + query.limit]
 
     # unique item id for ext store (this could be done client side)
     iid = query.start
@@ -223,6 +230,7 @@ def _search_json(query, items, facets, time):
 
     exclude = query.params.get('exclude')
     exclude = set(exclude.split(',')) if exclude else ()
+    prefetch(items)
     items = map(lambda r: r.as_dict(exclude), items)
 
     results = {
@@ -278,6 +286,34 @@ def _search(query):
     return results, facets
 
 
+def _can_paginate(query):
+    '''the page can be selected in the database unless all the results were
+    requested or an extension post-processes the full result list'''
+    return (query.limit is not None and query.limit > 0 and
+            resolve_extension('process_search_results') is None)
+
+
+def _search_page(query):
+    '''sort and page the results in the database, normalizing only the
+    objects of the requested page'''
+    results = combined_search_results(query)
+    facets = results['facets']
+    page, total = paginate_results(query, results, _get_ratings)
+
+    page_results = {}
+    for key, q in results.items():
+        if key == 'facets':
+            continue
+        ids = [i for model, i in page if model is q.model]
+        if ids:
+            page_results[key] = q.filter(id__in=ids)
+    items = apply_normalizers(page_results)
+
+    position = dict((p, n) for n, p in enumerate(page))
+    items.sort(key=lambda r: position.get((type(r.o), r.o.id), len(page)))
+    return items, facets, total
+
+
 def author_list(req):
     q = User.objects.all()
 
@@ -18,12 +18,54 @@
 #
 #########################################################################
 
+from collections import OrderedDict
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.contenttypes.models import ContentType 
+from django.core.cache import cache
+from django.contrib.auth import get_backends
 from django.db import models
-from geonode.security.models import GenericObjectRoleMapping, Permission, UserObjectRoleMapping
+from django.db.models.query import QuerySet
+from geonode.security.models import GenericObjectRoleMapping, Permission, UserObjectRoleMapping, \
+    ObjectPermissionIndex, object_perms_version
 from geonode.security.enumerations import ANONYMOUS_USERS, AUTHENTICATED_USERS
 
+# most objects whose permissions are remembered on a user object
+OBJECT_PERMISSION_CACHE_SIZE = getattr(settings, 'OBJECT_PERMISSION_CACHE_SIZE', 1000)
+
+
+class LRUCache(object):
+    """
+    a mapping holding at most size entries, dropping the least
+    recently used one first.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.entries = OrderedDict()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key, default=None):
+        try:
+            value = self.entries.pop(key)
+        except KeyError:
+            return default
+        self.entries[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        self.entries.pop(key, None)
+        self.entries[key] = value
+        if len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+
 class GranularBackend(ModelBackend):
     """
     A granular permissions backend that supports row-level 
@@ -45,6 +87,10 @@ class GranularBackend(ModelBackend):
 
     def get_all_permissions(self, user_obj, obj=None):
         """
+        Returns the permission strings the user has on obj. They are kept
+        in a bounded cache on the user object and, when
+        OBJECT_PERMISSION_CACHE_TIMEOUT is set, in the Django cache under
+        the version of the object's role mappings.
         """
         
         if obj is None:
@@ -55,16 +101,13 @@ class GranularBackend(ModelBackend):
                 return set()
             
             if not hasattr(user_obj, '_obj_perm_cache'):
-                # TODO: this cache should really be bounded.
-                # repoze.lru perhaps?
-                user_obj._obj_perm_cache = dict()
-            try:
-                obj_key = self._cache_key_for_obj(obj)
-                return user_obj._obj_perm_cache[obj_key]
-            except KeyError:
-                all_perms = ['%s.%s' % p for p in self._get_all_obj_perms(user_obj, obj)]
+                user_obj._obj_perm_cache = LRUCache(OBJECT_PERMISSION_CACHE_SIZE)
+            obj_key = self._cache_key_for_obj(obj)
+            all_perms = user_obj._obj_perm_cache.get(obj_key)
+            if all_perms is None:
+                all_perms = self._get_shared_obj_perms(user_obj, obj, obj_key)
                 user_obj._obj_perm_cache[obj_key] = all_perms
-                return all_perms
+            return all_perms
 
     def has_perm(self, user_obj, perm, obj=None):
         if obj is None:
@@ -78,6 +121,22 @@ class GranularBackend(ModelBackend):
             else:
                 return perm in self.get_all_permissions(user_obj, obj=obj)
 
+    def ids_with_perm(self, user_obj, perm, ModelType, ids):
+        """
+        select the identifiers among ids (a list or a queryset of
+        ModelType) of the objects the user has the permission 'perm' for,
+        in two queries whatever their number.
+        """
+        if isinstance(ids, QuerySet):
+            ids = ids.values_list('pk', flat=True)
+        ct = ContentType.objects.get_for_model(ModelType)
+        granted = ObjectPermissionIndex.objects.object_ids(user_obj, perm, ct).filter(object_id__in=ids)
+        obj_ids = set([x['object_id'] for x in granted])
+        # owners always have permissions, as in has_perm
+        if not user_obj.is_anonymous() and 'owner' in [f.name for f in ModelType._meta.fields]:
+            obj_ids.update(ModelType.objects.filter(pk__in=ids, owner=user_obj).values_list('pk', flat=True))
+        return obj_ids
+
     def _cache_key_for_obj(self, obj):
         model = obj.__class__
         opts = model._meta
@@ -88,6 +147,22 @@ class GranularBackend(ModelBackend):
         return key
     
         
+    def _get_shared_obj_perms(self, user_obj, obj, obj_key):
+        """
+        get all permission strings for user on obj through the Django cache
+        """
+        timeout = getattr(settings, 'OBJECT_PERMISSION_CACHE_TIMEOUT', 0)
+        if not timeout:
+            return ['%s.%s' % p for p in self._get_all_obj_perms(user_obj, obj)]
+        user_key = 'anonymous' if user_obj.is_anonymous() else user_obj.id
+        key = 'object_perms_%s.%s.%s_%s' % (obj_key + (user_key,))
+        version = object_perms_version(*obj_key)
+        all_perms = cache.get(key, version=version)
+        if all_perms is None:
+            all_perms = ['%s.%s' % p for p in self._get_all_obj_perms(user_obj, obj)]
+            cache.set(key, all_perms, timeout, version=version)
+        return all_perms
+
     def _get_generic_obj_perms(self, generic_roles, obj):
         perms = set()
         ct = ContentType.objects.get_for_model(obj)
@@ -146,3 +221,27 @@ class GranularBackend(ModelBackend):
         app_label = perm[0:ps]
         codename = perm[ps+1:]
         return Permission.objects.get(content_type__app_label=app_label, codename=codename)
+
+
+def permitted_ids(user, perm, objects):
+    """
+    the ids of objects (a queryset or a list of model instances) the user
+    has the permission 'perm' for, evaluated in bulk by the backends that
+    support it instead of calling user.has_perm for each object.
+    """
+    if isinstance(objects, QuerySet):
+        ModelType, ids = objects.model, objects
+    else:
+        objects = list(objects)
+        if not objects:
+            return set()
+        ModelType, ids = objects[0].__class__, [obj.pk for obj in objects]
+    if user.is_active and user.is_superuser:
+        return set(ids.values_list('pk', flat=True) if isinstance(ids, QuerySet) else ids)
+    obj_ids = set()
+    for backend in get_backends():
+        if hasattr(backend, 'ids_with_perm'):
+            obj_ids.update(backend.ids_with_perm(user, perm, ModelType, ids))
+        elif hasattr(backend, 'has_perm'):
+            obj_ids.update([obj.pk for obj in objects if backend.has_perm(user, perm, obj)])
+    return obj_ids
@@ -22,11 +22,14 @@ from django.contrib.auth.models import User, Permission
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.generic import GenericForeignKey
 from django.db import models
+from django.db.models import Q, signals
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ObjectDoesNotExist
 from django.contrib.auth import login
 
-from geonode.security.enumerations import GENERIC_GROUP_NAMES
+from geonode.security.enumerations import GENERIC_GROUP_NAMES, \
+    ANONYMOUS_USERS, AUTHENTICATED_USERS
+from geonode.utils import get_cache_versions, bump_cache_version
 
 class ObjectRoleManager(models.Manager):
     def get_by_natural_key(self, codename, app_label, model):
@@ -108,6 +111,111 @@ class GenericObjectRoleMapping(models.Model):
         unique_together = (('subject', 'object_ct', 'object_id', 'role'), )
 
 
+class ObjectPermissionIndexManager(models.Manager):
+
+    def object_ids(self, user, permission, object_ct):
+        """
+        returns a values queryset of the ids of the objects of the given
+        content type on which the user holds the given permission, either
+        directly or through one of the generic groups. permission is a
+        Permission or an 'app_label.codename' string.
+        """
+        authenticated = user and not user.is_anonymous()
+        if authenticated:
+            generic_roles = [ANONYMOUS_USERS, AUTHENTICATED_USERS]
+        else:
+            generic_roles = [ANONYMOUS_USERS]
+        subjects = Q(subject__in=generic_roles)
+        if authenticated:
+            subjects = subjects | Q(user=user)
+        if isinstance(permission, basestring):
+            app_label, codename = permission.split('.', 1)
+            permission = Q(permission__content_type__app_label=app_label,
+                           permission__codename=codename)
+        else:
+            permission = Q(permission=permission)
+        return self.filter(subjects, permission,
+                           object_ct=object_ct).values('object_id')
+
+    def index_mapping(self, mapping, previous=None):
+        """
+        (re)create the index rows for a user or generic role mapping.
+        previous is the mapping as it was before being changed, whose
+        rows are replaced.
+        """
+        self.unindex_mapping(previous or mapping)
+        self.bulk_create([self.model(object_ct_id=mapping.object_ct_id,
+                                     object_id=mapping.object_id,
+                                     role_id=mapping.role_id,
+                                     permission=perm,
+                                     **self._subject_for(mapping, lookup=False))
+                          for perm in mapping.role.permissions.all()])
+
+    def unindex_mapping(self, mapping):
+        self.filter(object_ct=mapping.object_ct_id,
+                    object_id=mapping.object_id,
+                    role=mapping.role_id,
+                    **self._subject_for(mapping)).delete()
+
+    def reindex_role(self, role):
+        """
+        rebuild the index rows of every mapping that grants the given role,
+        eg after its permissions changed.
+        """
+        self.filter(role=role).delete()
+        for mapping in role.user_mappings.all():
+            self.index_mapping(mapping)
+        for mapping in role.generic_mappings.all():
+            self.index_mapping(mapping)
+
+    def rebuild(self):
+        """
+        drop and rebuild the whole index from the role mappings.
+        """
+        self.all().delete()
+        for role in ObjectRole.objects.all():
+            self.reindex_role(role)
+
+    def _subject_for(self, mapping, lookup=True):
+        """
+        the user or generic subject of a mapping, as filter lookups or as
+        model field values (a foreign key id must be set on its attname)
+        """
+        if isinstance(mapping, UserObjectRoleMapping):
+            return {'user' if lookup else 'user_id': mapping.user_id}
+        return {'subject': mapping.subject}
+
+
+class ObjectPermissionIndex(models.Model):
+    """
+    denormalized copy of the user and generic role mappings holding one
+    row per permission granted on an object, so that selecting the objects
+    a user can see does not have to join through roles and permissions.
+
+    rows are maintained from the role mapping signals and should never be
+    edited by hand; use ObjectPermissionIndex.objects.rebuild() to
+    recreate the index from scratch.
+    """
+
+    object_ct = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+
+    permission = models.ForeignKey(Permission)
+    role = models.ForeignKey(ObjectRole, related_name="permission_index")
+
+    # exactly one of user and subject is set
+    user = models.ForeignKey(User, null=True, blank=True, related_name="permission_index")
+    subject = models.CharField(max_length=100, null=True, blank=True, choices=sorted(GENERIC_GROUP_NAMES.items()))
+
+    objects = ObjectPermissionIndexManager()
+
+    class Meta:
+        index_together = (
+            ('object_ct', 'permission', 'subject'),
+            ('object_ct', 'permission', 'user'),
+        )
+
+
 class PermissionLevelError(Exception):
     pass
 
@@ -239,6 +347,72 @@ class PermissionLevelMixin(object):
 
         return levels
 
+_OBJECT_PERMS_VERSION_KEY = 'object_perms_version_%s'
+
+
+def object_perms_version(app_label, model, object_id):
+    """
+    the version of the cached permissions on the given object, to be
+    passed as the version of cache get and set calls.
+    """
+    keys = [_OBJECT_PERMS_VERSION_KEY % 'roles',
+            _OBJECT_PERMS_VERSION_KEY % '%s.%s.%s' % (app_label, model, object_id)]
+    return '.'.join([str(v) for v in get_cache_versions(keys)])
+
+
+def invalidate_object_perms(name):
+    """
+    bump the version of the cached permissions on an object
+    ('app_label.model.id'), or on all of them ('roles').
+    """
+    bump_cache_version(_OBJECT_PERMS_VERSION_KEY % name)
+
+
+def snapshot_role_mapping(instance, sender, raw=False, **kwargs):
+    # the index rows of a changed mapping are found from its old values
+    instance._indexed_mapping = None
+    if instance.pk is not None and not raw:
+        previous = list(sender.objects.filter(pk=instance.pk)[:1])
+        instance._indexed_mapping = previous[0] if previous else None
+
+def index_role_mapping(instance, sender, **kwargs):
+    ObjectPermissionIndex.objects.index_mapping(instance, getattr(instance, '_indexed_mapping', None))
+
+def unindex_role_mapping(instance, sender, **kwargs):
+    ObjectPermissionIndex.objects.unindex_mapping(instance)
+
+def reindex_role_permissions(instance, sender, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if reverse:
+        # instance is a Permission, pk_set holds roles (None when cleared)
+        roles = ObjectRole.objects.filter(Q(pk__in=pk_set or []) |
+                                          Q(permission_index__permission=instance)).distinct()
+    else:
+        roles = [instance]
+    for role in roles:
+        ObjectPermissionIndex.objects.reindex_role(role)
+
+def object_perms_changed(instance, sender, **kwargs):
+    ct = ContentType.objects.get_for_id(instance.object_ct_id)
+    invalidate_object_perms('%s.%s.%s' % (ct.app_label, ct.model, instance.object_id))
+
+def role_perms_changed(instance, sender, action, **kwargs):
+    if action.startswith('post_'):
+        invalidate_object_perms('roles')
+
+signals.pre_save.connect(snapshot_role_mapping, sender=UserObjectRoleMapping)
+signals.pre_save.connect(snapshot_role_mapping, sender=GenericObjectRoleMapping)
+signals.post_save.connect(index_role_mapping, sender=UserObjectRoleMapping)
+signals.post_save.connect(index_role_mapping, sender=GenericObjectRoleMapping)
+signals.post_delete.connect(unindex_role_mapping, sender=UserObjectRoleMapping)
+signals.post_delete.connect(unindex_role_mapping, sender=GenericObjectRoleMapping)
+signals.m2m_changed.connect(reindex_role_permissions, sender=ObjectRole.permissions.through)
+for mapping in (UserObjectRoleMapping, GenericObjectRoleMapping):
+    signals.post_save.connect(object_perms_changed, sender=mapping)
+    signals.post_delete.connect(object_perms_changed, sender=mapping)
+signals.m2m_changed.connect(role_perms_changed, sender=ObjectRole.permissions.through)
+
 # Logic to login a user automatically when it has successfully
 # activated an account:
 def autologin(sender, **kwargs):
@@ -4,6 +4,8 @@ from django.http import HttpRequest
 from django.test import TestCase
 from django.test.client import Client
 
+from geonode.search.populate_search_test_data import create_models
+
 class SecurityTest(TestCase):
     """
     Tests for the Geonode security app.
@@ -67,3 +69,136 @@ class SecurityTest(TestCase):
             request.path = path
             response = middleware.process_request(request)
             self.assertIsNone(response)
+
+
+class ObjectPermissionIndexTest(TestCase):
+    """
+    Tests that the denormalized permission index follows the role mappings.
+    """
+
+    fixtures = ['initial_data.json', 'bobby']
+
+    def setUp(self):
+        create_models(type='layer')
+
+    def test_index_follows_levels(self):
+        from django.contrib.contenttypes.models import ContentType
+        from django.contrib.auth.models import Permission
+        from geonode.layers.models import Layer
+        from geonode.security.enumerations import ANONYMOUS_USERS, AUTHENTICATED_USERS
+        from geonode.security.models import ObjectPermissionIndex
+
+        layer = Layer.objects.all()[0]
+        ct = ContentType.objects.get_for_model(Layer)
+        view = Permission.objects.get(content_type=ct, codename='view_layer')
+        bobby = User.objects.get(username='bobby')
+
+        def visible(user):
+            ids = ObjectPermissionIndex.objects.object_ids(user, view, ct)
+            return layer.id in [x['object_id'] for x in ids]
+
+        layer.set_gen_level(ANONYMOUS_USERS, layer.LEVEL_NONE)
+        layer.set_gen_level(AUTHENTICATED_USERS, layer.LEVEL_NONE)
+        layer.set_user_level(bobby, layer.LEVEL_NONE)
+        self.assertFalse(visible(AnonymousUser()))
+        self.assertFalse(visible(bobby))
+
+        layer.set_user_level(bobby, layer.LEVEL_READ)
+        self.assertFalse(visible(AnonymousUser()))
+        self.assertTrue(visible(bobby))
+
+        layer.set_gen_level(ANONYMOUS_USERS, layer.LEVEL_READ)
+        self.assertTrue(visible(AnonymousUser()))
+
+        layer.set_user_level(bobby, layer.LEVEL_NONE)
+        layer.set_gen_level(ANONYMOUS_USERS, layer.LEVEL_NONE)
+        self.assertFalse(visible(bobby))
+
+        layer.set_gen_level(AUTHENTICATED_USERS, layer.LEVEL_READ)
+        self.assertTrue(visible(bobby))
+        self.assertFalse(visible(AnonymousUser()))
+        layer.set_gen_level(AUTHENTICATED_USERS, layer.LEVEL_NONE)
+
+        # editing a mapping in place revokes what it granted before
+        from geonode.security.models import UserObjectRoleMapping
+        other = User.objects.create(username='other')
+        layer.set_user_level(bobby, layer.LEVEL_READ)
+        mapping = UserObjectRoleMapping.objects.get(user=bobby, object_ct=ct, object_id=layer.id)
+        mapping.user = other
+        mapping.save()
+        self.assertFalse(visible(bobby))
+        self.assertTrue(visible(other))
+
+        # a rebuild produces the same rows as the incremental updates
+        before = ObjectPermissionIndex.objects.count()
+        ObjectPermissionIndex.objects.rebuild()
+        self.assertEquals(before, ObjectPermissionIndex.objects.count())
+
+
+class ObjectPermissionCacheTest(TestCase):
+    """
+    Tests the object permission caches of the GranularBackend.
+    """
+
+    fixtures = ['initial_data.json', 'bobby']
+
+    def setUp(self):
+        create_models(type='layer')
+
+    def test_lru_cache(self):
+        from geonode.security.auth import LRUCache
+        lru = LRUCache(2)
+        lru['a'] = 1
+        lru['b'] = 2
+        lru.get('a')
+        lru['c'] = 3
+        # 'b' was the least recently used
+        self.assertEquals(len(lru), 2)
+        self.assertTrue('a' in lru and 'c' in lru)
+        self.assertFalse('b' in lru)
+
+    def test_shared_cache_follows_levels(self):
+        from geonode.layers.models import Layer
+        from geonode.security.enumerations import ANONYMOUS_USERS, AUTHENTICATED_USERS
+
+        bobby = User.objects.get(username='bobby')
+        layer = Layer.objects.exclude(owner=bobby)[0]
+        layer.set_gen_level(ANONYMOUS_USERS, layer.LEVEL_NONE)
+        layer.set_gen_level(AUTHENTICATED_USERS, layer.LEVEL_NONE)
+
+        def can_view(user):
+            # a fresh user object, as in a new request
+            return User.objects.get(pk=user.pk).has_perm('layers.view_layer', obj=layer)
+
+        with self.settings(OBJECT_PERMISSION_CACHE_TIMEOUT=60):
+            self.assertFalse(can_view(bobby))
+            with self.assertNumQueries(1):
+                # only the user is fetched, the permissions come from the cache
+                self.assertFalse(can_view(bobby))
+            layer.set_user_level(bobby, layer.LEVEL_READ)
+            self.assertTrue(can_view(bobby))
+            layer.set_user_level(bobby, layer.LEVEL_NONE)
+            self.assertFalse(can_view(bobby))
+
+    def test_versions_do_not_repeat(self):
+        from django.core.cache import cache
+        from geonode.security.models import object_perms_version, invalidate_object_perms
+
+        first = object_perms_version('layers', 'layer', 1)
+        invalidate_object_perms('layers.layer.1')
+        second = object_perms_version('layers', 'layer', 1)
+        self.assertNotEquals(first, second)
+        # the version key expired, entries cached under the old ones must stay unused
+        cache.delete('object_perms_version_layers.layer.1')
+        self.assertFalse(object_perms_version('layers', 'layer', 1) in (first, second))
+
+    def test_permitted_ids(self):
+        from geonode.layers.models import Layer
+        from geonode.security.auth import permitted_ids
+
+        bobby = User.objects.get(username='bobby')
+        layers = Layer.objects.all()
+        for user in (AnonymousUser(), bobby):
+            expected = set([l.id for l in layers if user.has_perm('layers.view_layer', obj=l)])
+            with self.assertNumQueries(2 if user is bobby else 1):
+                self.assertEquals(permitted_ids(user, 'layers.view_layer', layers), expected)
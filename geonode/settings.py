@@ -20,6 +20,7 @@
 
 # Django settings for the GeoNode project.
 import os
+import sys
 
 #
 # General Django development settings
@@ -329,6 +330,14 @@ LOGIN_REDIRECT_URL = "/"
 #
 DEFAULT_SEARCH_SIZE = 10
 
+# To match search text with PostgreSQL full text search (tsvector + GIN
+# index) instead of icontains, run `python manage.py update_search_vectors`
+# once after enabling:
+#SIMPLE_SEARCH_SETTINGS = {
+#    'text_backend': 'fulltext',
+#    'text_search_config': 'english',
+#}
+
 
 #
 # Settings for third party apps
@@ -399,9 +408,50 @@ MODIFY_TOPICCATEGORY = False
 
 MISSING_THUMBNAIL = 'geonode/img/missing_thumb.png'
 
+# Sizes (width, height) the thumbnails are derived in for lists and icons,
+# see the thumbnail_url template filter
+THUMBNAIL_SIZES = {
+    'small': (80, 60),
+    'medium': (120, 90),
+}
+
 # Search Snippet Cache Time in Seconds
 CACHE_TIME=0
 
+# Object permissions remembered per user object during a request, and the
+# seconds they are shared between requests through the cache (0 disables)
+OBJECT_PERMISSION_CACHE_SIZE = 1000
+OBJECT_PERMISSION_CACHE_TIMEOUT = 0
+
+# Seconds between the bulk writes of pending view counts (popular_count)
+# made by the requests of a process, `manage.py flush_counters` writes the
+# counts of idle sites
+COUNTER_FLUSH_INTERVAL = 60
+
+# Seconds the GeoServer WMS capabilities are kept before being refreshed
+WMS_CAPABILITIES_TTL = 300
+
+# Background jobs (GeoServer synchronization of saved layers). The local
+# broker runs them in a worker thread of the web process, use
+# 'geonode.base.jobs.ImmediateBroker' to run them in the request or
+# 'geonode.base.jobs.DatabaseBroker' to leave them to `manage.py run_jobs`.
+# Whatever the broker, run_jobs must run from cron to pick up the jobs lost
+# by restarted processes
+JOB_BROKER = 'geonode.base.jobs.LocalBroker'
+# Threads of the local broker, so that thumbnails render alongside syncs
+JOB_WORKERS = 2
+# Times a failed job is run again before it is marked as failed
+JOB_MAX_RETRIES = 3
+# Seconds before the first retry of a failed job, doubled for the second...
+JOB_RETRY_DELAY = 60
+# Seconds after which a job still running is considered lost, run_jobs
+# makes it pending again
+JOB_TIMEOUT = 3600
+# The unit tests run without GeoServer, and worker threads would not see
+# their database: jobs are left pending, the tests check the Job rows
+if 'test' in sys.argv:
+    JOB_BROKER = 'geonode.base.jobs.DatabaseBroker'
+
 # OGC (WMS/WFS/WCS) Server Settings
 OGC_SERVER = {
     'default' : {
@@ -432,6 +482,15 @@ UPLOADER = {
     'OPTIONS' : {
         'TIME_ENABLED': False,
         'GEOGIT_ENABLED': False,
+        # Pass the uploaded files to the GeoServer importer as file:// urls
+        # instead of sending them, when GeoServer runs on the same host
+        'USE_URL': False,
+        # Size of the chunks of resumable browser uploads, how long an
+        # unfinished or unused chunked upload is kept, in seconds, and the
+        # largest file that can be sent this way
+        'CHUNK_SIZE': 4 * 1024 * 1024,
+        'CHUNKED_UPLOAD_EXPIRY': 24 * 3600,
+        'CHUNKED_UPLOAD_MAX_SIZE': 2 * 1024 * 1024 * 1024,
     }
 }
 
@@ -591,6 +650,11 @@ PROXY_ALLOWED_HOSTS = ()
 # The proxy to use when making cross origin requests.
 PROXY_URL = '/proxy/?url='
 
+# Seconds the OGC documents fetched through the proxy are cached, by request
+# type, e.g. {'GetCapabilities': 300, 'DescribeFeatureType': 300}. Empty to
+# disable the cache.
+PROXY_CACHE = {}
+
 
 # Load more settings from a file called local_settings.py if it exists
 try:
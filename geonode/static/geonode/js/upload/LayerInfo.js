@@ -8,6 +8,7 @@ define(function (require, exports) {
         fileTypes = require('upload/FileTypes'),
         path     = require('upload/path'),
         common     = require('upload/common'),
+        chunked  = require('upload/chunked'),
         LayerInfo;
 
     /** Creates an instance of a LayerInfo
@@ -139,16 +140,25 @@ define(function (require, exports) {
     };
 
     /** Build a new FormData object from the current state of the
-     *  LayerInfo object.
+     *  LayerInfo object. Files sent in chunks beforehand are given by
+     *  the id of their upload, from the uploads object keyed by name.
      * 
      *  @returns {FromData}
      */
-    LayerInfo.prototype.prepareFormData = function (form_data) {
-        var i, ext, file, perm, geogit, geogit_store, time;
+    LayerInfo.prototype.prepareFormData = function (form_data, uploads) {
+        var i, ext, file, perm, geogit, geogit_store, time, append;
 
         if (!form_data) {
             form_data = new FormData();
         }
+        uploads = uploads || {};
+        append = function (field, file) {
+            if (uploads[file.name] !== undefined) {
+                form_data.append(field + '_upload', uploads[file.name]);
+            } else {
+                form_data.append(field, file);
+            }
+        };
         // this should be generate from the permission widget
         if (typeof permissionsString == 'undefined'){
             perm = {}
@@ -172,14 +182,14 @@ define(function (require, exports) {
             form_data.append('time', time);
         } 
 
-        form_data.append('base_file', this.main);
+        append('base_file', this.main);
         form_data.append('permissions', JSON.stringify(perm));
 
         for (i = 0; i < this.files.length; i += 1) {
             file = this.files[i];
             if (file.name !== this.main.name) {
                 ext = path.getExt(file);
-                form_data.append(ext + '_file', file);
+                append(ext + '_file', file);
             }
         }
 
@@ -379,7 +389,42 @@ define(function (require, exports) {
      *  @returns
      */
     LayerInfo.prototype.uploadFiles = function () {
-        var form_data = this.prepareFormData(),
+        var self = this,
+            large = $.grep(this.files, function (file) {
+                return file.size > chunked.threshold;
+            }),
+            uploads = {},
+            sendNext;
+
+        // large files are sent in resumable chunks before the form
+        sendNext = function (i) {
+            if (i === large.length) {
+                self.postForm(uploads);
+                return;
+            }
+            chunked.upload(large[i], function (fraction) {
+                var pct = (i + fraction) / large.length * 100;
+                $('#prog > .bar').css('width', pct.toPrecision(3) + '%');
+            }).then(function (id) {
+                uploads[large[i].name] = id;
+                sendNext(i + 1);
+            }, function (jqXHR) {
+                self.markError('Could not send ' + large[i].name + ', please try again to resume the upload');
+            });
+        };
+        if (large.length > 0) {
+            this.markStart();
+        }
+        sendNext(0);
+    };
+
+    /** Function to post the upload form
+     *
+     *  @params {uploads} the ids of the files sent in chunks
+     *  @returns
+     */
+    LayerInfo.prototype.postForm = function (uploads) {
+        var form_data = this.prepareFormData(undefined, uploads),
             self = this;
         var prog = "";
         $.ajaxQueue({
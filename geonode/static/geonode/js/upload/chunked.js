@@ -0,0 +1,186 @@
+/*global define:true, $:true, window:true */
+'use strict';
+
+define(function (require, exports) {
+
+    var MD5 = require('upload/md5').MD5,
+        url = '/upload/chunked/',
+        parallel = 3,
+        retries = 5,
+        readSize = 4 * 1024 * 1024,
+        storageKey,
+        readSlice,
+        checksum,
+        start,
+        resume,
+        sendChunks;
+
+    /** files larger than this are sent in chunks */
+    exports.threshold = 4 * 1024 * 1024;
+
+    storageKey = function (file) {
+        return 'geonode-upload:' + [file.name, file.size, file.lastModifiedDate].join(':');
+    };
+
+    /** a promise of the bytes of a part of the file */
+    readSlice = function (file, start, end) {
+        var deferred = $.Deferred(),
+            reader = new window.FileReader();
+
+        reader.onload = function () {
+            deferred.resolve(reader.result);
+        };
+        reader.onerror = function () {
+            deferred.reject(reader.error);
+        };
+        reader.readAsArrayBuffer(file.slice(start, end));
+        return deferred.promise();
+    };
+
+    /** a promise of the hex MD5 of the whole file, read piece by piece */
+    checksum = function (file) {
+        var deferred = $.Deferred(),
+            md5 = new MD5(),
+            read;
+
+        read = function (offset) {
+            if (offset >= file.size) {
+                deferred.resolve(md5.hex());
+                return;
+            }
+            readSlice(file, offset, offset + readSize).then(function (buffer) {
+                md5.append(buffer);
+                read(offset + readSize);
+            }, deferred.reject);
+        };
+        read(0);
+        return deferred.promise();
+    };
+
+    /** start a new upload, which the server verifies against the checksum */
+    start = function (file) {
+        return checksum(file).then(function (md5) {
+            return $.ajax({
+                url: url,
+                type: 'POST',
+                data: {name: file.name, size: file.size, checksum: md5}
+            });
+        });
+    };
+
+    /** the status of a previous upload of the file, or a new one */
+    resume = function (file) {
+        var id = window.localStorage && window.localStorage.getItem(storageKey(file)),
+            deferred = $.Deferred();
+
+        if (!id) {
+            return start(file);
+        }
+        $.ajax({url: url + id, type: 'GET'}).then(
+            function (status) { deferred.resolve(status); },
+            function () {
+                start(file).then(deferred.resolve, deferred.reject);
+            }
+        );
+        return deferred.promise();
+    };
+
+    sendChunks = function (file, status, progress) {
+        var deferred = $.Deferred(),
+            missing = status.missing.slice(0),
+            count = Math.max(1, Math.ceil(file.size / status.chunk_size)),
+            done = count - missing.length,
+            running = 0,
+            failed = false,
+            next;
+
+        next = function () {
+            var offset, end, attempt = 0, put;
+
+            if (failed) {
+                return;
+            }
+            if (missing.length === 0) {
+                if (running === 0) {
+                    deferred.resolve(status);
+                }
+                return;
+            }
+            offset = missing.shift();
+            end = Math.min(offset + status.chunk_size, file.size);
+            running += 1;
+
+            put = function () {
+                readSlice(file, offset, end).then(function (buffer) {
+                    return $.ajax({
+                        url: status.url,
+                        type: 'PUT',
+                        data: buffer,
+                        processData: false,
+                        contentType: 'application/octet-stream',
+                        headers: {
+                            'Content-Range': 'bytes ' + offset + '-' + (end - 1) + '/' + file.size,
+                            'Content-MD5': new MD5().append(buffer).base64()
+                        }
+                    });
+                }).then(function (resp) {
+                    running -= 1;
+                    done += 1;
+                    status = resp;
+                    if (progress) {
+                        progress(done / count);
+                    }
+                    next();
+                }, function (jqXHR) {
+                    attempt += 1;
+                    if (attempt < retries && jqXHR.status !== 400 && jqXHR.status !== 404) {
+                        window.setTimeout(put, 1000 * attempt);
+                    } else {
+                        failed = true;
+                        deferred.reject(jqXHR);
+                    }
+                });
+            };
+            put();
+        };
+
+        while (running < parallel && missing.length > 0) {
+            next();
+        }
+        if (missing.length === 0 && running === 0) {
+            deferred.resolve(status);
+        }
+        return deferred.promise();
+    };
+
+    /** Send the file in parallel chunks, resuming a previous upload of the
+     *  same file if there is one.
+     *
+     *  @params {file, progress} progress is called with the fraction sent
+     *  @returns a promise of the id of the complete upload
+     */
+    exports.upload = function (file, progress) {
+        var deferred = $.Deferred();
+
+        var send = function (status) {
+            if (window.localStorage) {
+                window.localStorage.setItem(storageKey(file), status.id);
+            }
+            sendChunks(file, status, progress).then(function (status) {
+                if (status.complete) {
+                    if (window.localStorage) {
+                        window.localStorage.removeItem(storageKey(file));
+                    }
+                    deferred.resolve(status.id);
+                } else {
+                    // a response may have been overtaken, ask what is missing
+                    $.ajax({url: status.url, type: 'GET'}).then(send, deferred.reject);
+                }
+            }, deferred.reject);
+        };
+
+        resume(file).then(send, deferred.reject);
+        return deferred.promise();
+    };
+
+});
@@ -0,0 +1,120 @@
+/*global define:true, window:true */
+'use strict';
+
+/** Incremental MD5 of ArrayBuffers, to checksum the chunks of an upload
+ *  without holding the whole file in memory.
+ */
+define(function (require, exports) {
+
+    var SHIFTS = [7, 12, 17, 22, 5, 9, 14, 20, 4, 11, 16, 23, 6, 10, 15, 21],
+        SINES = [],
+        cycle,
+        MD5,
+        i;
+
+    for (i = 0; i < 64; i += 1) {
+        SINES[i] = Math.floor(Math.abs(Math.sin(i + 1)) * 4294967296) | 0;
+    }
+
+    /** process one 64 bytes block, given as 16 little endian words */
+    cycle = function (state, words) {
+        var a = state[0], b = state[1], c = state[2], d = state[3],
+            f, g, x, s, tmp, i;
+
+        for (i = 0; i < 64; i += 1) {
+            if (i < 16) {
+                f = (b & c) | (~b & d);
+                g = i;
+            } else if (i < 32) {
+                f = (d & b) | (~d & c);
+                g = (5 * i + 1) % 16;
+            } else if (i < 48) {
+                f = b ^ c ^ d;
+                g = (3 * i + 5) % 16;
+            } else {
+                f = c ^ (b | ~d);
+                g = (7 * i) % 16;
+            }
+            x = (a + f + SINES[i] + words[g]) | 0;
+            s = SHIFTS[(i >> 4) * 4 + (i % 4)];
+            tmp = d;
+            d = c;
+            c = b;
+            b = (b + ((x << s) | (x >>> (32 - s)))) | 0;
+            a = tmp;
+        }
+        state[0] = (state[0] + a) | 0;
+        state[1] = (state[1] + b) | 0;
+        state[2] = (state[2] + c) | 0;
+        state[3] = (state[3] + d) | 0;
+    };
+
+    MD5 = exports.MD5 = function () {
+        this.state = [1732584193, -271733879, -1732584194, 271733878];
+        this.block = new Uint8Array(64);
+        this.used = 0;
+        this.length = 0;
+    };
+
+    /** add the bytes of an ArrayBuffer or Uint8Array */
+    MD5.prototype.append = function (buffer) {
+        var bytes = buffer instanceof Uint8Array ? buffer : new Uint8Array(buffer),
+            words = [],
+            i,
+            j;
+
+        for (i = 0; i < bytes.length; i += 1) {
+            this.block[this.used] = bytes[i];
+            this.used += 1;
+            if (this.used === 64) {
+                for (j = 0; j < 16; j += 1) {
+                    words[j] = this.block[j * 4] | (this.block[j * 4 + 1] << 8) |
+                        (this.block[j * 4 + 2] << 16) | (this.block[j * 4 + 3] << 24);
+                }
+                cycle(this.state, words);
+                this.used = 0;
+            }
+        }
+        this.length += bytes.length;
+        return this;
+    };
+
+    /** the digest as 16 bytes, the MD5 can not be appended to afterwards */
+    MD5.prototype.digest = function () {
+        var bits = this.length * 8,
+            padding = new Uint8Array(((this.used < 56) ? 56 : 120) - this.used + 8),
+            result = new Uint8Array(16),
+            i;
+
+        padding[0] = 0x80;
+        for (i = 0; i < 8; i += 1) {
+            // the length in bits, little endian; exact up to 2^53 bits
+            padding[padding.length - 8 + i] = Math.floor(bits / Math.pow(2, 8 * i)) & 0xff;
+        }
+        this.append(padding);
+        for (i = 0; i < 16; i += 1) {
+            result[i] = (this.state[i >> 2] >>> ((i % 4) * 8)) & 0xff;
+        }
+        return result;
+    };
+
+    MD5.prototype.hex = function () {
+        var digest = this.digest(), hex = '', i;
+
+        for (i = 0; i < digest.length; i += 1) {
+            hex += (digest[i] < 16 ? '0' : '') + digest[i].toString(16);
+        }
+        return hex;
+    };
+
+    /** the digest in base64, as in a Content-MD5 header */
+    MD5.prototype.base64 = function () {
+        var digest = this.digest(), binary = '', i;
+
+        for (i = 0; i < digest.length; i += 1) {
+            binary += String.fromCharCode(digest[i]);
+        }
+        return window.btoa(binary);
+    };
+
+});
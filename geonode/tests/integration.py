@@ -32,6 +32,7 @@ from django.core.exceptions import ObjectDoesNotExist
 from django.core.management import call_command
 from django.test import Client
 from django.test import LiveServerTestCase as TestCase
+from django.test.utils import override_settings
 from django.core.urlresolvers import reverse
 
 from geoserver.catalog import FailedRequestError
@@ -63,6 +64,11 @@ LOGIN_URL= "/accounts/login/"
 import logging
 logging.getLogger("south").setLevel(logging.INFO)
 
+# the tests check GeoServer right after saving layers, synchronize them
+# in the request as the unit tests leave the jobs pending
+immediate_jobs = override_settings(JOB_BROKER='geonode.base.jobs.ImmediateBroker')
+
+@immediate_jobs
 class GeoNodeCoreTest(TestCase):
     """Tests geonode.security app/module
     """
@@ -73,6 +79,7 @@ class GeoNodeCoreTest(TestCase):
     def tearDown(self):
         pass
 
+@immediate_jobs
 class GeoNodeProxyTest(TestCase):
     """Tests geonode.proxy app/module
     """
@@ -84,6 +91,7 @@ class GeoNodeProxyTest(TestCase):
         pass
 
 
+@immediate_jobs
 class NormalUserTest(TestCase):
     """
     Tests GeoNode functionality for non-administrative users
@@ -119,6 +127,7 @@ class NormalUserTest(TestCase):
         self.assertEquals(resp.status_code, 200)
 
 
+@immediate_jobs
 class GeoNodeMapTest(TestCase):
     """Tests geonode.maps app/module
     """
@@ -521,6 +530,7 @@ class GeoNodeMapTest(TestCase):
                                 })
         self.assertEquals(response.status_code, 302)
 
+@immediate_jobs
 class GeoNodeMapPrintTest(TestCase):
     """Tests geonode.maps print
     """
@@ -16,7 +16,7 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 #
 #########################################################################
-from geonode.upload.models import Upload, UploadFile
+from geonode.upload.models import Upload, UploadFile, ChunkedUpload
 
 from django.contrib import admin
 
@@ -34,3 +34,4 @@ class UploadAdmin(admin.ModelAdmin):
     
 admin.site.register(Upload, UploadAdmin)
 admin.site.register(UploadFile)
+admin.site.register(ChunkedUpload)
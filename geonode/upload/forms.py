@@ -18,6 +18,7 @@
 #########################################################################
 from django import forms
 from django.conf import settings
+from django.core.files.move import file_move_safe
 from geonode.layers.forms import JSONField
 from geonode.upload.models import UploadFile 
 from geonode.utils import ogc_server_settings
@@ -84,8 +85,13 @@ class LayerUploadForm(forms.Form):
         tempdir = tempfile.mkdtemp(dir=settings.FILE_UPLOAD_TEMP_DIR)
         for field in self.spatial_files:
             f = self.cleaned_data[field]
-            if f is not None:
-                path = os.path.join(tempdir, f.name)
+            if f is None:
+                continue
+            path = os.path.join(tempdir, f.name)
+            if hasattr(f, 'temporary_file_path'):
+                # large and chunked uploads are already on disk
+                file_move_safe(f.temporary_file_path(), path)
+            else:
                 with open(path, 'w') as writable:
                     for c in f.chunks():
                         writable.write(c)
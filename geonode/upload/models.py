@@ -24,14 +24,18 @@ from geonode.utils import ogc_server_settings
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.files.uploadedfile import UploadedFile
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, IntegrityError
 
 import cPickle as pickle
-from datetime import datetime
+from datetime import datetime, timedelta
+import hashlib
 import logging
+import os
 from os import path
 import shutil
+import tempfile
 
 
 class UploadManager(models.Manager):
@@ -137,3 +141,169 @@ class UploadFile(models.Model):
     def delete(self, *args, **kwargs):
         self.file.delete(False)
         super(UploadFile, self).delete(*args, **kwargs)
+
+
+_options = getattr(settings, 'UPLOADER', dict()).get('OPTIONS', dict())
+CHUNK_SIZE = _options.get('CHUNK_SIZE', 4 * 1024 * 1024)
+CHUNKED_UPLOAD_EXPIRY = _options.get('CHUNKED_UPLOAD_EXPIRY', 24 * 3600)
+CHUNKED_UPLOAD_MAX_SIZE = _options.get('CHUNKED_UPLOAD_MAX_SIZE', 2 * 1024 * 1024 * 1024)
+
+
+class ChunkedUploadedFile(UploadedFile):
+    """The assembled file of a chunked upload, as found in request.FILES"""
+
+    def __init__(self, chunked):
+        UploadedFile.__init__(self, open(chunked.path, 'rb'), chunked.name,
+                              None, chunked.size, None)
+        self.chunked = chunked
+
+    def temporary_file_path(self):
+        return self.chunked.path
+
+
+class ChunkedUploadManager(models.Manager):
+
+    def start(self, user, name, size, checksum=''):
+        """create the upload and its file, sized to receive the chunks"""
+        self.expire()
+        fd, filename = tempfile.mkstemp(prefix='chunked', dir=settings.FILE_UPLOAD_TEMP_DIR)
+        try:
+            os.ftruncate(fd, size)
+        finally:
+            os.close(fd)
+        return self.create(user=user, name=name, size=size, checksum=checksum,
+                           chunk_size=CHUNK_SIZE, path=filename)
+
+    def expire(self):
+        """remove the uploads not written to for CHUNKED_UPLOAD_EXPIRY seconds"""
+        limit = datetime.now() - timedelta(seconds=CHUNKED_UPLOAD_EXPIRY)
+        for chunked in self.filter(updated__lt=limit):
+            chunked.delete()
+
+    def uploaded_files(self, user, data, files):
+        """a copy of the request files, adding the complete chunked uploads
+        of the user that <field>_upload parameters refer to"""
+        files = files.copy()
+        for key, value in data.items():
+            if not key.endswith('_upload'):
+                continue
+            try:
+                chunked = self.get(pk=int(value), user=user, complete=True)
+            except (ValueError, self.model.DoesNotExist):
+                continue
+            if path.exists(chunked.path):
+                files[key[:-len('_upload')]] = ChunkedUploadedFile(chunked)
+        return files
+
+
+class ChunkedUpload(models.Model):
+    """A file sent in chunks of chunk_size bytes, which can be sent in
+    parallel and sent again after a failure. The chunks received are
+    recorded as UploadChunk rows."""
+    objects = ChunkedUploadManager()
+
+    user = models.ForeignKey(User)
+    name = models.CharField(max_length=255)
+    size = models.BigIntegerField()
+    chunk_size = models.IntegerField()
+    # md5 of the whole file, if the client provided it
+    checksum = models.CharField(max_length=32, blank=True)
+    path = models.CharField(max_length=255)
+    complete = models.BooleanField(default=False)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class ChecksumError(Exception):
+        pass
+
+    def chunk_count(self):
+        return max(1, (self.size + self.chunk_size - 1) // self.chunk_size)
+
+    def missing(self):
+        """the offsets of the chunks not received yet"""
+        received = set(self.uploadchunk_set.values_list('offset', flat=True))
+        offsets = [i * self.chunk_size for i in range(self.chunk_count())]
+        return [o for o in offsets if o not in received]
+
+    def write_chunk(self, offset, stream, length, checksum=None):
+        """write the chunk starting at offset, read from stream. checksum
+        is the md5 the client computed for it; the chunk is not recorded
+        if it does not match. Returns True once all the chunks are in."""
+        if offset % self.chunk_size or offset >= max(self.size, 1):
+            raise ValueError('%s is not the offset of a chunk' % offset)
+        if length != min(self.chunk_size, self.size - offset):
+            raise ValueError('wrong chunk length %s at offset %s' % (length, offset))
+        md5 = hashlib.md5()
+        with open(self.path, 'r+b') as f:
+            f.seek(offset)
+            remaining = length
+            while remaining:
+                data = stream.read(min(remaining, 64 * 1024))
+                if not data:
+                    raise ValueError('chunk at offset %s is truncated' % offset)
+                md5.update(data)
+                f.write(data)
+                remaining -= len(data)
+        digest = md5.hexdigest()
+        if checksum and checksum.lower() != digest:
+            self.uploadchunk_set.filter(offset=offset).delete()
+            raise self.ChecksumError('checksum mismatch for the chunk at offset %s' % offset)
+        try:
+            chunk, created = UploadChunk.objects.get_or_create(
+                upload=self, offset=offset, defaults={'size': length, 'checksum': digest})
+        except IntegrityError:
+            # the same chunk sent again while the first PUT was not done,
+            # that one records it
+            pass
+        else:
+            if not created and chunk.checksum != digest:
+                UploadChunk.objects.filter(pk=chunk.pk).update(checksum=digest)
+        ChunkedUpload.objects.filter(pk=self.pk).update(updated=datetime.now())
+        if self.uploadchunk_set.count() < self.chunk_count():
+            return False
+        return self.finish()
+
+    def finish(self):
+        """verify the whole file against the checksum, if any. On a mismatch
+        the chunks are forgotten so that the client sends them again."""
+        if self.checksum:
+            md5 = hashlib.md5()
+            with open(self.path, 'rb') as f:
+                for data in iter(lambda: f.read(64 * 1024), ''):
+                    md5.update(data)
+            if md5.hexdigest() != self.checksum.lower():
+                self.uploadchunk_set.all().delete()
+                raise self.ChecksumError('checksum mismatch for %s' % self.name)
+        ChunkedUpload.objects.filter(pk=self.pk).update(complete=True)
+        self.complete = True
+        return True
+
+    def status(self):
+        return {
+            'id': self.pk,
+            'url': reverse('data_upload_chunked', args=[self.pk]),
+            'name': self.name,
+            'size': self.size,
+            'chunk_size': self.chunk_size,
+            'missing': self.missing(),
+            'complete': self.complete,
+        }
+
+    def delete(self, *args, **kwargs):
+        super(ChunkedUpload, self).delete(*args, **kwargs)
+        if path.exists(self.path):
+            os.unlink(self.path)
+
+    def __unicode__(self):
+        return 'ChunkedUpload [%s] %s, %s' % (self.pk, self.name, self.user)
+
+
+class UploadChunk(models.Model):
+    upload = models.ForeignKey(ChunkedUpload)
+    offset = models.BigIntegerField()
+    size = models.IntegerField()
+    # md5 of the chunk
+    checksum = models.CharField(max_length=32)
+
+    class Meta:
+        unique_together = (('upload', 'offset'),)
@@ -17,9 +17,14 @@
 #
 #########################################################################
 import geonode.upload.files as files
+from geonode.upload.models import ChunkedUpload
 from geonode.upload.utils import rename_and_prepare
 
+from django.contrib.auth.models import User
+from django.test import TestCase
+
 import contextlib
+import hashlib
 import os
 import shutil
 import tempfile
@@ -74,3 +79,62 @@ class FilesTests(unittest.TestCase):
 
 
 
+
+    def test_multipart_body(self):
+        from geonode.geoserver.uploader.uploader import _MultipartBody
+        with create_files(['layer.shp', 'layer.dbf']) as tests:
+            with open(tests[0], 'w') as f:
+                f.write('x' * 200000)
+            body = _MultipartBody(tests, [('name', 'layer')])
+            data = ''
+            while True:
+                chunk = body.read(8192)
+                if not chunk:
+                    break
+                data += chunk
+            # the announced length is what is sent
+            self.assertEqual(len(body), len(data))
+            self.assertTrue('x' * 200000 + '\r\n--' + body.BOUNDARY in data)
+            self.assertTrue(data.endswith('--' + body.BOUNDARY + '--\r\n'))
+
+
+class ChunkedUploadTest(TestCase):
+
+    def test_chunks(self):
+        from StringIO import StringIO
+        user = User.objects.create(username='chunky')
+        data = os.urandom(2500)
+        chunked = ChunkedUpload.objects.start(user, 'layer.zip', len(data),
+                                              hashlib.md5(data).hexdigest())
+        chunked.chunk_size = 1000
+        try:
+            self.assertEqual([0, 1000, 2000], chunked.missing())
+            # chunks are written in any order
+            self.assertFalse(chunked.write_chunk(2000, StringIO(data[2000:]), 500))
+            self.assertRaises(ValueError, chunked.write_chunk, 500, StringIO(data[500:1500]), 1000)
+            self.assertRaises(ChunkedUpload.ChecksumError, chunked.write_chunk,
+                              0, StringIO(data[:1000]), 1000, hashlib.md5('x').hexdigest())
+            self.assertEqual([0, 1000], chunked.missing())
+            self.assertFalse(chunked.write_chunk(0, StringIO(data[:1000]), 1000))
+            self.assertTrue(chunked.write_chunk(1000, StringIO(data[1000:2000]), 1000))
+            self.assertEqual(data, open(chunked.path, 'rb').read())
+
+            files = ChunkedUpload.objects.uploaded_files(user, {'base_file_upload': str(chunked.pk)}, {})
+            self.assertEqual('layer.zip', files['base_file'].name)
+            self.assertEqual(chunked.path, files['base_file'].temporary_file_path())
+            # only the owner can use it
+            other = User.objects.create(username='other')
+            self.assertEqual({}, ChunkedUpload.objects.uploaded_files(other, {'base_file_upload': str(chunked.pk)}, {}))
+        finally:
+            chunked.delete()
+        self.assertFalse(os.path.exists(chunked.path))
+
+    def test_size_limit(self):
+        from django.test.client import Client
+        from geonode.upload.models import CHUNKED_UPLOAD_MAX_SIZE
+        User.objects.create_user('chunky', 'chunky@example.com', 'chunky')
+        c = Client()
+        c.login(username='chunky', password='chunky')
+        response = c.post('/upload/chunked/', {'name': 'huge.zip', 'size': CHUNKED_UPLOAD_MAX_SIZE + 1})
+        self.assertEqual(400, response.status_code)
+        self.assertEqual(0, ChunkedUpload.objects.count())
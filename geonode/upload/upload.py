@@ -36,6 +36,7 @@ from geonode.base.models import SpatialRepresentationType
 from geonode.layers.utils import get_valid_layer_name
 from geonode.layers.utils import layer_type
 from geonode.layers.metadata import set_metadata
+from geonode.base import jobs
 from geonode.layers.models import Layer
 from geonode.layers.utils import layer_set_permissions
 from geonode.people.models import Profile 
@@ -246,10 +247,10 @@ def save_step(user, layer, base_file, overwrite=True):
         next_id = Upload.objects.all().aggregate(Max('import_id')).values()[0]
         next_id = next_id + 1 if next_id else 1
 
-        # @todo settings for use_url or auto detection if geoserver is
-        # on same host
+        # GeoServer reads the files itself when it shares the filesystem
+        use_url = getattr(settings, 'UPLOADER', dict()).get('OPTIONS', dict()).get('USE_URL', False)
         import_session = gs_uploader().upload(
-            base_file, use_url=False, import_id=next_id)
+            base_file, use_url=use_url, import_id=next_id)
             
         # save record of this whether valid or not - will help w/ debugging
         upload = Upload.objects.create_from_session(user, import_session)
@@ -529,19 +530,22 @@ def final_step(upload_session, user):
 
     storeType = 'dataStore' if target.resource_type == 'featureType' else 'coverageStore'
 
-    saved_layer, created = Layer.objects.get_or_create(
-        name=resource.name,
-        defaults=dict(
-            store=target.name,
-            storeType=storeType,
-            typename=typename,
-            workspace=target.workspace.name,
-            title=title or resource.title,
-            uuid=layer_uuid,
-            abstract=abstract or '',
-            owner=user,
+    # Synchronize the layer with GeoServer right away, callers expect its
+    # bounding box, links and attributes to be there
+    with jobs.immediate():
+        saved_layer, created = Layer.objects.get_or_create(
+            name=resource.name,
+            defaults=dict(
+                store=target.name,
+                storeType=storeType,
+                typename=typename,
+                workspace=target.workspace.name,
+                title=title or resource.title,
+                uuid=layer_uuid,
+                abstract=abstract or '',
+                owner=user,
+                )
             )
-        )
 
     # Should we throw a clearer error here?
     assert saved_layer is not None
@@ -582,7 +586,8 @@ def final_step(upload_session, user):
             else:
                 setattr(saved_layer, key, value)
 
-        saved_layer.save()
+        with jobs.immediate():
+            saved_layer.save()
 
     # Set default permissions on the newly created layer
     # FIXME: Do this as part of the post_save hook
@@ -34,7 +34,7 @@ This needs to be made more stateful by adding a model.
 from geonode.upload.forms import LayerUploadForm
 from geonode.utils import json_response as do_json_response
 from geonode.upload import forms
-from geonode.upload.models import Upload, UploadFile
+from geonode.upload.models import Upload, UploadFile, ChunkedUpload, CHUNKED_UPLOAD_MAX_SIZE
 from geonode.upload import upload
 from geonode.upload.utils import rename_and_prepare, find_sld, get_upload_type
 from geonode.upload.forms import UploadFileForm
@@ -54,9 +54,11 @@ from django.template import RequestContext
 from django.contrib.auth.decorators import login_required
 from django.views.generic import CreateView, DeleteView
 
+import base64
 import json
 import os
 import logging
+import re
 import traceback
 import uuid
 
@@ -213,7 +215,7 @@ def save_step_view(req, session):
 
     assert session is None
 
-    form = LayerUploadForm(req.POST, req.FILES)
+    form = LayerUploadForm(req.POST, ChunkedUpload.objects.uploaded_files(req.user, req.POST, req.FILES))
     tempdir = None
 
     if form.is_valid():
@@ -617,6 +619,64 @@ def delete(req, id):
 
 
 
+_CONTENT_RANGE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+@login_required
+def chunked(req, id=None):
+    """Resumable upload of a file in chunks.
+
+    POST name, size (CHUNKED_UPLOAD_MAX_SIZE bytes at most) and optionally
+    the md5 checksum of the whole file to start an upload; the response
+    gives its url and chunk_size. Each chunk is then PUT to that url with a
+    Content-Range header, in any order and in parallel, with an optional
+    Content-MD5 header. The upload page sends both checksums. GET on the url lists
+    the offsets of the chunks still missing, to resume an interrupted
+    upload. Once complete, the upload id can be given to the upload forms
+    as <field>_upload in place of the file.
+    """
+    if id is None:
+        if req.method != 'POST':
+            return HttpResponse(status=405)
+        try:
+            size = int(req.POST['size'])
+            name = os.path.basename(req.POST['name'])
+        except (KeyError, ValueError):
+            return json_response(errors='name and size are required', status=400)
+        if size < 0 or not name:
+            return json_response(errors='invalid name or size', status=400)
+        if size > CHUNKED_UPLOAD_MAX_SIZE:
+            return json_response(errors='files are limited to %s bytes' % CHUNKED_UPLOAD_MAX_SIZE, status=400)
+        chunked = ChunkedUpload.objects.start(req.user, name, size, req.POST.get('checksum', ''))
+        return json_response(chunked.status())
+
+    chunked = get_object_or_404(ChunkedUpload, pk=id, user=req.user)
+    if req.method == 'GET':
+        return json_response(chunked.status())
+    elif req.method == 'DELETE':
+        chunked.delete()
+        return json_response({'success': True})
+    elif req.method != 'PUT':
+        return HttpResponse(status=405)
+
+    match = _CONTENT_RANGE.match(req.META.get('HTTP_CONTENT_RANGE', ''))
+    if match is None:
+        return json_response(errors='a Content-Range header is required', status=400)
+    start, end, total = [int(g) for g in match.groups()]
+    if total != chunked.size:
+        return json_response(errors='the upload is %s bytes long' % chunked.size, status=400)
+    checksum = req.META.get('HTTP_CONTENT_MD5')
+    try:
+        if checksum:
+            checksum = base64.b64decode(checksum).encode('hex')
+        chunked.write_chunk(start, req, end - start + 1, checksum)
+    except ChunkedUpload.ChecksumError, e:
+        return json_response(errors=str(e), status=409)
+    except (TypeError, ValueError), e:
+        return json_response(errors=str(e), status=400)
+    return json_response(chunked.status())
+
+
 class UploadFileCreateView(CreateView):
     form_class = UploadFileForm
     model = UploadFile
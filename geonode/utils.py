@@ -21,11 +21,13 @@ import httplib2
 import base64
 import re
 import math
+import time
 
-from threading import local
-from urlparse import urlparse
+from threading import local, Lock, Thread
+from urlparse import urlparse, urljoin
 from collections import namedtuple
 from django.conf import settings
+from django.core.cache import cache
 from django.core.exceptions import PermissionDenied, ImproperlyConfigured
 from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import User
@@ -194,6 +196,9 @@ class OGC_Servers_Handler(object):
 ogc_server_settings = OGC_Servers_Handler(settings.OGC_SERVER)['default']
 
 _wms = None
+_wms_fetched = 0
+_wms_refreshing = False
+_wms_lock = Lock()
 _csw = None
 _user, _password = ogc_server_settings.credentials
 
@@ -228,9 +233,7 @@ def check_geonode_is_up():
     assert resp['status'] == '200', msg
        
 
-def get_wms():
-    global _wms
-    wms_url = ogc_server_settings.internal_ows + "?service=WMS&request=GetCapabilities&version=1.1.0"
+def _fetch_wms(wms_url):
     netloc = urlparse(wms_url).netloc
     http = httplib2.Http()
     http.add_credentials(_user, _password)
@@ -246,7 +249,46 @@ def get_wms():
             )
         )
     body = http.request(wms_url)[1]
-    _wms = WebMapService(wms_url, xml=body)
+    return WebMapService(wms_url, xml=body)
+
+
+_WMS_CAPABILITIES = "?service=WMS&request=GetCapabilities&version=1.1.0"
+
+
+def _refresh_wms():
+    global _wms, _wms_fetched, _wms_refreshing
+    try:
+        _wms = _fetch_wms(ogc_server_settings.internal_ows + _WMS_CAPABILITIES)
+        _wms_fetched = time.time()
+    finally:
+        _wms_refreshing = False
+
+
+def get_wms(layer=None):
+    """Returns the parsed WMS capabilities of the GeoServer.
+
+       The site wide document is kept for WMS_CAPABILITIES_TTL seconds, then
+       refreshed in the background while the stale one is still returned.
+       Given a layer typename, the small layer scoped capabilities document
+       (workspace/layer/wms) is fetched instead, always up to date.
+    """
+    global _wms_refreshing
+    if layer is not None and ':' in layer:
+        workspace, name = layer.split(':', 1)
+        # next to the internal ows endpoint
+        return _fetch_wms(urljoin(ogc_server_settings.internal_ows, '%s/%s/wms' % (workspace, name))
+                          + _WMS_CAPABILITIES)
+
+    if _wms is None:
+        _refresh_wms()
+    elif time.time() - _wms_fetched > getattr(settings, 'WMS_CAPABILITIES_TTL', 300):
+        with _wms_lock:
+            start = not _wms_refreshing
+            _wms_refreshing = True
+        if start:
+            refresh = Thread(target=_refresh_wms, name='geonode-wms-refresh')
+            refresh.daemon = True
+            refresh.start()
     return _wms
 
 
@@ -762,3 +804,32 @@ def json_response(body=None, errors=None, redirect_to=None, exception=None,
    if not isinstance(body, basestring):
        body = json.dumps(body)
    return HttpResponse(body, content_type=content_type, status=status)
+
+
+# Version keys tag cache entries so that they can be invalidated at once.
+# They are kept far longer than the entries they tag, and start from the
+# current time in microseconds: a key that expired anyway never comes back
+# with a version under which stale entries were cached.
+CACHE_VERSION_TIMEOUT = 365 * 24 * 3600
+
+
+def _new_cache_version():
+    return int(time.time() * 1000000)
+
+
+def get_cache_versions(keys):
+    """the current value of each version key, in order"""
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, _new_cache_version(), CACHE_VERSION_TIMEOUT)
+            versions[key] = cache.get(key) or _new_cache_version()
+    return [versions[key] for key in keys]
+
+
+def bump_cache_version(key):
+    """invalidate the entries cached under the version key"""
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_cache_version(), CACHE_VERSION_TIMEOUT)
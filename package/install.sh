@@ -121,6 +121,7 @@ function setup_django_every_time() {
 function setup_apache_once() {
 	chown www-data -R $GEONODE_WWW
 	a2enmod proxy_http
+	a2enmod expires
         
 	sed -i '1d' $APACHE_SITES/geonode
 	sed -i "1i WSGIDaemonProcess geonode user=www-data threads=15 processes=2" $APACHE_SITES/geonode
@@ -134,6 +135,7 @@ function setup_apache_every_time() {
 
 	#FIXME: This could be removed if setup_apache_every_time is called after setup_apache_once
 	a2enmod proxy_http
+	a2enmod expires
 
 	a2ensite geonode
 	$APACHE_SERVICE restart